@@ -0,0 +1,249 @@
+import argparse
+import datetime
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import myouji_kenchi
+
+from myouji_kenchi import kenchi
+from myouji_kenchi import romaji_index
+from myouji_kenchi import transducer
+
+
+ENGINES = ('fst', 'array')
+
+# Names a Japanese surname lexicon should reject, most of them at the prefilter
+FOREIGN_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+                 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor',
+                 'Moore', 'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez',
+                 'Clark', 'Ramirez', 'Lewis', 'Robinson', 'Walker', 'Young', 'Allen', 'King', 'Wright',
+                 'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores', 'Green', 'Adams', 'Nelson', 'Baker', 'Hall',
+                 'Rivera', 'Campbell', 'Mitchell', 'Carter', 'Roberts', 'Muller', 'Schmidt', 'Schneider']
+
+# Looked up after construction, to show what a lazily sharded lexicon defers to them
+COMMON_NAMES = ['Yamada', 'Sato', 'Suzuki', 'Takahashi', 'Tanaka', 'Watanabe', 'Ito', 'Nakamura', 'Kobayashi', 'Kato']
+GIVEN_NAMES = ['Taro', 'Hiroshi', 'Yoko', 'Kenji', 'Akira', 'Keiko', 'Takuya', 'Yuki', 'Naoki', 'Emi']
+
+LENGTH_BUCKETS = [(1, 4), (5, 8), (9, 12), (13, None)]
+AMBIGUITY_BUCKETS = [(1, 1), (2, 3), (4, None)]
+
+# Construction is timed in a fresh interpreter, so that import and peak memory are its own
+CONSTRUCTION_SCRIPT = '''
+import json, resource, sys, time
+start = time.perf_counter()
+import myouji_kenchi
+nbt = myouji_kenchi.MyoujiBackTransliteration(**json.loads(sys.argv[1]))
+seconds = time.perf_counter() - start
+max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+for name in json.loads(sys.argv[2]):
+    nbt.back_transliterate(name)
+print(json.dumps({'seconds': seconds,
+                  'max_rss_kb': max_rss_kb,
+                  'lookup_seconds': time.perf_counter() - start,
+                  'lookup_max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark construction, per-call latency and batch throughput')
+    parser.add_argument('output_path', help='where to write the results as JSON')
+    parser.add_argument('--compare', help='results JSON of an earlier run to print ratios against')
+    parser.add_argument('--quick', action='store_true', help='fewer samples and repeats, for a smoke test')
+    parser.add_argument('--include-compile', action='store_true',
+                        help='also time construction from the lexicon text rather than the compiled artifacts')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    samples = 200 if args.quick else 2000
+    repeats = 1 if args.quick else 5
+    inputs = sample_lexicon_romaji(samples, args.seed)
+
+    results = {}
+    for engine in ENGINES:
+        results['construction/{}'.format(engine)] = bench_construction({'engine': engine}, repeats)
+        for mode in ['lazy', 'all']:
+            results['construction/{}/shards-{}'.format(engine, mode)] = bench_construction(
+                {'engine': engine, 'lexicon_shards': mode}, repeats)
+    if args.include_compile:
+        results['construction/fst/compile'] = bench_construction({'precompiled': False}, 1)
+        results['construction/fst/compile/shards-lazy'] = bench_construction(
+            {'precompiled': False, 'lexicon_shards': 'lazy'}, 1)
+    for engine in ENGINES:
+        nbt = myouji_kenchi.MyoujiBackTransliteration(engine=engine)
+        for name, bucket in bucket_inputs(nbt, inputs).items():
+            results['back_transliterate/{}/{}'.format(engine, name)] = bench_latency(nbt.back_transliterate,
+                                                                                     bucket, repeats)
+        results['back_transliterate/{}/foreign'.format(engine)] = bench_latency(nbt.back_transliterate,
+                                                                                FOREIGN_NAMES, repeats)
+        unfiltered = myouji_kenchi.MyoujiBackTransliteration(engine=engine, prefilter=False)
+        results['back_transliterate/{}/foreign/unfiltered'.format(engine)] = bench_latency(
+            unfiltered.back_transliterate, FOREIGN_NAMES, repeats)
+        results['best_score/{}'.format(engine)] = bench_latency(nbt.best_score, inputs, repeats)
+
+    kenchi.configure()
+    kenchi.preload(background=False)
+    pairs = sample_pairs(inputs, args.seed)
+    names = [name for pair in pairs for name in pair]
+    results['get_score_as_myouji'] = bench_throughput(lambda: [kenchi.get_score_as_myouji(n) for n in names],
+                                                      len(names), repeats)
+    results['order_names'] = bench_throughput(lambda: [kenchi.order_names(p) for p in pairs], len(pairs), repeats)
+    results['score_many'] = bench_throughput(lambda: kenchi.score_many(names), len(names), repeats)
+    results['order_names_many'] = bench_throughput(lambda: kenchi.order_names_many(pairs), len(pairs), repeats)
+    full_names = sample_full_names(inputs, args.seed)
+    results['split_full_name'] = bench_latency(kenchi.split_full_name, full_names, repeats)
+    results['split_full_name/naive'] = bench_latency(naive_split_full_name, full_names, repeats)
+
+    report = {'metadata': run_metadata(args), 'results': results}
+    with open(args.output_path, mode='w') as output_file:
+        json.dump(report, output_file, indent=2, sort_keys=True)
+    print_results(results, load_results(args.compare) if args.compare else None)
+
+
+def sample_lexicon_romaji(size, seed):
+    """Romanizations of readings drawn from the lexicon in proportion to frequency,
+    as names in real data would be"""
+    rng = random.Random(seed)
+    entries = list(romaji_index.lexicon_entries(transducer.LEXICAL_FREQUENCY_FST_FILE))
+    readings = rng.choices([r for r, _ in entries], weights=[w for _, w in entries], k=size)
+    arrays = transducer._load_compiled_array_transducer()
+    if arrays is None:
+        # Missing or stale artifacts; compile the transducer as the package would
+        arrays = transducer.ArrayTransducer.from_fst(transducer.build_transducer())
+    romaji = []
+    for reading in readings:
+        forms = sorted(''.join(transducer.REVERSE_SYMBOL_TABLE[i] for i in inputs)
+                       for inputs in arrays.iter_inputs([transducer.SYMBOL_TABLE[c] for c in reading]))
+        romaji.append(rng.choice(forms).capitalize())
+    return romaji
+
+
+def sample_pairs(names, seed):
+    rng = random.Random(seed)
+    return [[a, b] for a, b in zip(names, rng.sample(names, len(names)))]
+
+
+def sample_full_names(surnames, seed):
+    """Surnames run together with a given name, before or after, as unsplit input arrives"""
+    rng = random.Random(seed)
+    names = []
+    for surname in surnames:
+        given = rng.choice(GIVEN_NAMES)
+        names.append((surname + given if rng.random() < 0.5 else given + surname).lower())
+    return names
+
+
+def naive_split_full_name(name):
+    """What split_full_name does in one walk, done by scoring every prefix and suffix"""
+    best_score, best = 0, [name]
+    for b in range(2, len(name) - 1):
+        for surname, given in [(name[:b], name[b:]), (name[b:], name[:b])]:
+            score = kenchi.get_score_as_myouji(surname)
+            if score > best_score:
+                best_score, best = score, [given, surname]
+    return best
+
+
+def bucket_inputs(nbt, inputs):
+    buckets = {}
+    for low, high in LENGTH_BUCKETS:
+        buckets['length_{}'.format(bucket_name(low, high))] = [r for r in inputs if in_bucket(len(r), low, high)]
+    readings = {r: len(nbt.back_transliterate(r)) for r in set(inputs)}
+    for low, high in AMBIGUITY_BUCKETS:
+        buckets['readings_{}'.format(bucket_name(low, high))] = [r for r in inputs if in_bucket(readings[r], low, high)]
+    return {name: bucket for name, bucket in buckets.items() if bucket}
+
+
+def bucket_name(low, high):
+    if high is None:
+        return '{}+'.format(low)
+    return str(low) if low == high else '{}-{}'.format(low, high)
+
+
+def in_bucket(value, low, high):
+    return low <= value and (high is None or value <= high)
+
+
+def bench_construction(options, repeats):
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', CONSTRUCTION_SCRIPT, json.dumps(options),
+                                 json.dumps(COMMON_NAMES)],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output))
+    seconds = [r['seconds'] for r in runs]
+    return {'unit': 's',
+            'median': statistics.median(seconds),
+            'min': min(seconds),
+            'max_rss_kb': max(r['max_rss_kb'] for r in runs),
+            'first_lookups_median': statistics.median(r['lookup_seconds'] for r in runs),
+            'first_lookups_max_rss_kb': max(r['lookup_max_rss_kb'] for r in runs),
+            'runs': len(runs)}
+
+
+def bench_latency(function, inputs, repeats):
+    """Per-call latency over inputs, taking each input's fastest of repeats calls"""
+    timings = []
+    for romaji in inputs:
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function(romaji)
+            best = min(best, time.perf_counter() - start)
+        timings.append(best * 1e6)
+    timings.sort()
+    return {'unit': 'us',
+            'median': statistics.median(timings),
+            'p90': timings[int(0.9 * (len(timings) - 1))],
+            'p99': timings[int(0.99 * (len(timings) - 1))],
+            'mean': statistics.fmean(timings),
+            'calls': len(timings)}
+
+
+def bench_throughput(function, items, repeats):
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return {'unit': 'items/s',
+            'median': items / statistics.median(seconds),
+            'max': items / min(seconds),
+            'items': items}
+
+
+def run_metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': args.quick,
+            'seed': args.seed}
+
+
+def load_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)['results']
+
+
+def print_results(results, baseline):
+    for name, result in sorted(results.items()):
+        line = '{:<50} {:>12.2f} {}'.format(name, result['median'], result['unit'])
+        if baseline is not None and name in baseline:
+            # Ratios above 1 are improvements, whichever way the unit runs
+            ratio = result['median'] / baseline[name]['median']
+            line += '  x{:.2f}'.format(ratio if result['unit'] == 'items/s' else 1 / ratio)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
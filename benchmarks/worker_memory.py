@@ -0,0 +1,81 @@
+import argparse
+import json
+import multiprocessing
+import statistics
+
+import myouji_kenchi
+
+from myouji_kenchi import transducer
+from myouji_kenchi.array_transducer import ArrayTransducer
+
+
+# Each worker loads its transducer this way, then looks up a few names so the pages it needs are touched
+MODES = {
+    'fst': lambda: myouji_kenchi.MyoujiBackTransliteration(engine='fst'),
+    'array-read': lambda: ArrayTransducer.load(transducer.COMPILED_ARRAY_TRANSDUCER_FILE, mmap=False),
+    'array-mmap': lambda: ArrayTransducer.load(transducer.COMPILED_ARRAY_TRANSDUCER_FILE, mmap=True),
+}
+
+NAMES = ['Yamada', 'Sato', 'Suzuki', 'Takahashi', 'Tanaka', 'Watanabe', 'Ito', 'Nakamura', 'Kobayashi', 'Kato']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-worker memory with the transducer read or mapped')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--output', help='where to write the results as JSON')
+    args = parser.parse_args()
+
+    results = {mode: measure(mode, args.workers) for mode in MODES}
+    for mode, result in results.items():
+        print('{:<12} per worker: RSS {:>7.1f} MiB (+{:.1f} loading), PSS {:>7.1f} MiB, private {:>7.1f} MiB'.format(
+            mode, result['rss_kib'] / 1024, result['rss_loading_kib'] / 1024,
+            result['pss_kib'] / 1024, result['private_kib'] / 1024))
+    if args.output:
+        with open(args.output, mode='w') as output_file:
+            json.dump({'workers': args.workers, 'results': results}, output_file, indent=2, sort_keys=True)
+
+
+def measure(mode, workers):
+    # Spawned, so no worker inherits pages from the parent; all stay alive at
+    # the barrier so shared pages are divided between them when measured
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    queue = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, barrier, queue)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    reports = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {key: statistics.mean(r[key] for r in reports) for key in reports[0]}
+
+
+def worker(mode, barrier, queue):
+    before = memory_kib()
+    loaded = MODES[mode]()
+    if isinstance(loaded, ArrayTransducer):
+        for name in NAMES:
+            list(loaded.iter_valid_strings(name.lower()))
+        # Touch every page, as a long-running worker eventually would
+        for name in ['offsets', 'ilabels', 'olabels', 'nextstates', 'finals', 'bounds']:
+            getattr(loaded, name).sum()
+    else:
+        for name in NAMES:
+            loaded.back_transliterate(name)
+    barrier.wait()
+    after = memory_kib()
+    barrier.wait()
+    queue.put({'rss_kib': after['Rss'],
+               'rss_loading_kib': after['Rss'] - before['Rss'],
+               'pss_kib': after['Pss'],
+               'private_kib': after['Private_Clean'] + after['Private_Dirty']})
+
+
+def memory_kib():
+    with open('/proc/self/smaps_rollup') as smaps:
+        fields = (line.split() for line in smaps if line.endswith('kB\n'))
+        return {f[0].rstrip(':'): int(f[1]) for f in fields}
+
+
+if __name__ == '__main__':
+    main()
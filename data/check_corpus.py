@@ -0,0 +1,35 @@
+import argparse
+import json
+import sys
+
+import myouji_kenchi
+
+from myouji_kenchi import transducer
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Check that an engine reproduces the expected results of a corpus from generate_corpus.py')
+    parser.add_argument('corpus_path')
+    parser.add_argument('--engine', choices=transducer.ENGINES, default='fst')
+    parser.add_argument('--max-mismatches', type=int, default=10, help='mismatches to print')
+    args = parser.parse_args()
+
+    nbt = myouji_kenchi.MyoujiBackTransliteration(engine=args.engine)
+    checked = mismatched = 0
+    with open(args.corpus_path, encoding='utf-8') as corpus_file:
+        for line in corpus_file:
+            record = json.loads(line)
+            expected = [tuple(r) for r in record['expected']]
+            actual = nbt.back_transliterate(record['romaji'])
+            checked += 1
+            if actual != expected:
+                mismatched += 1
+                if mismatched <= args.max_mismatches:
+                    print('{id}: {romaji!r}'.format(**record), expected, actual, sep='\n    ')
+    print('{} of {} records mismatched'.format(mismatched, checked))
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+import argparse
+import itertools
+import json
+import random
+import sys
+import unicodedata
+
+import myouji_kenchi
+
+from myouji_kenchi import romaji_index
+from myouji_kenchi import transducer
+
+
+# Common given names, which mostly should not score as surnames
+GIVEN_NAMES = ['Akira', 'Atsushi', 'Daisuke', 'Emi', 'Haruka', 'Hiroshi', 'Hiroko', 'Junichi', 'Kaori', 'Kazuki',
+               'Kenji', 'Keiko', 'Koji', 'Kumiko', 'Makoto', 'Masaki', 'Mayumi', 'Megumi', 'Minoru', 'Naoki',
+               'Naomi', 'Noriko', 'Osamu', 'Ryota', 'Sachiko', 'Satoshi', 'Shinichi', "Shin'ichi", 'Shota',
+               'Takashi', 'Takeshi', 'Tomoko', 'Tsuyoshi', 'Yoko', 'Yoshiko', 'Yuichi', 'Yuki', 'Yumiko',
+               'Yusuke', 'Yūta', 'Kōji', 'Shōta', 'Ryōko']
+
+FOREIGN_NAMES = ['Smith', 'Johnson', 'Brown', 'Garcia', 'Miller', 'Davis', 'Martinez', 'Wilson', 'Anderson',
+                 'Thomas', 'Taylor', 'Moore', 'Jackson', 'White', 'Harris', 'Clark', 'Lewis', 'Walker',
+                 'Kim', 'Park', 'Nguyen', 'Wang', 'Li', 'Zhang', 'Chen', 'Singh', 'Kumar', 'Muller',
+                 'Schmidt', 'Rossi', 'Dubois', 'Silva', 'Santos', 'Ivanov', 'Novak', 'Hansen', 'Duckscallion']
+
+NOISE_ALPHABET = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-\'. @_'
+
+KINDS = ('surname', 'given', 'foreign', 'noise')
+
+# Readings drawn in a row without a romanization before giving up
+MAX_REDRAWS = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write a seeded corpus of romanized names, with the readings and scores expected of them, as JSONL')
+    parser.add_argument('size', type=int, help='number of names to write')
+    parser.add_argument('--lexicon',
+                        help='myouji_frequency_count.json, or a text format lexical acceptor; by default the '
+                             'acceptor shipped with the package')
+    parser.add_argument('--output', default='-', help='file to write; - (the default) for stdout')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--given-fraction', type=float, default=0.2)
+    parser.add_argument('--foreign-fraction', type=float, default=0.1)
+    parser.add_argument('--noise-fraction', type=float, default=0.02)
+    parser.add_argument('--engine', choices=transducer.ENGINES, default='fst',
+                        help='engine whose results are recorded as expected, for the shipped lexicon')
+    args = parser.parse_args()
+
+    surname_fraction = 1 - args.given_fraction - args.foreign_fraction - args.noise_fraction
+    if surname_fraction < 0:
+        parser.error('the given, foreign and noise fractions must sum to at most 1')
+
+    readings, weights = zip(*load_lexicon(args.lexicon))
+    try:
+        arrays = load_transducer(args.lexicon, readings, weights)
+    except ValueError as e:
+        parser.error('cannot use lexicon {}: {}'.format(args.lexicon, e))
+    generator = CorpusGenerator(readings, weights, args.seed,
+                                kind_weights=[surname_fraction, args.given_fraction,
+                                              args.foreign_fraction, args.noise_fraction],
+                                arrays=arrays)
+    if args.lexicon is None:
+        back_transliterate = myouji_kenchi.MyoujiBackTransliteration(engine=args.engine).back_transliterate
+    else:
+        # The engines only load the shipped lexicon, so the expected results
+        # of another come from the transducer composed from it
+        def back_transliterate(romaji):
+            return expected_results(arrays, romaji)
+    output_file = sys.stdout if args.output == '-' else open(args.output, mode='w', encoding='utf-8')
+    try:
+        for i, record in enumerate(itertools.islice(generator, args.size)):
+            record['id'] = i
+            record['expected'] = back_transliterate(record['romaji'])
+            output_file.write(json.dumps(record, ensure_ascii=False, sort_keys=True) + '\n')
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+
+
+def load_lexicon(path):
+    if path is not None and path.endswith('.json'):
+        with open(path) as lexicon_file:
+            return sorted(json.load(lexicon_file).items())
+    return sorted(romaji_index.lexicon_entries(path or transducer.LEXICAL_FREQUENCY_FST_FILE))
+
+
+def load_transducer(path, readings, weights):
+    """The array form of the transliterator composed with the lexicon at path,
+    or with the shipped lexicon if path is None
+
+    :raises ValueError: if a reading has a character outside the symbol table
+    """
+    if path is None:
+        arrays = transducer._load_compiled_array_transducer()
+        return arrays if arrays is not None else transducer.ArrayTransducer.from_fst(transducer.build_transducer())
+    if not path.endswith('.json'):
+        return transducer.ArrayTransducer.from_fst(transducer.build_transducer(path))
+    acceptor = transducer.acceptor_for_strings(list(readings), list(weights))
+    acceptor.arcsort('ilabel')
+    return transducer.ArrayTransducer.from_fst(transducer._compose_lexicon(transducer._build_transliterator(), acceptor))
+
+
+def expected_results(arrays, romaji):
+    """What back_transliterate would return for romaji over the transducer arrays"""
+    try:
+        results = transducer._deintern_results(arrays.iter_valid_strings(transducer.normalize(romaji)))
+        return sorted(((reading, float(score)) for reading, score in results), key=lambda x: (x[1], x[0]))
+    except ValueError:
+        return []
+
+
+class CorpusGenerator():
+    """An endless, seeded stream of name records
+
+    Surnames are lexicon readings drawn in proportion to frequency, written in
+    one of the romanizations the transducer accepts for them (found by running
+    it in reverse), then varied in case, width and macron composition.
+
+    :param arrays: the array form of the transducer composed with the lexicon
+        the readings are from, as load_transducer gives it
+    """
+
+    def __init__(self, readings, weights, seed, kind_weights, arrays):
+        self._rng = random.Random(seed)
+        self._readings = readings
+        self._cum_weights = list(itertools.accumulate(weights))
+        self._kind_weights = list(itertools.accumulate(kind_weights))
+        self._arrays = arrays
+        self._romanizations = {}
+
+    def __iter__(self):
+        while True:
+            kind = self._rng.choices(KINDS, cum_weights=self._kind_weights)[0]
+            if kind == 'surname':
+                yield self._surname()
+            elif kind == 'given':
+                romaji, variants = self._vary(self._rng.choice(GIVEN_NAMES))
+                yield {'kind': kind, 'romaji': romaji, 'reading': None, 'variants': variants}
+            elif kind == 'foreign':
+                romaji, variants = self._vary(self._rng.choice(FOREIGN_NAMES))
+                yield {'kind': kind, 'romaji': romaji, 'reading': None, 'variants': variants}
+            else:
+                length = self._rng.randint(1, 12)
+                romaji = ''.join(self._rng.choice(NOISE_ALPHABET) for _ in range(length))
+                yield {'kind': kind, 'romaji': romaji, 'reading': None, 'variants': []}
+
+    def _surname(self):
+        # Some readings have no romanization the transducer accepts; draw again
+        for _ in range(MAX_REDRAWS):
+            reading = self._rng.choices(self._readings, cum_weights=self._cum_weights)[0]
+            forms = self._romanizations_of(reading)
+            if forms:
+                break
+        else:
+            raise ValueError('None of {} readings drawn from the lexicon has a romanization '
+                             'the transducer accepts'.format(MAX_REDRAWS))
+        romaji, variants = self._vary(self._rng.choice(forms))
+        return {'kind': 'surname', 'romaji': romaji, 'reading': reading, 'variants': variants}
+
+    def _romanizations_of(self, reading):
+        forms = self._romanizations.get(reading)
+        if forms is None:
+            labels = [transducer.SYMBOL_TABLE.get(c) for c in reading]
+            forms = [] if None in labels else sorted(''.join(transducer.REVERSE_SYMBOL_TABLE[i] for i in inputs)
+                                                     for inputs in self._arrays.iter_inputs(labels))
+            self._romanizations[reading] = forms
+        return forms
+
+    def _vary(self, romaji):
+        variants = []
+        if unicodedata.normalize('NFD', romaji) != romaji or unicodedata.normalize('NFC', romaji) != romaji:
+            if self._rng.random() < 0.5:
+                romaji = unicodedata.normalize('NFC', romaji)
+                variants.append('composed')
+            else:
+                romaji = unicodedata.normalize('NFD', romaji)
+                variants.append('decomposed')
+        case = self._rng.choices(['title', 'upper', 'lower'], weights=[0.8, 0.15, 0.05])[0]
+        romaji = romaji.upper() if case == 'upper' else romaji.lower() if case == 'lower' else romaji.capitalize()
+        variants.append(case)
+        if self._rng.random() < 0.02:
+            romaji = to_fullwidth(romaji)
+            variants.append('fullwidth')
+        return romaji, variants
+
+
+def to_fullwidth(string):
+    return ''.join(chr(ord(c) + 0xFEE0) if '!' <= c <= '~' else c for c in string)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,57 @@
 import argparse
 import json
-import myouji_kenchi
+import sys
+
+from myouji_kenchi import transducer
+from myouji_kenchi.lexicon_builder import LexiconBuilder, write_text
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('input_json')
     parser.add_argument('output_path')
+    parser.add_argument('--binary', action='store_true',
+                        help='write the acceptor in the array file format rather than as OpenFst text')
+    parser.add_argument('--compiled-output-path',
+                        help='also write the composed transducer as a binary artifact here')
+    parser.add_argument('--array-output-path',
+                        help='also write the composed transducer for the array engine here')
+    parser.add_argument('--filter-output-path',
+                        help='also write the input prefilter derived from the composed transducer here')
+    parser.add_argument('--manifest-output-path',
+                        help='where to write the manifest for the compiled artifact')
+    parser.add_argument('--shards-output-dir',
+                        help='also write the acceptor split by first katakana into this directory')
     args = parser.parse_args()
+    # The package checks compiled artifacts against the hash of the shipped
+    # OpenFst text lexicon, so those built from an array file are always stale
+    if args.binary and (args.compiled_output_path or args.shards_output_dir):
+        parser.error('--binary cannot be used with --compiled-output-path or --shards-output-dir')
+
+    with open(args.input_json) as input_file:
+        frequency_data = json.load(input_file)
+    builder = LexiconBuilder()
+    for string, weight in sorted(frequency_data.items()):
+        builder.add(string, weight)
+    acceptor = builder.finish()
+    if args.binary:
+        acceptor.save(args.output_path)
+    else:
+        write_text(acceptor, args.output_path)
+    stats = builder.stats()
+    print('Built {} strings into {} states and {} arcs in {:.2f}s'.format(
+        stats.strings, stats.states, stats.arcs, stats.seconds), file=sys.stderr)
 
-    frequency_data = json.load(open(args.input_json))
-    strings, weights = zip(*frequency_data.items())
-    acceptor = myouji_kenchi.transducer.acceptor_for_strings(strings, weights)
-    #acceptor.write(args.output_path)
-    open(args.output_path, mode='wb').write(acceptor.__str__())
+    if args.compiled_output_path:
+        if not args.manifest_output_path:
+            parser.error('--manifest-output-path is required with --compiled-output-path')
+        transducer.write_compiled_transducer(args.compiled_output_path,
+                                             args.manifest_output_path,
+                                             args.output_path,
+                                             args.array_output_path,
+                                             args.filter_output_path)
+    if args.shards_output_dir:
+        transducer.write_lexicon_shards(args.shards_output_dir, args.output_path)
 
 
 if __name__ == '__main__':
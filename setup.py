@@ -15,8 +15,17 @@ setup(name='myouji_kenchi',
       long_description_content_type='text/markdown',
       package_dir={'': 'src'},
       packages=find_packages('src'),
-      package_data={'myouji_kenchi': ['data/lexical_data_fst.txt']},
+      package_data={'myouji_kenchi': ['data/lexical_data_fst.txt',
+                                      'data/composed_transducer.fst',
+                                      'data/composed_transducer.bin',
+                                      'data/composed_transducer.json',
+                                      'data/input_filter.json',
+                                      'data/lexicon_shards/*']},
       include_package_data=True,
+      python_requires='>=3.9',
+      entry_points={
+          'console_scripts': ['myouji-kenchi = myouji_kenchi.cli:main'],
+      },
       install_requires=[
           'numpy',
           'openfst>=1.6.6<1.6.7',
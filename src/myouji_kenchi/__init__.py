@@ -1,4 +1,40 @@
-from myouji_kenchi.transducer import MyoujiBackTransliteration
-from myouji_kenchi.kenchi import order_names, get_score_as_myouji
+import importlib
 
-__all__ = ['MyoujiBackTransliteration', 'order_names', 'get_score_as_myouji']
+# Attributes are imported from their modules on first use, so that importing
+# the package does not load OpenFst, NumPy or the lexicon
+_EXPORTS = {'MyoujiBackTransliteration': 'transducer',
+            'LookupLimits': 'limits',
+            'order_names': 'kenchi',
+            'order_names_many': 'kenchi',
+            'split_full_name': 'kenchi',
+            'get_score_as_myouji': 'kenchi',
+            'score_many': 'kenchi',
+            'configure': 'kenchi',
+            'cache_stats': 'kenchi',
+            'index_stats': 'kenchi',
+            'limit_stats': 'kenchi',
+            'shard_stats': 'kenchi',
+            'scoring_pool': 'kenchi',
+            'preload': 'kenchi',
+            'is_ready': 'kenchi'}
+
+# Submodules that importing the package used to load, and that callers may
+# still reach as attributes
+_SUBMODULES = {'kenchi', 'transducer'}
+
+__all__ = ['MyoujiBackTransliteration', 'LookupLimits', 'order_names', 'order_names_many', 'split_full_name',
+           'get_score_as_myouji', 'score_many', 'configure', 'cache_stats', 'index_stats', 'limit_stats', 'shard_stats', 'scoring_pool', 'preload', 'is_ready']
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name not in _EXPORTS:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,5 @@
+from myouji_kenchi.cli import main
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import weakref
+
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from . import kenchi
+from .lazy import LazyModule
+from .transducer import normalize
+
+
+futures = LazyModule('concurrent.futures')
+
+# Shared by the default scorers of all event loops, so scoring never runs on
+# more threads than this however many loops there are
+_DEFAULT_EXECUTOR = None
+_DEFAULT_EXECUTOR_LOCK = threading.Lock()
+_DEFAULT_SCORERS = weakref.WeakKeyDictionary()
+
+
+class AsyncStats(NamedTuple):
+    requests: int
+    coalesced: int
+    batches: int
+    names_scored: int
+    largest_batch: int
+    queue_depth: int
+    in_flight: int
+
+
+class AsyncScorer():
+    """Scores names for asyncio code without blocking the event loop
+
+    Scoring runs in an executor, by the module-level transliterator (see
+    kenchi.configure). Concurrent requests for names that normalize alike share
+    one computation, and names requested within batch_window of each other are
+    scored in one call to kenchi.score_many. While every batch the executor is
+    allowed is running, names wait and go in the next batch, so batches grow
+    under load rather than the executor's queue.
+
+    A scorer belongs to the event loop it is first used in.
+
+    :param executor: where to score; by default a pool of one thread. A
+        kenchi.scoring_pool can be used to score in other processes
+    :param max_batches: most batches scoring at once; with an executor of
+        several workers, as many as it has keeps them all busy
+    :param batch_window: seconds to wait for more names before starting a batch
+    :param max_batch_size: most names in a batch; a full batch starts at once
+    """
+
+    def __init__(self,
+                 executor: Optional['futures.Executor'] = None,
+                 max_batches: int = 1,
+                 batch_window: float = 0.001,
+                 max_batch_size: int = 256):
+        if batch_window < 0:
+            raise ValueError('batch_window must not be negative')
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be positive')
+        if max_batches < 1:
+            raise ValueError('max_batches must be positive')
+        self._executor = executor
+        self._max_batches = max_batches
+        self._batch_window = batch_window
+        self._max_batch_size = max_batch_size
+        self._loop = None
+        # Futures of names waiting for or being scored, by normalized name
+        self._futures = {}
+        # Names waiting for a batch, by normalized name, in the order requested
+        self._waiting = {}
+        self._timer = None
+        self._running = 0
+        self._requests = 0
+        self._coalesced = 0
+        self._batches = 0
+        self._names_scored = 0
+        self._largest_batch = 0
+
+    async def get_score_as_myouji(self, name: str) -> float:
+        """As kenchi.get_score_as_myouji"""
+        self._check_loop()
+        self._requests += 1
+        key = normalize(name)
+        future = self._futures.get(key)
+        if future is None:
+            future = self._futures[key] = self._loop.create_future()
+            self._waiting[key] = name
+            self._schedule()
+        else:
+            self._coalesced += 1
+        # Shielded, as a caller giving up must not cancel the score for others awaiting it
+        return await asyncio.shield(future)
+
+    async def order_names(self, names: List[str], prior=0.5) -> List[str]:
+        """As kenchi.order_names"""
+        kenchi.check_prior(prior)
+        ordered = kenchi.order_by_heuristics(names)
+        if ordered is not None:
+            return ordered
+        scores = await asyncio.gather(*(self.get_score_as_myouji(name) for name in names))
+        return kenchi.order_scored(names, scores, prior)
+
+    def stats(self) -> AsyncStats:
+        """Requests, how many shared an in-flight computation, the batches
+        scored and their sizes, and the names now waiting for a batch
+        (queue_depth) or waiting or being scored (in_flight)"""
+        return AsyncStats(self._requests, self._coalesced, self._batches, self._names_scored,
+                          self._largest_batch, len(self._waiting), len(self._futures))
+
+    def _check_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+        elif self._loop is not loop:
+            raise RuntimeError('AsyncScorer is bound to a different event loop')
+
+    def _schedule(self):
+        if len(self._waiting) >= self._max_batch_size:
+            self._start_batches()
+        elif self._timer is None:
+            self._timer = self._loop.call_later(self._batch_window, self._window_closed)
+
+    def _window_closed(self):
+        self._timer = None
+        self._start_batches()
+
+    def _start_batches(self):
+        while self._waiting and self._running < self._max_batches:
+            keys = list(self._waiting)[:self._max_batch_size]
+            names = [self._waiting.pop(key) for key in keys]
+            self._running += 1
+            self._batches += 1
+            self._names_scored += len(names)
+            self._largest_batch = max(self._largest_batch, len(names))
+            batch = self._loop.run_in_executor(self._executor or _default_executor(), kenchi.score_many, names)
+            batch.add_done_callback(lambda done, keys=keys: self._finish_batch(keys, done))
+        if not self._waiting and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _finish_batch(self, keys, batch):
+        self._running -= 1
+        waiters = [self._futures.pop(key) for key in keys]
+        if batch.cancelled():
+            for future in waiters:
+                future.cancel()
+        elif batch.exception() is not None:
+            for future in waiters:
+                future.set_exception(batch.exception())
+        else:
+            for future, score in zip(waiters, batch.result()):
+                future.set_result(score)
+        # Names that waited behind running batches go now, without waiting out a window
+        self._start_batches()
+
+
+async def get_score_as_myouji(name: str) -> float:
+    """As kenchi.get_score_as_myouji, by the running event loop's default AsyncScorer"""
+    return await _default_scorer().get_score_as_myouji(name)
+
+
+async def order_names(names: List[str], prior=0.5) -> List[str]:
+    """As kenchi.order_names, by the running event loop's default AsyncScorer"""
+    return await _default_scorer().order_names(names, prior)
+
+
+def stats() -> AsyncStats:
+    """Stats of the running event loop's default AsyncScorer"""
+    return _default_scorer().stats()
+
+
+def _default_scorer():
+    loop = asyncio.get_running_loop()
+    scorer = _DEFAULT_SCORERS.get(loop)
+    if scorer is None:
+        scorer = _DEFAULT_SCORERS[loop] = AsyncScorer()
+    return scorer
+
+
+def _default_executor():
+    global _DEFAULT_EXECUTOR
+    with _DEFAULT_EXECUTOR_LOCK:
+        if _DEFAULT_EXECUTOR is None:
+            _DEFAULT_EXECUTOR = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='myouji-kenchi-aio')
+        return _DEFAULT_EXECUTOR
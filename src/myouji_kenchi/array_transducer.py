@@ -0,0 +1,382 @@
+import heapq
+import json
+import struct
+
+from bisect import bisect_left
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from .lazy import LazyModule
+from .search import INFINITY, best_emissions, max_reachable_weights
+from .symbol_table import SYMBOL_TABLE
+
+
+np = LazyModule('numpy')
+
+ARRAY_FILE_MAGIC = b'MKARRAYS'
+ARRAY_FIELDS = ('offsets', 'ilabels', 'olabels', 'nextstates', 'finals', 'bounds')
+# Arrays in a saved file start at multiples of this, so mapped views are aligned
+ARRAY_ALIGNMENT = 64
+
+
+class ArrayTransducer():
+    """A read-only transducer held in flat arrays, looked up without OpenFst
+
+    Arcs are stored per state in compressed sparse row layout: the arcs leaving
+    state s are those at indices offsets[s] to offsets[s + 1], sorted on their
+    input labels. Weights only sit on final states, as in the lexical acceptor.
+    bounds holds the greatest final weight reachable from each state.
+    """
+
+    def __init__(self, start: int, offsets, ilabels, olabels, nextstates, finals, bounds):
+        self.start = start
+        self.offsets = offsets
+        self.ilabels = ilabels
+        self.olabels = olabels
+        self.nextstates = nextstates
+        self.finals = finals
+        self.bounds = bounds
+        # Indexing memoryviews yields plain Python numbers, which is much
+        # cheaper in the lookup loop than indexing the arrays themselves
+        self._offsets = memoryview(offsets)
+        self._ilabels = memoryview(ilabels)
+        self._olabels = memoryview(olabels)
+        self._nextstates = memoryview(nextstates)
+        self._finals = memoryview(finals)
+        self._bounds = memoryview(bounds)
+
+    @classmethod
+    def from_fst(cls, td) -> 'ArrayTransducer':
+        """Flatten an acyclic OpenFst transducer whose arc weights are all One
+
+        :param td: transducer to flatten
+        :raises ValueError: if the transducer has a cycle
+        """
+        num_states = td.num_states()
+        offsets = np.zeros(num_states + 1, dtype=np.int32)
+        finals = np.empty(num_states, dtype=np.float32)
+        arcs = []
+        for state in td.states():
+            state_arcs = sorted((a.ilabel, a.olabel, a.nextstate) for a in td.arcs(state))
+            arcs += state_arcs
+            offsets[state + 1] = offsets[state] + len(state_arcs)
+            finals[state] = float(td.final(state))
+        ilabels, olabels, nextstates = zip(*arcs) if arcs else ((), (), ())
+        bounds = max_reachable_weights(num_states,
+                                       lambda s: nextstates[offsets[s]:offsets[s + 1]],
+                                       lambda s: finals[s])
+        return cls(td.start(),
+                   offsets,
+                   np.array(ilabels, dtype=np.uint8),
+                   np.array(olabels, dtype=np.uint8),
+                   np.array(nextstates, dtype=np.int32),
+                   finals,
+                   np.array(bounds, dtype=np.float32))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'ArrayTransducer':
+        """Read a transducer written by save
+
+        :param path: the file to read
+        :param mmap: map the file read-only rather than reading it into memory,
+            so that every process on a host using it shares one copy in the page cache
+        :raises ValueError: if the file is not in the expected format
+        """
+        with open(path, mode='rb') as array_file:
+            if array_file.read(len(ARRAY_FILE_MAGIC)) != ARRAY_FILE_MAGIC:
+                raise ValueError('{} is not an array transducer file'.format(path))
+            length_bytes = array_file.read(8)
+            if len(length_bytes) != 8:
+                raise ValueError('{} is truncated'.format(path))
+            header_length, = struct.unpack('<Q', length_bytes)
+            header = json.loads(array_file.read(header_length).decode('ascii'))
+        data = np.memmap(path, dtype=np.uint8, mode='r') if mmap else np.fromfile(path, dtype=np.uint8)
+        data_start = _aligned(len(ARRAY_FILE_MAGIC) + 8 + header_length)
+        arrays = {}
+        for name in ARRAY_FIELDS:
+            dtype = np.dtype(header['arrays'][name]['dtype'])
+            start = data_start + header['arrays'][name]['offset']
+            arrays[name] = data[start:start + header['arrays'][name]['length'] * dtype.itemsize].view(dtype)
+        return cls(header['start'], **arrays)
+
+    def save(self, path: str):
+        """Write the arrays to one file, each aligned so that load can map them in place
+
+        The layout is a magic number, the length of a JSON header, the header
+        (giving the start state and each array's dtype, offset and length),
+        then the arrays.
+        """
+        arrays = {name: np.ascontiguousarray(getattr(self, name)) for name in ARRAY_FIELDS}
+        header = {'start': int(self.start), 'arrays': {}}
+        offset = 0
+        for name, array in arrays.items():
+            offset = _aligned(offset)
+            header['arrays'][name] = {'dtype': array.dtype.str, 'offset': offset, 'length': len(array)}
+            offset += array.nbytes
+        header_bytes = json.dumps(header, sort_keys=True).encode('ascii')
+        data_start = _aligned(len(ARRAY_FILE_MAGIC) + 8 + len(header_bytes))
+        with open(path, mode='wb') as array_file:
+            array_file.write(ARRAY_FILE_MAGIC + struct.pack('<Q', len(header_bytes)) + header_bytes)
+            for name, array in arrays.items():
+                array_file.write(b'\0' * (data_start + header['arrays'][name]['offset'] - array_file.tell()))
+                array_file.write(array.tobytes())
+
+    def iter_valid_strings(self, string: str, guard=None, trace=None) -> Iterator[Tuple[Tuple[int, ...], float]]:
+        """Run a string through the transducer, lazily yielding each output once
+
+        The equivalent of composing a single string acceptor with the
+        transducer and enumerating the emission language of the result.
+
+        :param string: normalized romaji
+        :param guard: if given, a LookupGuard to check the walk and the outputs against
+        :param trace: if given, a LookupTrace to record the paths walked on and mark the walk stage of
+        :returns: an iterator of (interned emission symbols, weight) tuples
+        """
+        frontier = self._walk(string, guard=guard)
+        if trace is not None:
+            trace.paths = len(frontier)
+            trace.mark('walk')
+        return self._iter_finals(frontier, guard)
+
+    def best_valid_strings(self,
+                           string: str,
+                           k: Optional[int] = None,
+                           min_score: Optional[float] = None,
+                           guard=None,
+                           trace=None) -> List[Tuple[Tuple[int, ...], float]]:
+        """Like iter_valid_strings, but only the k best outputs and/or those
+        scoring at least min_score
+
+        Paths that cannot reach a final state scoring min_score are dropped
+        as soon as they are entered. Given k, paths are followed depth first,
+        best bound first, and those that cannot reach a final state scoring
+        at least the k-th best output found so far are dropped too. Outputs
+        tied with the k-th best are also returned.
+
+        :param string: normalized romaji
+        :param k: number of outputs wanted
+        :param min_score: lowest score wanted
+        :param guard: as for iter_valid_strings
+        :param trace: as for iter_valid_strings
+        :returns: a list of (interned emission symbols, weight) tuples
+        """
+        if k is not None:
+            return self._best_k(string, k, min_score, guard, trace)
+        frontier = self._walk(string, min_score, guard)
+        if trace is not None:
+            trace.paths = len(frontier)
+            trace.mark('walk')
+        return best_emissions(self._iter_finals(frontier, guard), k, min_score)
+
+    def iter_spans(self,
+                   string: str,
+                   spans: Iterable[Tuple[int, int]],
+                   guard=None) -> Iterator[Tuple[Tuple[int, int], Tuple[int, ...], float]]:
+        """Run several substrings of a string through the transducer in one walk over it
+
+        The equivalent of composing the string with a transducer that skips
+        input up to each span's start and after its end. A walk is begun at
+        each start, and outputs collected at each end, as the string is read.
+
+        :param string: normalized romaji
+        :param spans: (start, end) positions of the substrings
+        :param guard: if given, a LookupGuard to check the walks against
+        :returns: an iterator of (span, interned emission symbols, weight) tuples,
+            each output once per span
+        """
+        # Characters outside the symbol table end the walks that reach them,
+        # rather than the whole lookup, as they need not be in every span
+        labels = [SYMBOL_TABLE.get(c, -1) for c in string]
+        if self.start < 0:
+            return
+        ends_by_start = {}
+        for start, end in spans:
+            if 0 <= start < end <= len(labels):
+                ends_by_start.setdefault(start, set()).add(end)
+        frontiers = {}
+        for position in range(len(labels) + 1):
+            for start, frontier in frontiers.items():
+                if position in ends_by_start[start]:
+                    for output, weight in self._iter_finals(frontier):
+                        yield (start, position), output, weight
+            if position == len(labels):
+                break
+            if position in ends_by_start:
+                frontiers[position] = self._epsilon_closure([(self.start, None)])
+            # Walks that have passed their last end, or died, are dropped
+            frontiers = {start: self._epsilon_closure(self._step(frontier, labels[position]))
+                         for start, frontier in frontiers.items() if position < max(ends_by_start[start])}
+            frontiers = {start: frontier for start, frontier in frontiers.items() if frontier}
+            if guard is not None:
+                guard.check_states(sum(len(frontier) for frontier in frontiers.values()))
+
+    def iter_inputs(self, output: Sequence[int]) -> Iterator[Tuple[int, ...]]:
+        """Run the transducer in reverse, lazily yielding every input with this output
+
+        :param output: interned emission symbols
+        :returns: an iterator of interned input symbols, with epsilons dropped
+        """
+        if self.start < 0:
+            return
+        offsets, ilabels, olabels, nextstates = self._offsets, self._ilabels, self._olabels, self._nextstates
+        finals = self._finals
+        length = len(output)
+        stack = [(self.start, 0, None)]
+        while stack:
+            state, position, inputs = stack.pop()
+            if position == length and finals[state] != INFINITY:
+                yield _unwind_output(inputs)
+            for i in range(offsets[state], offsets[state + 1]):
+                olabel = olabels[i]
+                if olabel == 0:
+                    nxt_position = position
+                elif position < length and olabel == output[position]:
+                    nxt_position = position + 1
+                else:
+                    continue
+                ilabel = ilabels[i]
+                stack.append((nextstates[i], nxt_position, (ilabel, inputs) if ilabel else inputs))
+
+    def _best_k(self, string, k, min_score, guard, trace):
+        found = {}
+        # Weights of the k best outputs found, the k-th best on top
+        best = []
+        floor = [min_score if min_score is not None else -INFINITY]
+        paths = self._descend(_input_labels(string), floor, guard)
+        for output, weight in paths if guard is None else guard.count_paths(paths):
+            if output in found:
+                continue
+            found[output] = weight
+            if len(best) < k:
+                heapq.heappush(best, weight)
+            elif weight > best[0]:
+                heapq.heapreplace(best, weight)
+            if len(best) == k:
+                floor[0] = max(floor[0], best[0])
+        if trace is not None:
+            trace.paths = len(found)
+            trace.mark('walk')
+        return best_emissions(found.items(), k, min_score)
+
+    def _descend(self, labels, floor, guard=None):
+        # Yields each complete path's output and final weight. Paths whose
+        # bound is under floor[0], which the caller raises as outputs are
+        # found, are dropped; below it only ties can survive
+        if self.start < 0:
+            return
+        offsets, ilabels, olabels, nextstates = self._offsets, self._ilabels, self._olabels, self._nextstates
+        finals, bounds = self._finals, self._bounds
+        length = len(labels)
+        stack = [(self.start, 0, None)]
+        while stack:
+            state, position, output = stack.pop()
+            if bounds[state] < floor[0]:
+                continue
+            if position == length and finals[state] != INFINITY:
+                yield _unwind_output(output), finals[state]
+            # Input epsilon arcs sort first, then those reading the next label
+            children = []
+            i, end = offsets[state], offsets[state + 1]
+            while i < end and ilabels[i] == 0:
+                olabel = olabels[i]
+                children.append((nextstates[i], position, (olabel, output) if olabel else output))
+                i += 1
+            if position < length:
+                label = labels[position]
+                i = bisect_left(ilabels, label, i, end)
+                while i < end and ilabels[i] == label:
+                    olabel = olabels[i]
+                    children.append((nextstates[i], position + 1, (olabel, output) if olabel else output))
+                    i += 1
+            # The child with the best bound is taken next, to raise the floor early
+            children.sort(key=lambda child: bounds[child[0]])
+            stack += children
+            if guard is not None:
+                guard.check_states(len(stack))
+
+    def _walk(self, string, min_score=None, guard=None):
+        # Outputs are (label, parent) linked lists so paths share their prefixes
+        labels = _input_labels(string)
+        if self.start < 0:
+            return []
+        bounds = self._bounds
+        frontier = self._epsilon_closure([(self.start, None)])
+        for label in labels:
+            frontier = self._epsilon_closure(self._step(frontier, label))
+            if min_score is not None:
+                frontier = [(state, output) for state, output in frontier if bounds[state] >= min_score]
+            if guard is not None:
+                guard.check_states(len(frontier))
+            if not frontier:
+                return []
+        return frontier
+
+    def _iter_finals(self, frontier, guard=None):
+        finals = self._finals
+        seen = set()
+        for state, output in frontier if guard is None else guard.count_paths(frontier):
+            final_weight = finals[state]
+            if final_weight == INFINITY:
+                continue
+            output = _unwind_output(output)
+            if output not in seen:
+                seen.add(output)
+                yield output, final_weight
+
+    def _step(self, frontier, label):
+        offsets, ilabels, olabels, nextstates = self._offsets, self._ilabels, self._olabels, self._nextstates
+        result = []
+        for state, output in frontier:
+            end = offsets[state + 1]
+            i = bisect_left(ilabels, label, offsets[state], end)
+            while i < end and ilabels[i] == label:
+                olabel = olabels[i]
+                result.append((nextstates[i], (olabel, output) if olabel else output))
+                i += 1
+        return result
+
+    def _epsilon_closure(self, frontier):
+        # Input epsilon arcs sort first; the transducer is acyclic, so
+        # following them always terminates
+        offsets, ilabels, olabels, nextstates = self._offsets, self._ilabels, self._olabels, self._nextstates
+        result = []
+        stack = list(reversed(frontier))
+        while stack:
+            state, output = stack.pop()
+            result.append((state, output))
+            i, end = offsets[state], offsets[state + 1]
+            while i < end and ilabels[i] == 0:
+                olabel = olabels[i]
+                stack.append((nextstates[i], (olabel, output) if olabel else output))
+                i += 1
+        return result
+
+
+def _input_labels(string):
+    try:
+        return [SYMBOL_TABLE[c] for c in string]
+    except KeyError as e:
+        raise ValueError('Character {} not in input symbol table'.format(e.args[0]))
+
+
+def _unwind_output(output):
+    labels = []
+    while output is not None:
+        labels.append(output[0])
+        output = output[1]
+    labels.reverse()
+    return tuple(labels)
+
+
+def is_array_file(path: str) -> bool:
+    """Whether a file was written by ArrayTransducer.save, judging by its magic number"""
+    with open(path, mode='rb') as array_file:
+        return array_file.read(len(ARRAY_FILE_MAGIC)) == ARRAY_FILE_MAGIC
+
+
+def _aligned(offset):
+    return -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
@@ -0,0 +1,197 @@
+import contextlib
+import json
+import os
+import threading
+
+from collections import OrderedDict
+from typing import Hashable
+from typing import Iterable
+from typing import NamedTuple
+
+from .lazy import LazyModule
+
+
+sqlite3 = LazyModule('sqlite3')
+
+# Most keys looked up by one query, below SQLite's limit on parameters
+BATCH_QUERY_SIZE = 500
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    maxsize: int
+
+
+class LRUCache():
+    """A thread-safe, size-bounded mapping that evicts the least recently used entry"""
+
+    _MISSING = object()
+
+    def __init__(self, maxsize: int):
+        if maxsize <= 0:
+            raise ValueError('maxsize must be positive')
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            value = self._entries.get(key, self._MISSING)
+            if value is self._MISSING:
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions, len(self._entries), self._maxsize)
+
+
+class PersistentCache():
+    """A size-bounded mapping kept in an SQLite file, shared by every process
+    and thread that opens it, and across restarts
+
+    Entries are stored under a namespace, so that results computed from
+    another lexicon are never read, and are left to be evicted. Past maxsize
+    entries in the file, those written longest ago are evicted. Readers never
+    write, so concurrent readers do not contend; the file is in WAL mode, so
+    they do not wait on writers either.
+
+    Keys and values must survive a round trip through JSON, with lists read
+    back as tuples.
+
+    :param path: the SQLite file, created if missing
+    :param maxsize: most entries kept in the file, across all namespaces
+    :param namespace: the namespace to read and write
+    """
+
+    _MISSING = object()
+    _NOT_PREFETCHED = object()
+
+    def __init__(self, path: str, maxsize: int, namespace: str = ''):
+        if maxsize <= 0:
+            raise ValueError('maxsize must be positive')
+        self._path = path
+        self._maxsize = maxsize
+        self.namespace = namespace
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS entries ('
+                               'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                               'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                               'UNIQUE (namespace, key))')
+
+    def get(self, key: Hashable, default=None):
+        encoded = _encode(key)
+        value = getattr(self._local, 'prefetched', {}).get(encoded, self._NOT_PREFETCHED)
+        if value is self._NOT_PREFETCHED:
+            row = self._connection().execute('SELECT value FROM entries WHERE namespace = ? AND key = ?',
+                                             (self.namespace, encoded)).fetchone()
+            value = _decode(row[0]) if row is not None else self._MISSING
+        with self._lock:
+            if value is self._MISSING:
+                self._misses += 1
+                return default
+            self._hits += 1
+            return value
+
+    def put(self, key: Hashable, value):
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            pending[_encode(key)] = _encode(value)
+        else:
+            self._write({_encode(key): _encode(value)})
+
+    @contextlib.contextmanager
+    def batch(self, keys: Iterable[Hashable] = ()):
+        """Within the block, read keys from one query made up front, and write
+        what is put in one transaction at the end
+
+        :param keys: keys to prefetch
+        """
+        encoded = [_encode(key) for key in keys]
+        # Keys the query did not find are kept as misses, so are not looked up again
+        prefetched = dict.fromkeys(encoded, self._MISSING)
+        connection = self._connection()
+        for i in range(0, len(encoded), BATCH_QUERY_SIZE):
+            chunk = encoded[i:i + BATCH_QUERY_SIZE]
+            rows = connection.execute('SELECT key, value FROM entries WHERE namespace = ? AND key IN ({})'.format(
+                ', '.join('?' * len(chunk))), [self.namespace] + chunk)
+            prefetched.update((key, _decode(value)) for key, value in rows)
+        self._local.prefetched = prefetched
+        self._local.pending = {}
+        try:
+            yield self
+        finally:
+            pending = self._local.pending
+            del self._local.prefetched
+            del self._local.pending
+        if pending:
+            self._write(pending)
+
+    def clear(self):
+        """Remove the entries of this namespace"""
+        with self._connection() as connection:
+            connection.execute('DELETE FROM entries WHERE namespace = ?', (self.namespace,))
+
+    def stats(self) -> CacheStats:
+        size, = self._connection().execute('SELECT COUNT(*) FROM entries').fetchone()
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions, size, self._maxsize)
+
+    def _write(self, entries):
+        with self._connection() as connection:
+            # Replacing an entry gives it a new id, so it is evicted as if newly written
+            connection.executemany('INSERT OR REPLACE INTO entries (namespace, key, value) VALUES (?, ?, ?)',
+                                   [(self.namespace, key, value) for key, value in entries.items()])
+            # Ids only grow, so this keeps at most maxsize entries without counting them
+            evicted = connection.execute('DELETE FROM entries WHERE id <= (SELECT MAX(id) FROM entries) - ?',
+                                         (self._maxsize,)).rowcount
+        with self._lock:
+            self._evictions += evicted
+
+    def _connection(self):
+        # Connections are per thread, and reopened in a forked child
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(self._path, timeout=30)
+            local.connection.execute('PRAGMA journal_mode=WAL')
+            local.connection.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.connection
+
+
+def _encode(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _decode(text):
+    return _tuples(json.loads(text))
+
+
+def _tuples(value):
+    return tuple(_tuples(v) for v in value) if isinstance(value, list) else value
@@ -0,0 +1,180 @@
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import sys
+import time
+
+from myouji_kenchi import kenchi
+
+
+FORMATS = ('csv', 'tsv', 'jsonl')
+
+GIVEN_NAME_FIELD = 'given_name'
+FAMILY_NAME_FIELD = 'family_name'
+SCORE_FIELD_SUFFIX = '_score'
+
+
+def main(argv=None):
+    """Order or score the names in a CSV, TSV or JSONL stream, a chunk at a time"""
+    parser = argparse.ArgumentParser(prog='myouji-kenchi', description=main.__doc__)
+    parser.add_argument('input', nargs='?', default='-',
+                        help='file to read; - (the default) for stdin')
+    parser.add_argument('--format', choices=FORMATS,
+                        help='input and output format; inferred from the file extension, else csv')
+    parser.add_argument('--mode', choices=('order', 'score'), default='order',
+                        help='order a pair of name fields, or score each name field')
+    parser.add_argument('--fields', nargs='+',
+                        help='fields holding the names; by default the first two columns '
+                             '(one when scoring) of a CSV/TSV header')
+    parser.add_argument('--scores', action='store_true',
+                        help='when ordering, also write the score of each name field')
+    parser.add_argument('--prior', type=float, default=0.5,
+                        help='prior probability that names are already in the correct order, as for order_names')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='rows read and processed at a time')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes to score in')
+    parser.add_argument('--cache-size', type=int, default=100000,
+                        help='distinct names to remember across chunks; 0 to disable')
+    parser.add_argument('--index-size', type=int, default=0,
+                        help='precompute the romanizations of this many of the most frequent surnames; 0 to disable')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not print a summary to stderr')
+    args = parser.parse_args(argv)
+
+    if not 0 <= args.prior <= 1:
+        parser.error('--prior must be between 0 and 1')
+    if args.chunk_size < 1:
+        parser.error('--chunk-size must be positive')
+    input_format = args.format or _infer_format(args.input)
+
+    kenchi.configure(cache_size=args.cache_size or None, index_size=args.index_size or None)
+    # Load while the input is opened and its header read
+    kenchi.preload(background=True)
+    start = time.perf_counter()
+    num_rows = 0
+    with contextlib.ExitStack() as stack:
+        input_file = sys.stdin if args.input == '-' else stack.enter_context(open(args.input, newline=''))
+        pool = stack.enter_context(kenchi.scoring_pool(args.workers)) if args.workers > 1 else None
+        reader = _Reader(input_file, input_format)
+        if args.fields is None and reader.fields is None:
+            parser.error('--fields is required for jsonl input')
+        fields = args.fields or reader.fields[:2 if args.mode == 'order' else 1]
+        if args.mode == 'order' and len(fields) != 2:
+            parser.error('ordering needs exactly two name fields, from --fields or the header')
+        if reader.fields is not None and not set(fields) <= set(reader.fields):
+            parser.error('fields not found in the input header: {}'.format(', '.join(fields)))
+        writer = _Writer(sys.stdout, input_format, reader.fields, _added_fields(args.mode, fields, args.scores))
+
+        rows = iter(reader)
+        for chunk in iter(lambda: list(itertools.islice(rows, args.chunk_size)), []):
+            for row, added in zip(chunk, _process_chunk(chunk, fields, args, pool)):
+                row.update(added)
+                writer.write(row)
+            sys.stdout.flush()
+            num_rows += len(chunk)
+
+    if not args.quiet:
+        _print_summary(num_rows, time.perf_counter() - start, args.workers > 1)
+
+
+def _process_chunk(chunk, fields, args, pool):
+    try:
+        names = [[_name(row[field]) for field in fields] for row in chunk]
+    except KeyError as e:
+        sys.exit('Row is missing field {}'.format(e.args[0]))
+    results = [{} for _ in chunk]
+    scores = None
+    if args.mode == 'score' or args.scores:
+        flat_scores = iter(kenchi.score_many((n for row_names in names for n in row_names),
+                                             workers=args.workers,
+                                             pool=pool))
+        scores = [[next(flat_scores) for _ in fields] for _ in names]
+        for result, row_scores in zip(results, scores):
+            for field, score in zip(fields, row_scores):
+                result[field + SCORE_FIELD_SUFFIX] = score
+    if args.mode == 'order':
+        if scores is None:
+            orders = kenchi.order_names_many(names, prior=args.prior, workers=args.workers, pool=pool)
+        else:
+            # The names are already scored, so they are ordered as order_names
+            # would order them, without scoring them again
+            orders = [kenchi.order_scored(row_names, row_scores, args.prior)
+                      for row_names, row_scores in zip(names, scores)]
+        for result, ordered in zip(results, orders):
+            result[GIVEN_NAME_FIELD], result[FAMILY_NAME_FIELD] = ordered
+    return results
+
+
+def _name(value):
+    # Short CSV rows give None for their missing columns, and JSONL values may
+    # be null or numbers; these are scored as the empty string and as text
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+def _added_fields(mode, fields, scores):
+    added = [GIVEN_NAME_FIELD, FAMILY_NAME_FIELD] if mode == 'order' else []
+    if mode == 'score' or scores:
+        added += [field + SCORE_FIELD_SUFFIX for field in fields]
+    return added
+
+
+def _infer_format(path):
+    for input_format in FORMATS:
+        if path.lower().endswith('.' + input_format):
+            return input_format
+    return 'csv'
+
+
+class _Reader():
+    """Rows as dicts; fields is the header, or None for JSONL"""
+
+    def __init__(self, input_file, input_format):
+        if input_format == 'jsonl':
+            self.fields = None
+            self._rows = (json.loads(line) for line in input_file if line.strip())
+        else:
+            reader = csv.DictReader(input_file, delimiter='\t' if input_format == 'tsv' else ',')
+            self.fields = reader.fieldnames or []
+            self._rows = reader
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class _Writer():
+    def __init__(self, output_file, output_format, fields, added_fields):
+        self._output_file = output_file
+        if output_format == 'jsonl':
+            self._writer = None
+        else:
+            self._writer = csv.DictWriter(output_file,
+                                          fieldnames=list(fields) + added_fields,
+                                          delimiter='\t' if output_format == 'tsv' else ',',
+                                          lineterminator='\n')
+            self._writer.writeheader()
+
+    def write(self, row):
+        if self._writer is None:
+            self._output_file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        else:
+            self._writer.writerow(row)
+
+
+def _print_summary(num_rows, elapsed, in_workers):
+    rate = num_rows / elapsed if elapsed > 0 else float('inf')
+    summary = '{} rows in {:.2f}s ({:.0f} rows/s)'.format(num_rows, elapsed, rate)
+    if in_workers and (kenchi.cache_stats() is not None or kenchi.index_stats() is not None):
+        # Each worker process keeps its own cache and index, which this process cannot see
+        summary += ', cache and index stats unavailable with --workers'
+    stats = kenchi.cache_stats() if not in_workers else None
+    if stats is not None and stats.hits + stats.misses:
+        summary += ', cache hit rate {:.1%}'.format(stats.hits / (stats.hits + stats.misses))
+    stats = kenchi.index_stats() if not in_workers else None
+    if stats is not None and stats.hits + stats.misses:
+        summary += ', index fallback rate {:.1%}'.format(stats.misses / (stats.hits + stats.misses))
+    print(summary, file=sys.stderr)
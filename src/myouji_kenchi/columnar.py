@@ -0,0 +1,142 @@
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from . import kenchi
+from .lazy import LazyModule
+
+
+futures = LazyModule('concurrent.futures')
+np = LazyModule('numpy')
+
+
+class Candidates(NamedTuple):
+    """The readings of a column of names, dictionary encoded
+
+    Row i has the readings of distinct name codes[i], which are
+    readings[offsets[codes[i]]:offsets[codes[i] + 1]] with the scores at the
+    same positions, in the order back_transliterate gives them. Only the
+    distinct names' readings are held, however many rows there are.
+
+    :ivar codes: for each row, the index of its distinct name
+    :ivar offsets: for each distinct name, where its readings start, then the total
+    :ivar readings: katakana readings
+    :ivar scores: frequency scores of the readings
+    """
+    codes: 'np.ndarray'
+    offsets: 'np.ndarray'
+    readings: 'np.ndarray'
+    scores: 'np.ndarray'
+
+    def row(self, i: int) -> List[Tuple[str, float]]:
+        """The readings of row i, as back_transliterate would return them"""
+        start, end = self.offsets[self.codes[i]], self.offsets[self.codes[i] + 1]
+        return [(str(r), float(s)) for r, s in zip(self.readings[start:end], self.scores[start:end])]
+
+
+def factorize(names: Iterable) -> Tuple['np.ndarray', List[str]]:
+    """Encode a column of names as indices into its distinct names
+
+    Values that are not strings, such as None or NaN for missing names, are
+    taken as the empty string, which scores 0 and has no readings.
+
+    :param names: a sequence or array of names, e.g. a pandas Series
+    :returns: the index of each name in the distinct names, and the distinct
+        names in order of first appearance
+    """
+    index = {}
+    codes = _codes(names, index)
+    return codes, list(index)
+
+
+def score_array(names: Iterable,
+                workers: Optional[int] = None,
+                chunksize: Optional[int] = None,
+                pool: Optional['futures.Executor'] = None) -> 'np.ndarray':
+    """Score a column of names as Japanese surnames, each distinct name once
+
+    :param names: a sequence or array of names, e.g. a pandas Series
+    :param workers: as for kenchi.score_many
+    :param chunksize: as for kenchi.score_many
+    :param pool: as for kenchi.score_many
+    :returns: for each name, in order, the score get_score_as_myouji gives it, as float64
+    """
+    codes, uniques = factorize(names)
+    return _score_uniques(uniques, workers, chunksize, pool)[codes]
+
+
+def candidate_arrays(names: Iterable, k: Optional[int] = None, min_score: Optional[float] = None) -> Candidates:
+    """Back transliterate a column of names, each distinct name once
+
+    :param names: a sequence or array of names, e.g. a pandas Series
+    :param k: as for back_transliterate
+    :param min_score: as for back_transliterate
+    """
+    codes, uniques = factorize(names)
+    results = kenchi.load_transliterator().back_transliterate_many(uniques, k=k, min_score=min_score)
+    offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in results], out=offsets[1:])
+    readings = [reading for result in results for reading, _ in result]
+    scores = [score for result in results for _, score in result]
+    return Candidates(codes,
+                      offsets,
+                      np.array(readings, dtype=str) if readings else np.array([], dtype='<U1'),
+                      np.array(scores, dtype=np.float64))
+
+
+def swap_mask(first: Iterable,
+              second: Iterable,
+              prior=0.5,
+              workers: Optional[int] = None,
+              chunksize: Optional[int] = None,
+              pool: Optional['futures.Executor'] = None) -> 'np.ndarray':
+    """Decide, as order_names does for each pair, which rows of two columns of
+    names are in the wrong order
+
+    The heuristics are applied to each distinct name once, and only names of
+    pairs they leave undecided are scored.
+
+    :param first: the first name of each pair
+    :param second: the second name of each pair, as many as the first
+    :param prior: the prior probability that the names are in the correct order
+    :param workers: as for kenchi.score_many
+    :param chunksize: as for kenchi.score_many
+    :param pool: as for kenchi.score_many
+    :returns: a boolean array, True where order_names would swap the pair
+    """
+    kenchi.check_prior(prior)
+    index = {}
+    first_codes, second_codes = _codes(first, index), _codes(second, index)
+    if len(first_codes) != len(second_codes):
+        raise ValueError('Columns must be of the same length')
+    uniques = list(index)
+
+    # As in order_names, a pair is swapped if only its second name looks like
+    # an initial, and otherwise if only its first name is all uppercase
+    swap = np.zeros(len(first_codes), dtype=bool)
+    undecided = np.ones(len(first_codes), dtype=bool)
+    for heuristic, swap_on_second in [(kenchi.is_initial, True), (kenchi.is_all_uppercase, False)]:
+        feature = np.array([heuristic(name) for name in uniques], dtype=bool)
+        first_feature, second_feature = feature[first_codes], feature[second_codes]
+        decided = undecided & (first_feature != second_feature)
+        swap[decided] = (second_feature if swap_on_second else first_feature)[decided]
+        undecided &= ~decided
+
+    needed = np.unique(np.concatenate([first_codes[undecided], second_codes[undecided]]))
+    scores = np.zeros(len(uniques), dtype=np.float64)
+    if len(needed):
+        scores[needed] = _score_uniques([uniques[i] for i in needed], workers, chunksize, pool)
+    swap[undecided] = (scores[first_codes[undecided]] * prior >
+                       scores[second_codes[undecided]] * (1 - prior))
+    return swap
+
+
+def _codes(names, index):
+    return np.fromiter((index.setdefault(name if isinstance(name, str) else '', len(index)) for name in names),
+                       dtype=np.intp)
+
+
+def _score_uniques(uniques, workers, chunksize, pool):
+    return np.array(kenchi.score_many(uniques, workers, chunksize, pool), dtype=np.float64)
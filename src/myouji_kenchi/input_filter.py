@@ -0,0 +1,188 @@
+import json
+import threading
+
+from collections import Counter
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+
+from .symbol_table import REVERSE_SYMBOL_TABLE
+
+
+class FilterStats(NamedTuple):
+    checked: int
+    rejected: int
+    rejected_by_reason: Dict[str, int]
+
+
+class InputFilter():
+    """Cheap necessary conditions on the normalized romaji a transducer accepts
+
+    Derived from the transducer itself, so every string it would produce
+    readings for passes: the characters, first and last characters and
+    adjacent character pairs of the string must all occur in some accepted
+    input, and its length must be within the range of accepted inputs.
+    Strings failing any of these are rejected without a lookup.
+    """
+
+    def __init__(self, alphabet, initials, finals, bigrams, min_length, max_length):
+        self.alphabet = frozenset(alphabet)
+        self.initials = frozenset(initials)
+        self.finals = frozenset(finals)
+        self.bigrams = frozenset(bigrams)
+        self.min_length = min_length
+        self.max_length = max_length
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._rejected = Counter()
+
+    @classmethod
+    def from_array_transducer(cls, arrays) -> 'InputFilter':
+        """Collect the conditions from the input side of an ArrayTransducer
+
+        :param arrays: the transducer
+        """
+        offsets = arrays.offsets.tolist()
+        ilabels = arrays.ilabels.tolist()
+        nextstates = arrays.nextstates.tolist()
+        is_final = [w != float('inf') for w in arrays.finals.tolist()]
+        num_states = len(is_final)
+
+        def arcs(state):
+            return zip(ilabels[offsets[state]:offsets[state + 1]], nextstates[offsets[state]:offsets[state + 1]])
+
+        # The characters that can be read next from each state, and whether
+        # it can end the input, looking through input epsilon arcs
+        firsts = [None] * num_states
+        can_end = [None] * num_states
+        for state in _reverse_topological_order(num_states, lambda s: [n for _, n in arcs(s)]):
+            firsts[state] = set()
+            can_end[state] = is_final[state]
+            for ilabel, nxt in arcs(state):
+                if ilabel:
+                    firsts[state].add(ilabel)
+                else:
+                    firsts[state] |= firsts[nxt]
+                    can_end[state] = can_end[state] or can_end[nxt]
+
+        bigrams = set()
+        finals = set()
+        alphabet = set()
+        for state in range(num_states):
+            for ilabel, nxt in arcs(state):
+                if ilabel:
+                    alphabet.add(ilabel)
+                    bigrams.update((ilabel, b) for b in firsts[nxt])
+                    if can_end[nxt]:
+                        finals.add(ilabel)
+
+        min_length, max_length = _input_length_range(num_states, arcs, is_final, arrays.start)
+        return cls(alphabet={REVERSE_SYMBOL_TABLE[a] for a in alphabet},
+                   initials={REVERSE_SYMBOL_TABLE[a] for a in firsts[arrays.start]},
+                   finals={REVERSE_SYMBOL_TABLE[a] for a in finals},
+                   bigrams={REVERSE_SYMBOL_TABLE[a] + REVERSE_SYMBOL_TABLE[b] for a, b in bigrams},
+                   min_length=min_length,
+                   max_length=max_length)
+
+    @classmethod
+    def load(cls, path: str) -> 'InputFilter':
+        with open(path) as filter_file:
+            data = json.load(filter_file)
+        return cls(**data)
+
+    def save(self, path: str):
+        data = {'alphabet': sorted(self.alphabet),
+                'initials': sorted(self.initials),
+                'finals': sorted(self.finals),
+                'bigrams': sorted(self.bigrams),
+                'min_length': self.min_length,
+                'max_length': self.max_length}
+        with open(path, mode='w') as filter_file:
+            json.dump(data, filter_file, ensure_ascii=False, indent=0, sort_keys=True)
+
+    def check(self, normalized: str) -> Optional[str]:
+        """The reason normalized romaji cannot be accepted, if there is one
+
+        :param normalized: normalized romaji
+        :returns: None if the string may be accepted, else the name of the failed condition
+        """
+        reason = self._rejection_reason(normalized)
+        with self._lock:
+            self._checked += 1
+            if reason is not None:
+                self._rejected[reason] += 1
+        return reason
+
+    def passes(self, normalized: str) -> bool:
+        """Whether normalized romaji may be accepted, without counting it in the stats"""
+        return self._rejection_reason(normalized) is None
+
+    def union(self, other: 'InputFilter') -> 'InputFilter':
+        """A filter passing whatever either filter passes, e.g. for a transducer
+        extended with other's, with the stats counted so far carried over from this one"""
+        merged = InputFilter(alphabet=self.alphabet | other.alphabet,
+                             initials=self.initials | other.initials,
+                             finals=self.finals | other.finals,
+                             bigrams=self.bigrams | other.bigrams,
+                             min_length=min(self.min_length, other.min_length),
+                             max_length=max(self.max_length, other.max_length))
+        with self._lock:
+            merged._checked = self._checked
+            merged._rejected = Counter(self._rejected)
+        return merged
+
+    def stats(self) -> FilterStats:
+        with self._lock:
+            return FilterStats(self._checked, sum(self._rejected.values()), dict(self._rejected))
+
+    def _rejection_reason(self, normalized):
+        if not self.min_length <= len(normalized) <= self.max_length:
+            return 'length'
+        if not self.alphabet.issuperset(normalized):
+            return 'character'
+        if normalized[0] not in self.initials:
+            return 'initial'
+        if normalized[-1] not in self.finals:
+            return 'final'
+        bigrams = self.bigrams
+        for i in range(len(normalized) - 1):
+            if normalized[i:i + 2] not in bigrams:
+                return 'bigram'
+        return None
+
+
+def _reverse_topological_order(num_states, next_states):
+    # Iterative post-order, as paths can be far longer than the recursion limit
+    visited = [False] * num_states
+    order = []
+    for root in range(num_states):
+        if visited[root]:
+            continue
+        visited[root] = True
+        stack = [(root, iter(next_states(root)))]
+        while stack:
+            state, successors = stack[-1]
+            for nxt in successors:
+                if not visited[nxt]:
+                    visited[nxt] = True
+                    stack.append((nxt, iter(next_states(nxt))))
+                    break
+            else:
+                stack.pop()
+                order.append(state)
+    return order
+
+
+def _input_length_range(num_states, arcs, is_final, start):
+    shortest = [None] * num_states
+    longest = [None] * num_states
+    for state in _reverse_topological_order(num_states, lambda s: [n for _, n in arcs(s)]):
+        shortest[state] = 0 if is_final[state] else float('inf')
+        longest[state] = 0 if is_final[state] else -float('inf')
+        for ilabel, nxt in arcs(state):
+            step = 1 if ilabel else 0
+            shortest[state] = min(shortest[state], shortest[nxt] + step)
+            longest[state] = max(longest[state], longest[nxt] + step)
+    if start < 0 or shortest[start] == float('inf'):
+        return 1, 0
+    return shortest[start], longest[start]
@@ -0,0 +1,177 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+
+class LookupTrace():
+    """Where the time went in one back_transliterate call
+
+    Stages are timed back to back, each from the end of the one before, and
+    only those the call reached appear. They are, in order: normalize,
+    prefilter, index, cache, then for a lookup input_fst, compose and count
+    (fst engine) or walk (array engine), followed by search and deintern_sort.
+    With a lexicon overlay (see add_surnames), checking it and merging its
+    readings are timed together as an overlay stage. A lookup in a sharded
+    lexicon is timed as a shards stage in place of the engine's stages.
+
+    :ivar outcome: how the call was answered: 'rejected' by the prefilter,
+        from the 'index' or 'cache', or by a 'lookup', or 'limited' if
+        the lookup went over its limits
+    :ivar lattice_states: states of the composed lattice (fst engine lookups)
+    :ivar lattice_arcs: arcs of the composed lattice (fst engine lookups)
+    :ivar paths: paths reaching the end of the input (array engine lookups)
+    :ivar candidates: readings found before k and min_score were applied, for lookups
+    :ivar returned: readings returned
+    """
+
+    def __init__(self, romaji: str, k: Optional[int], min_score: Optional[float], engine: str):
+        self.romaji = romaji
+        self.k = k
+        self.min_score = min_score
+        self.engine = engine
+        self.normalized = None
+        self.input_length = None
+        self.outcome = None
+        self.stages = {}
+        self.total = None
+        self.lattice_states = None
+        self.lattice_arcs = None
+        self.paths = None
+        self.candidates = None
+        self.returned = None
+        self._start = self._clock = time.perf_counter()
+
+    def mark(self, stage: str):
+        """End a stage, charging it the time since the previous mark"""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._clock
+        self._clock = now
+
+    def finish(self, outcome: str, returned: int):
+        self.outcome = outcome
+        self.returned = returned
+        self.total = time.perf_counter() - self._start
+
+    def __repr__(self):
+        return 'LookupTrace({!r}, outcome={!r}, total={:.1f}us, stages={{{}}})'.format(
+            self.romaji, self.outcome, (self.total or 0) * 1e6,
+            ', '.join('{}: {:.1f}us'.format(s, d * 1e6) for s, d in self.stages.items()))
+
+
+class _NullTrace():
+    """Stands in for a LookupTrace when lookups are not traced, recording nothing"""
+
+    __slots__ = ()
+
+    def mark(self, stage: str):
+        pass
+
+    def finish(self, outcome: str, returned: int):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+# Passed along the lookup path in place of a trace, so the path is the same whether traced or not
+NO_TRACE = _NullTrace()
+
+
+class StageStats(NamedTuple):
+    count: int
+    mean: float
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+
+class TraceAggregator():
+    """A sink for LookupTraces that summarizes stage durations as percentiles
+    and keeps the slowest calls, to find pathological inputs
+
+    Pass it as on_lookup. Counts, means and maxima are over every call; the
+    percentiles come from a uniform sample of at most max_samples durations
+    per stage, so memory stays bounded however long it runs.
+
+    :param slowest: number of slowest traces to keep
+    :param max_samples: durations kept per stage
+    """
+
+    def __init__(self, slowest: int = 10, max_samples: int = 100000, seed: int = 0):
+        self._slowest_size = slowest
+        self._max_samples = max_samples
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self.reset()
+
+    def __call__(self, trace: LookupTrace):
+        with self._lock:
+            self._outcomes[trace.outcome] = self._outcomes.get(trace.outcome, 0) + 1
+            self._record('total', trace.total)
+            for stage, duration in trace.stages.items():
+                self._record(stage, duration)
+            # The counter breaks ties, as traces do not compare
+            entry = (trace.total, next(self._counter), trace)
+            if len(self._slowest) < self._slowest_size:
+                heapq.heappush(self._slowest, entry)
+            elif self._slowest and entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def stats(self) -> Dict[str, StageStats]:
+        """Percentiles of each stage, and of the whole call as 'total', in seconds"""
+        with self._lock:
+            return {stage: _stage_stats(samples, self._counts[stage], self._sums[stage], self._maxima[stage])
+                    for stage, samples in self._samples.items()}
+
+    def outcomes(self) -> Dict[str, int]:
+        """How many calls were answered each way (see LookupTrace.outcome)"""
+        with self._lock:
+            return dict(self._outcomes)
+
+    def slowest(self) -> List[LookupTrace]:
+        """The slowest calls seen, slowest first"""
+        with self._lock:
+            return [trace for _, _, trace in sorted(self._slowest, reverse=True)]
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+            self._counts = {}
+            self._sums = {}
+            self._maxima = {}
+            self._outcomes = {}
+            self._slowest = []
+
+    def _record(self, stage, duration):
+        count = self._counts.get(stage, 0) + 1
+        self._counts[stage] = count
+        self._sums[stage] = self._sums.get(stage, 0.0) + duration
+        self._maxima[stage] = max(self._maxima.get(stage, duration), duration)
+        samples = self._samples.setdefault(stage, [])
+        if len(samples) < self._max_samples:
+            samples.append(duration)
+        else:
+            # Reservoir sampling keeps every duration equally likely to be in the sample
+            i = self._rng.randrange(count)
+            if i < self._max_samples:
+                samples[i] = duration
+
+
+def _stage_stats(samples, count, total, maximum):
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return StageStats(count=count,
+                      mean=total / count,
+                      p50=ordered[round(0.5 * last)],
+                      p90=ordered[round(0.9 * last)],
+                      p99=ordered[round(0.99 * last)],
+                      max=maximum)
@@ -1,11 +1,32 @@
+import math
 import myouji_kenchi
-import regex
+import threading
 import unicodedata
 
+from typing import Iterable
 from typing import List
+from typing import Optional
+from typing import Sequence
 
+from .cache import CacheStats
+from .lazy import LazyModule
+from .lexicon_shards import ShardStats
+from .limits import LimitStats
+from .romaji_index import IndexStats
+
+
+futures = LazyModule('concurrent.futures')
+regex = LazyModule('regex')
 
 _TRANSLITERATOR = None
+_TRANSLITERATOR_OPTIONS = {}
+_TRANSLITERATOR_LOCK = threading.Lock()
+# The in-flight or finished load of _TRANSLITERATOR, shared by everything waiting on it
+_TRANSLITERATOR_LOAD = None
+
+# Chunks handed to worker processes are at least this many names, so that
+# scoring rather than pickling dominates each round trip
+MIN_CHUNKSIZE = 500
 
 
 def order_names(names: List[str], prior=0.5) -> List[str]:
@@ -18,56 +39,356 @@ def order_names(names: List[str], prior=0.5) -> List[str]:
     :param prior: the prior probability that the names are in the correct order
     :returns: names in order estimated to be correct
     """
+    check_prior(prior)
+    check_names(names)
+
+    ordered = order_by_heuristics(names)
+    if ordered is not None:
+        return ordered
+
+    scores = [get_score_as_myouji(name) for name in names]
+    return _order_by_scores(names, scores, prior)
+
+
+def order_names_many(pairs: Iterable[Sequence[str]],
+                     prior=0.5,
+                     workers: Optional[int] = None,
+                     chunksize: Optional[int] = None,
+                     pool: Optional['futures.Executor'] = None) -> List[List[str]]:
+    """Order many pairs of names, as order_names does for a single pair.
+
+    Each distinct name is scored only once across the whole batch.
+
+    :param pairs: pairs of names to order
+    :param prior: the prior probability that the names are in the correct order
+    :param workers: as for score_many
+    :param chunksize: as for score_many
+    :param pool: as for score_many
+    :returns: for each pair, in order, the names in the order estimated to be correct
+    """
+    check_prior(prior)
+    pairs = list(pairs)
+    for names in pairs:
+        check_names(names)
+
+    results = [order_by_heuristics(names) for names in pairs]
+    undecided = [names for names, ordered in zip(pairs, results) if ordered is None]
+    scores = iter(score_many((name for names in undecided for name in names), workers, chunksize, pool))
+    for i, names in enumerate(pairs):
+        if results[i] is None:
+            results[i] = _order_by_scores(names, [next(scores), next(scores)], prior)
+    return results
+
+
+def split_full_name(text: str, prior=0.5) -> List[str]:
+    """Split a full name into given name and surname, in the order order_names puts them.
+
+    A name in several tokens ('Taro Ken Yamada', 'YAMADA, Taro') or in camel
+    case ('TaroYamada') has its first or last part as the surname, chosen as
+    order_names chooses between two names. In a name with no such breaks
+    ('yamadataro') the surname may be any prefix or suffix of two or more
+    letters, other than one that splits a long vowel. Every candidate
+    surname is scored in a single walk over the name.
+
+    :param text: the full name
+    :param prior: as for order_names
+    :returns: the given name and the surname, or just the name if it has no
+        breaks and no part of it reads as a surname
+    :raises ValueError: if text is blank
+    """
+    check_prior(prior)
+    tokens = [token for token in regex.split(r'[\s,]+', text) if token]
+    separator = ' '
+    if len(tokens) == 1:
+        tokens = regex.split(r'(?<=\p{Ll})(?=\p{Lu})', tokens[0])
+        separator = ''
+    if not tokens:
+        raise ValueError('text must not be blank')
+
+    if len(tokens) > 1:
+        first, last = tokens[0], tokens[-1]
+        ordered = order_by_heuristics([first, last])
+        if ordered is None:
+            end = len(tokens)
+            scores = load_transliterator().span_scores(tokens, [(0, 1), (end - 1, end)])
+            ordered = _order_by_scores([first, last], [scores[(0, 1)], scores[(end - 1, end)]], prior)
+        if ordered != [first, last]:
+            return [separator.join(tokens[1:]), first]
+        return [separator.join(tokens[:-1]), last]
+
+    name = tokens[0]
+    breaks = [b for b in range(2, len(name) - 1) if _is_break(name, b)]
+    spans = [(0, b) for b in breaks] + [(b, len(name)) for b in breaks]
+    scores = load_transliterator().span_scores(list(name), spans)
+    # Weighted as order_names weighs the first and last name as the surname
+    candidates = ([(scores[(0, b)] * prior, name[b:], name[:b]) for b in breaks] +
+                  [(scores[(b, len(name))] * (1 - prior), name[:b], name[b:]) for b in breaks])
+    weight, given, surname = max(candidates, key=lambda c: c[0], default=(0, None, None))
+    if weight <= 0:
+        return [name]
+    return [given, surname]
+
+
+def get_score_as_myouji(name: str) -> float:
+    """Calculate a frequency score for a string as a Japanese surname.
+
+    :param name: name to score
+    """
+    transliterator = load_transliterator()
+    return transliterator.best_score(name)
+
+
+def score_many(names: Iterable[str],
+               workers: Optional[int] = None,
+               chunksize: Optional[int] = None,
+               pool: Optional['futures.Executor'] = None) -> List[float]:
+    """Calculate frequency scores for many strings as Japanese surnames.
+
+    Each distinct name is scored only once.
+
+    :param names: names to score
+    :param workers: if more than one, score in a pool of this many processes,
+        each loading the transliterator once
+    :param chunksize: number of distinct names sent to a worker at a time
+    :param pool: a pool from scoring_pool to score in, rather than starting
+        one for this call
+    :returns: for each name, in order, the score get_score_as_myouji gives it
+    """
+    if pool is None and (workers is None or workers <= 1):
+        transliterator = load_transliterator()
+        return [_best_score(results) for results in transliterator.back_transliterate_many(names, k=1)]
+
+    names = list(names)
+    if not names:
+        return []
+    unique_names = list(dict.fromkeys(names))
+    if chunksize is None:
+        chunksize = max(MIN_CHUNKSIZE, math.ceil(len(unique_names) / ((workers or 1) * 4)))
+    chunks = [unique_names[i:i + chunksize] for i in range(0, len(unique_names), chunksize)]
+    if pool is None:
+        with scoring_pool(min(workers, len(chunks))) as pool:
+            chunk_scores = list(pool.map(score_many, chunks))
+    else:
+        chunk_scores = pool.map(score_many, chunks)
+    scores = {}
+    for chunk, chunk_score in zip(chunks, chunk_scores):
+        scores.update(zip(chunk, chunk_score))
+    return [scores[name] for name in names]
+
+
+def scoring_pool(workers: int) -> 'futures.Executor':
+    """Start a pool of processes for score_many and order_names_many to share.
+
+    Each worker loads the transliterator, with the options set by configure, once.
+
+    :param workers: number of processes
+    :returns: the pool, to be shut down by the caller (it is a context manager)
+    """
+    # Forked workers inherit the loaded transliterator; others load their own in the initializer
+    load_transliterator()
+    return futures.ProcessPoolExecutor(max_workers=workers,
+                                       initializer=_initialize_worker,
+                                       initargs=(_TRANSLITERATOR_OPTIONS,))
+
+
+def configure(**options):
+    """Set the options of the transliterator used by the module-level functions.
+
+    Takes the keyword arguments of MyoujiBackTransliteration, e.g. cache_size.
+    The transliterator is rebuilt with these options on next use.
+    """
+    global _TRANSLITERATOR, _TRANSLITERATOR_OPTIONS, _TRANSLITERATOR_LOAD
+    with _TRANSLITERATOR_LOCK:
+        _TRANSLITERATOR_OPTIONS = dict(options)
+        _TRANSLITERATOR = None
+        _TRANSLITERATOR_LOAD = None
+
+
+def limit_stats() -> Optional[LimitStats]:
+    """How many lookups of the module-level transliterator went over their limits.
+
+    :returns: the stats, or None if lookups are not limited (see configure)
+    """
+    return load_transliterator().limit_stats()
+
+
+def preload(background=True) -> 'futures.Future':
+    """Load the transliterator used by the module-level functions ahead of the first call.
+
+    Scoring while a load is in flight waits for it rather than starting another.
+
+    :param background: load on a background thread and return at once, rather
+        than returning once loaded
+    :returns: a future of the transliterator, done once it is loaded; a
+        failed load is retried by the next preload or scoring call
+    """
+    global _TRANSLITERATOR_LOAD
+    with _TRANSLITERATOR_LOCK:
+        load = _TRANSLITERATOR_LOAD
+        start = load is None
+        if start:
+            load = _TRANSLITERATOR_LOAD = futures.Future()
+            options = _TRANSLITERATOR_OPTIONS
+    if start:
+        if background:
+            threading.Thread(target=_run_load, args=(load, options), name='myouji-kenchi-preload', daemon=True).start()
+        else:
+            _run_load(load, options)
+    if not background:
+        load.result()
+    return load
+
+
+def is_ready() -> bool:
+    """Whether the transliterator used by the module-level functions is loaded,
+    so that scoring will not wait on a load"""
+    return _TRANSLITERATOR is not None
+
+
+def cache_stats() -> Optional[CacheStats]:
+    """Statistics of the result cache of the module-level transliterator.
+
+    :returns: the stats, or None if caching is disabled (see configure)
+    """
+    return load_transliterator().cache_stats()
+
+
+def index_stats() -> Optional[IndexStats]:
+    """Statistics of the precomputed index of the module-level transliterator,
+    including how many inputs fell back to a lookup (misses).
+
+    :returns: the stats, or None if there is no index (see configure)
+    """
+    return load_transliterator().index_stats()
+
+
+def shard_stats() -> Optional[ShardStats]:
+    """Statistics of the lexicon shards of the module-level transliterator,
+    including how many are composed and the time spent composing them.
+
+    :returns: the stats, or None if the lexicon is not sharded (see configure)
+    """
+    return load_transliterator().shard_stats()
+
+
+def load_transliterator():
+    """The transliterator the functions of this module score by, as configured
+    by configure, loading it if it has not been"""
+    transliterator = _TRANSLITERATOR
+    if transliterator is None:
+        transliterator = preload(background=False).result()
+    return transliterator
+
+
+def check_prior(prior):
+    """Check a prior as order_names takes it
+
+    :raises ValueError: if prior is not a probability
+    """
     if prior < 0 or prior > 1:
         raise ValueError('Prior is not valid')
+
+
+def check_names(names):
+    """Check names as order_names takes them
+
+    :raises ValueError: if there are not two names
+    """
     if len(names) != 2:
         raise ValueError('names must have length two')
 
+
+def order_by_heuristics(names: Sequence[str]) -> Optional[List[str]]:
+    """Order a pair of names by the heuristics of order_names alone, without scoring them
+
+    :param names: the two names
+    :returns: the names in order, or None if the heuristics cannot decide
+    :raises ValueError: if there are not two names
+    """
+    check_names(names)
     reverse_order = list(reversed(names))
     same_order = list(names)
 
     # First heuristic: if one name looks like an initial
     # Hypothetically, if both should look like initials, follow the precautionary principle
-    if _is_initial(names[1]) and not _is_initial(names[0]):
+    if is_initial(names[1]) and not is_initial(names[0]):
         return reverse_order
-    elif _is_initial(names[0]) and not _is_initial(names[1]):
+    elif is_initial(names[0]) and not is_initial(names[1]):
         return same_order
 
     # Second heuristic: if only one name is all uppercase
-    if _is_all_uppercase(names[0]) and not _is_all_uppercase(names[1]):
+    if is_all_uppercase(names[0]) and not is_all_uppercase(names[1]):
         return reverse_order
-    if _is_all_uppercase(names[1]) and not _is_all_uppercase(names[0]):
+    if is_all_uppercase(names[1]) and not is_all_uppercase(names[0]):
         return same_order
 
-    scores = [get_score_as_myouji(name) for name in names]
-    scores[0] *= prior
-    scores[1] *= 1 - prior
-    if scores[0] > scores[1]:
-        return reverse_order
-    return same_order
+    return None
 
 
-def get_score_as_myouji(name: str) -> float:
-    """Calculate a frequency score for a string as a Japanese surname.
+def order_scored(names: Sequence[str], scores: Sequence[float], prior=0.5) -> List[str]:
+    """Order a pair of names as order_names does, given the scores
+    get_score_as_myouji gives them
 
-    :param name: name to score
+    :param names: the two names
+    :param scores: the score of each name
+    :param prior: as for order_names
+    :returns: names in order estimated to be correct
     """
-    transliterator = _load_transliterator()
-    back_transliteration_results = transliterator.back_transliterate(name)
-    scores = [r[1] for r in back_transliteration_results]
-    return max(scores, default=0)
-
-
-def _load_transliterator():
-    global _TRANSLITERATOR
-    if _TRANSLITERATOR is None:
-        _TRANSLITERATOR = myouji_kenchi.MyoujiBackTransliteration()
-    return _TRANSLITERATOR
+    check_prior(prior)
+    ordered = order_by_heuristics(names)
+    if ordered is not None:
+        return ordered
+    return _order_by_scores(names, scores, prior)
 
 
-def _is_all_uppercase(name):
+def is_all_uppercase(name: str) -> bool:
+    """Whether a name is written all in capitals, as a surname often is in a full name"""
     return regex.match(r'(\p{Uppercase}|[-\']})+$', unicodedata.normalize('NFKC', name)) is not None
 
 
-def _is_initial(name):
+def is_initial(name: str) -> bool:
+    """Whether a name is a single capital, with or without a full stop, as a given name's initial is"""
     return regex.match(r'\p{Uppercase}\.?$', unicodedata.normalize('NFKC', name)) is not None
+
+
+def _run_load(load, options):
+    global _TRANSLITERATOR, _TRANSLITERATOR_LOAD
+    try:
+        transliterator = myouji_kenchi.MyoujiBackTransliteration(**options)
+    except Exception as e:
+        with _TRANSLITERATOR_LOCK:
+            if _TRANSLITERATOR_LOAD is load:
+                _TRANSLITERATOR_LOAD = None
+        load.set_exception(e)
+        return
+    with _TRANSLITERATOR_LOCK:
+        # configure may have been called since, making this load obsolete
+        if _TRANSLITERATOR_LOAD is load:
+            _TRANSLITERATOR = transliterator
+    load.set_result(transliterator)
+
+
+def _initialize_worker(options):
+    # A forked worker already holds the parent's transliterator
+    if _TRANSLITERATOR is None or options != _TRANSLITERATOR_OPTIONS:
+        configure(**options)
+    load_transliterator()
+
+
+def _order_by_scores(names, scores, prior) -> List[str]:
+    if scores[0] * prior > scores[1] * (1 - prior):
+        return list(reversed(names))
+    return list(names)
+
+
+def _best_score(back_transliteration_results):
+    scores = [r[1] for r in back_transliteration_results]
+    return max(scores, default=0)
+
+
+def _is_break(name, i):
+    # Not inside a character's combining marks, nor a long vowel written ou or
+    # uu, as in satoutarou, which given names rarely begin the second half of
+    if unicodedata.combining(name[i]):
+        return False
+    return name[i - 1:i + 1].lower() not in ('ou', 'uu')
@@ -0,0 +1,24 @@
+import importlib
+
+
+class LazyModule():
+    """Stands in for a module, importing it on first attribute access
+
+    Attributes are copied onto the stand-in as they are looked up, so only the
+    first use of each pays for the indirection. Import errors surface at that
+    first use rather than when the importing module loads.
+    """
+
+    def __init__(self, name: str):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attr):
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        value = getattr(self.__module, attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return '<lazy module {!r}>'.format(self.__name)
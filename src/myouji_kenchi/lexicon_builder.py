@@ -0,0 +1,205 @@
+import time
+
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+
+from .array_transducer import ArrayTransducer
+from .lazy import LazyModule
+from .search import INFINITY, max_reachable_weights
+from .symbol_table import SYMBOL_TABLE
+
+
+np = LazyModule('numpy')
+
+
+class BuildStats(NamedTuple):
+    strings: int
+    states: int
+    arcs: int
+    seconds: float
+
+
+class LexiconBuilder():
+    """Builds a minimal acyclic acceptor (a DAWG) of weighted strings, added in sorted order
+
+    The suffix of the previous string is minimized as soon as the next string
+    shows that no later one can extend it (Daciuk et al., 2000), so memory
+    stays in proportion to the automaton rather than to the trie of the
+    strings. States are only merged where their final weights agree as well as
+    their suffixes, so each string keeps its weight on its own final state, as
+    in the lexical acceptor. Nothing is recursive, so strings may be of any length.
+    """
+
+    def __init__(self):
+        # Arcs of each state as (label, next state), in the order added; None for freed states
+        self._arcs = [[]]
+        self._finals = [INFINITY]
+        self._free = []
+        # Minimized states, by (final weight, arcs)
+        self._register = {}
+        # (state, label, next state) along the previous string, where it is not yet minimized
+        self._unchecked = []
+        self._previous = None
+        self._previous_labels = []
+        self._strings = 0
+        self._started = None
+        self._finished = None
+        self._result = None
+
+    def add(self, string: str, weight: float):
+        """Add a string, which must sort after every string added before it
+
+        :param string: katakana reading
+        :param weight: its frequency score
+        :raises ValueError: if the string is out of order or repeated, has a
+            character outside the symbol table, or the weight is infinite
+        """
+        if self._result is not None:
+            raise ValueError('Builder has already finished')
+        if self._previous is not None and string <= self._previous:
+            raise ValueError('Strings must be added in sorted order without repeats: {!r} follows {!r}'.format(
+                string, self._previous))
+        weight = float(weight)
+        if weight == INFINITY:
+            raise ValueError('Weight of {!r} is infinite'.format(string))
+        try:
+            labels = [SYMBOL_TABLE[c] for c in string]
+        except KeyError as e:
+            raise ValueError('Character {} not in symbol table'.format(e.args[0]))
+        if self._started is None:
+            self._started = time.perf_counter()
+
+        prefix = 0
+        for previous_label, label in zip(self._previous_labels, labels):
+            if previous_label != label:
+                break
+            prefix += 1
+        self._minimize(prefix)
+        state = self._unchecked[-1][2] if self._unchecked else 0
+        for label in labels[prefix:]:
+            nxt = self._new_state()
+            self._arcs[state].append((label, nxt))
+            self._unchecked.append((state, label, nxt))
+            state = nxt
+        self._finals[state] = weight
+        self._previous = string
+        self._previous_labels = labels
+        self._strings += 1
+
+    def finish(self) -> ArrayTransducer:
+        """Minimize what remains and return the acceptor, with states numbered
+        breadth first from the start state 0 and arcs sorted on their labels"""
+        if self._result is not None:
+            return self._result
+        self._minimize(0)
+        numbering = {0: 0}
+        order = [0]
+        for state in order:
+            for _, nxt in self._arcs[state]:
+                if nxt not in numbering:
+                    numbering[nxt] = len(order)
+                    order.append(nxt)
+        offsets = np.zeros(len(order) + 1, dtype=np.int32)
+        finals = np.array([self._finals[s] for s in order], dtype=np.float32)
+        arcs = []
+        for i, state in enumerate(order):
+            state_arcs = sorted((label, numbering[nxt]) for label, nxt in self._arcs[state])
+            arcs += state_arcs
+            offsets[i + 1] = offsets[i] + len(state_arcs)
+        labels, nextstates = zip(*arcs) if arcs else ((), ())
+        labels = np.array(labels, dtype=np.uint8)
+        bounds = max_reachable_weights(len(order),
+                                       lambda s: nextstates[offsets[s]:offsets[s + 1]],
+                                       lambda s: finals[s])
+        self._result = ArrayTransducer(0, offsets, labels, labels,
+                                       np.array(nextstates, dtype=np.int32),
+                                       finals, np.array(bounds, dtype=np.float32))
+        self._finished = time.perf_counter()
+        # The working state is no longer needed
+        self._arcs = self._finals = self._register = None
+        return self._result
+
+    def stats(self) -> BuildStats:
+        """Strings added, states and arcs of the automaton so far, and seconds
+        spent from the first string to finishing (or to now)"""
+        if self._result is not None:
+            states, arcs = len(self._result.finals), len(self._result.ilabels)
+        else:
+            states = len(self._arcs) - len(self._free)
+            arcs = sum(len(a) for a in self._arcs if a is not None)
+        if self._started is None:
+            seconds = 0.0
+        else:
+            seconds = (self._finished or time.perf_counter()) - self._started
+        return BuildStats(self._strings, states, arcs, seconds)
+
+    def _new_state(self):
+        if self._free:
+            state = self._free.pop()
+            self._arcs[state] = []
+            self._finals[state] = INFINITY
+            return state
+        self._arcs.append([])
+        self._finals.append(INFINITY)
+        return len(self._arcs) - 1
+
+    def _minimize(self, down_to):
+        # Replace each unchecked state below down_to by an equivalent registered
+        # one, deepest first, so that its successors are already canonical
+        while len(self._unchecked) > down_to:
+            parent, label, child = self._unchecked.pop()
+            signature = (self._finals[child], tuple(self._arcs[child]))
+            existing = self._register.get(signature)
+            if existing is None:
+                self._register[signature] = child
+            else:
+                self._arcs[parent][-1] = (label, existing)
+                self._arcs[child] = None
+                self._free.append(child)
+
+
+def build_lexicon(strings: List[str], weights: List[float]) -> ArrayTransducer:
+    """Build the minimal acceptor of strings with weights, in any order
+
+    :raises ValueError: if a string is repeated or has a character outside the symbol table
+    """
+    builder = LexiconBuilder()
+    for string, weight in sorted(zip(strings, weights)):
+        builder.add(string, weight)
+    return builder.finish()
+
+
+def build_shards(strings: List[str], weights: List[float]) -> Dict[str, ArrayTransducer]:
+    """Build a minimal acceptor of the strings beginning with each character, in any order
+
+    Together the shards accept what build_lexicon's acceptor does; each is the
+    part of it reached by one arc from the start state.
+
+    :returns: the acceptors, by the first character of their strings
+    :raises ValueError: if a string is empty or repeated or has a character outside the symbol table
+    """
+    builders = {}
+    for string, weight in sorted(zip(strings, weights)):
+        if not string:
+            raise ValueError('Strings of a sharded lexicon must not be empty')
+        builders.setdefault(string[0], LexiconBuilder()).add(string, weight)
+    return {initial: builder.finish() for initial, builder in builders.items()}
+
+
+def write_text(acceptor: ArrayTransducer, path: str):
+    """Write an acceptor in OpenFst's text format, as fstprint would
+
+    :param acceptor: the acceptor, e.g. from LexiconBuilder.finish
+    :param path: destination of the text
+    """
+    # OpenFst takes the source of the first line as the start state, so it is printed first
+    order = [acceptor.start] + [s for s in range(len(acceptor.finals)) if s != acceptor.start]
+    with open(path, mode='w', encoding='ascii') as text_file:
+        for state in order:
+            for i in range(acceptor.offsets[state], acceptor.offsets[state + 1]):
+                text_file.write('{}\t{}\t{}\t{}\n'.format(state, acceptor.nextstates[i],
+                                                          acceptor.ilabels[i], acceptor.olabels[i]))
+            weight = float(acceptor.finals[state])
+            if weight != INFINITY:
+                text_file.write('{}\t{:.9g}\n'.format(state, weight))
@@ -0,0 +1,179 @@
+import functools
+import json
+import os
+import threading
+import time
+
+from typing import Callable
+from typing import Dict
+from typing import FrozenSet
+from typing import Iterator
+from typing import List
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from .array_transducer import ArrayTransducer
+from .cache import LRUCache
+from .symbol_table import REVERSE_SYMBOL_TABLE
+
+
+SHARD_MANIFEST_FILE = 'manifest.json'
+# Longest romaji prefix followed in search of a first reading character;
+# past it, a prefix may begin a reading with any character
+MAX_ROUTE_PREFIX = 4
+
+
+class ShardStats(NamedTuple):
+    shards: int
+    loaded: int
+    hits: int
+    loads: int
+    evictions: int
+    load_seconds: float
+
+
+class ShardedLexicon():
+    """The composed transducer in pieces, one per first character of the
+    lexicon's readings, each composed the first time an input needs it
+
+    Each reading begins with one character, so the readings of an input are
+    all in the pieces for the characters its first syllable can be read as,
+    and their union is what the whole transducer would give. Past max_loaded
+    pieces, the least recently used is dropped, to be composed again if needed.
+
+    :param sources: for each first character, a function returning the
+        acceptor of the readings beginning with it
+    :param routes: the first characters of the readings each romaji prefix can
+        begin, as initial_routes gives them
+    :param compose: makes a piece from an acceptor
+    :param max_loaded: most pieces held at once; by default all of them
+    """
+
+    def __init__(self,
+                 sources: Mapping[str, Callable[[], ArrayTransducer]],
+                 routes: Mapping[str, Optional[FrozenSet[str]]],
+                 compose: Callable[[ArrayTransducer], object],
+                 max_loaded: Optional[int] = None):
+        self._sources = dict(sources)
+        self._routes = {prefix: frozenset(self._sources) if initials is None else initials & self._sources.keys()
+                        for prefix, initials in routes.items()}
+        self._longest_route = max(map(len, self._routes), default=0)
+        self._compose = compose
+        self._loaded = LRUCache(max_loaded if max_loaded is not None else max(len(self._sources), 1))
+        # One per piece, held while composing it, so that a piece is never
+        # composed twice at once while the others can still be looked up
+        self._piece_locks = {initial: threading.Lock() for initial in self._sources}
+        # Guards the counts below
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._loads = 0
+        self._load_seconds = 0.0
+
+    def initials(self, normalized: str) -> List[str]:
+        """The first characters of the pieces that can have readings of normalized romaji"""
+        initials = set()
+        for i in range(min(len(normalized), self._longest_route) + 1):
+            initials.update(self._routes.get(normalized[:i], ()))
+        return sorted(initials)
+
+    def pieces(self, normalized: str) -> Iterator:
+        """The pieces that can have readings of normalized romaji, composing those not held"""
+        for initial in self.initials(normalized):
+            yield self.piece(initial)
+
+    def piece(self, initial: str):
+        """The piece for readings beginning with initial, composing it if it is not held"""
+        piece = self._loaded.get(initial)
+        if piece is None:
+            with self._piece_locks[initial]:
+                # Another thread may have composed it while this one waited
+                piece = self._loaded.get(initial)
+                if piece is None:
+                    started = time.perf_counter()
+                    piece = self._compose(self._sources[initial]())
+                    load_seconds = time.perf_counter() - started
+                    self._loaded.put(initial, piece)
+                    with self._lock:
+                        self._loads += 1
+                        self._load_seconds += load_seconds
+                    return piece
+        with self._lock:
+            self._hits += 1
+        return piece
+
+    def load_all(self):
+        """Compose every piece, as far as max_loaded allows"""
+        for initial in sorted(self._sources):
+            self.piece(initial)
+
+    def stats(self) -> ShardStats:
+        """Pieces in all and held now, lookups of a piece that found it held
+        (hits) or composed it (loads), pieces dropped, and seconds spent composing"""
+        cache_stats = self._loaded.stats()
+        with self._lock:
+            return ShardStats(len(self._sources), cache_stats.size, self._hits, self._loads,
+                              cache_stats.evictions, self._load_seconds)
+
+
+def initial_routes(transliterator) -> Dict[str, Optional[FrozenSet[str]]]:
+    """Find the first output character of every path through a transducer,
+    and the input read before it
+
+    :param transliterator: an OpenFst transducer from romaji to katakana
+    :returns: for each romaji prefix, the characters a path reading it can
+        emit first, or None where MAX_ROUTE_PREFIX characters were read
+        without one being emitted
+    """
+    routes = {}
+    seen = set()
+    stack = [(transliterator.start(), '')]
+    while stack:
+        state, prefix = stack.pop()
+        if (state, prefix) in seen:
+            continue
+        seen.add((state, prefix))
+        for a in transliterator.arcs(state):
+            read = prefix + REVERSE_SYMBOL_TABLE[a.ilabel] if a.ilabel else prefix
+            if a.olabel:
+                if routes.setdefault(read, set()) is not None:
+                    routes[read].add(REVERSE_SYMBOL_TABLE[a.olabel])
+            elif len(read) >= MAX_ROUTE_PREFIX:
+                routes[read] = None
+            else:
+                stack.append((a.nextstate, read))
+    return {prefix: None if initials is None else frozenset(initials) for prefix, initials in routes.items()}
+
+
+def write_shards(shards: Mapping[str, ArrayTransducer], directory: str, manifest: Mapping):
+    """Write acceptors by first character into a directory, one array file each
+
+    :param shards: the acceptors, e.g. from lexicon_builder.build_shards
+    :param directory: where to write them, created if need be
+    :param manifest: written alongside, e.g. to recognize stale shards by
+    """
+    os.makedirs(directory, exist_ok=True)
+    # Files are named for the character's code point, to keep their names ASCII
+    files = {initial: '{:04x}.bin'.format(ord(initial)) for initial in shards}
+    for initial, acceptor in shards.items():
+        acceptor.save(os.path.join(directory, files[initial]))
+    with open(os.path.join(directory, SHARD_MANIFEST_FILE), mode='w') as manifest_file:
+        json.dump({**manifest, 'shards': files}, manifest_file, indent=2, sort_keys=True)
+
+
+def load_shard_sources(directory: str) -> Tuple[dict, Dict[str, Callable[[], ArrayTransducer]]]:
+    """Read the manifest of shards written by write_shards, leaving the shards themselves unread
+
+    :param directory: where the shards were written
+    :returns: the manifest, and for each first character a function reading its acceptor
+    :raises OSError: if there is no manifest
+    :raises ValueError: if the manifest is not valid JSON or names no shards
+    """
+    with open(os.path.join(directory, SHARD_MANIFEST_FILE)) as manifest_file:
+        manifest = json.load(manifest_file)
+    files = manifest.pop('shards', None)
+    if not isinstance(files, dict):
+        raise ValueError('{} names no shards'.format(directory))
+    return manifest, {initial: functools.partial(ArrayTransducer.load, os.path.join(directory, name))
+                      for initial, name in files.items()}
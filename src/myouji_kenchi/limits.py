@@ -0,0 +1,96 @@
+import threading
+import time
+
+from collections import Counter
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import NamedTuple
+from typing import Optional
+from typing import TypeVar
+
+
+T = TypeVar('T')
+
+
+class LimitExceeded(Exception):
+    """A lookup went over one of its LookupLimits
+
+    :ivar limit: the name of the limit: 'length', 'states', 'paths' or 'deadline'
+    """
+
+    def __init__(self, limit: str):
+        super().__init__('Lookup exceeded its {} limit'.format(limit))
+        self.limit = limit
+
+
+class LookupLimits(NamedTuple):
+    """Bounds on the work a single lookup may do
+
+    :ivar max_length: longest normalized input looked up
+    :ivar max_states: most states in the composed lattice (fst engine), or
+        paths alive at any point of the walk (array engine)
+    :ivar max_paths: most complete paths enumerated, before duplicate
+        readings are removed
+    :ivar deadline: most seconds spent, checked between stages and as paths
+        are enumerated, so a single composition can overrun it
+    """
+    max_length: Optional[int] = None
+    max_states: Optional[int] = None
+    max_paths: Optional[int] = None
+    deadline: Optional[float] = None
+
+    def start(self, input_length: int) -> 'LookupGuard':
+        """Begin guarding a lookup of a normalized input this long
+
+        :raises LimitExceeded: if the input is too long
+        """
+        if self.max_length is not None and input_length > self.max_length:
+            raise LimitExceeded('length')
+        return LookupGuard(self)
+
+
+class LookupGuard():
+    """Checks one lookup against its LookupLimits, raising LimitExceeded"""
+
+    def __init__(self, limits: LookupLimits):
+        self._max_states = limits.max_states
+        self._max_paths = limits.max_paths
+        self._expires = time.perf_counter() + limits.deadline if limits.deadline is not None else None
+
+    def check_states(self, num_states: int):
+        if self._max_states is not None and num_states > self._max_states:
+            raise LimitExceeded('states')
+        self.check_deadline()
+
+    def check_deadline(self):
+        if self._expires is not None and time.perf_counter() > self._expires:
+            raise LimitExceeded('deadline')
+
+    def count_paths(self, paths: Iterable[T]) -> Iterator[T]:
+        """Pass paths through, checking the path limit and deadline at each"""
+        max_paths = self._max_paths if self._max_paths is not None else float('inf')
+        for count, path in enumerate(paths, start=1):
+            if count > max_paths:
+                raise LimitExceeded('paths')
+            self.check_deadline()
+            yield path
+
+
+class LimitStats(NamedTuple):
+    tripped: int
+    tripped_by_limit: Dict[str, int]
+
+
+class LimitCounter():
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tripped = Counter()
+
+    def record(self, limit: str):
+        with self._lock:
+            self._tripped[limit] += 1
+
+    def stats(self) -> LimitStats:
+        with self._lock:
+            return LimitStats(sum(self._tripped.values()), dict(self._tripped))
@@ -0,0 +1,127 @@
+import heapq
+import threading
+
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from .array_transducer import ArrayTransducer, is_array_file
+from .search import INFINITY
+from .symbol_table import SYMBOL_TABLE, REVERSE_SYMBOL_TABLE
+
+
+class IndexStats(NamedTuple):
+    readings: int
+    size: int
+    hits: int
+    misses: int
+
+
+class RomajiIndex():
+    """Precomputed back transliteration results for the romanizations of the
+    most frequent surnames, keyed on normalized romaji"""
+
+    def __init__(self, entries: Dict[str, Tuple[Tuple[str, float], ...]], readings: int):
+        self._entries = entries
+        self._readings = readings
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def build(cls,
+              arrays,
+              readings: Iterable[str],
+              lookup: Callable[[str], List[Tuple[str, float]]]) -> 'RomajiIndex':
+        """Index every romanization of the given readings
+
+        The romanizations are found by running the transducer in reverse, and
+        each is then looked up in full, so that the index holds all of its
+        readings and not only those it was generated from.
+
+        :param arrays: an ArrayTransducer of the composed transducer
+        :param readings: the katakana readings to cover
+        :param lookup: full, sorted back transliteration of normalized romaji
+        """
+        romajis = set()
+        num_readings = 0
+        for reading in readings:
+            num_readings += 1
+            for inputs in arrays.iter_inputs([SYMBOL_TABLE[c] for c in reading]):
+                romajis.add(''.join(REVERSE_SYMBOL_TABLE[i] for i in inputs))
+        return cls({romaji: tuple(lookup(romaji)) for romaji in romajis}, num_readings)
+
+    def get(self, normalized: str) -> Optional[Tuple[Tuple[str, float], ...]]:
+        results = self._entries.get(normalized)
+        with self._lock:
+            if results is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return results
+
+    def discard(self, normalized: Iterable[str]):
+        """Drop the entries for these inputs, leaving them to a lookup"""
+        with self._lock:
+            entries = dict(self._entries)
+            for key in normalized:
+                entries.pop(key, None)
+            self._entries = entries
+
+    def stats(self) -> IndexStats:
+        with self._lock:
+            return IndexStats(self._readings, len(self._entries), self._hits, self._misses)
+
+
+def lexicon_entries(acceptor_path: str) -> Iterator[Tuple[str, float]]:
+    """Read the (reading, frequency score) pairs of the lexical acceptor
+
+    Text is parsed directly, rather than compiled with OpenFst, as only the strings are needed.
+
+    :param acceptor_path: path to the lexical acceptor, as OpenFst text or in the array file format
+    """
+    if is_array_file(acceptor_path):
+        yield from _array_lexicon_entries(ArrayTransducer.load(acceptor_path, mmap=False))
+        return
+    arcs = {}
+    finals = {}
+    start = None
+    with open(acceptor_path, encoding='ascii') as acceptor_file:
+        for line in acceptor_file:
+            fields = line.split()
+            if len(fields) >= 4:
+                source = int(fields[0])
+                if start is None:
+                    # The first line of an OpenFst text file is an arc from the start state
+                    start = source
+                arcs.setdefault(source, []).append((int(fields[2]), int(fields[1])))
+            elif fields:
+                finals[int(fields[0])] = float(fields[1]) if len(fields) > 1 else 0.0
+    if start is None:
+        return
+    stack = [(start, '')]
+    while stack:
+        state, reading = stack.pop()
+        if state in finals:
+            yield reading, finals[state]
+        stack += [(nxt, reading + REVERSE_SYMBOL_TABLE[label]) for label, nxt in arcs.get(state, [])]
+
+
+def _array_lexicon_entries(arrays):
+    stack = [(arrays.start, '')]
+    while stack:
+        state, reading = stack.pop()
+        if arrays.finals[state] != INFINITY:
+            yield reading, float(arrays.finals[state])
+        stack += [(int(arrays.nextstates[i]), reading + REVERSE_SYMBOL_TABLE[arrays.olabels[i]])
+                  for i in range(arrays.offsets[state], arrays.offsets[state + 1])]
+
+
+def most_frequent_readings(acceptor_path: str, size: int) -> List[str]:
+    """The size readings of the lexicon with the highest frequency scores"""
+    return [reading for reading, _ in heapq.nlargest(size, lexicon_entries(acceptor_path), key=lambda e: e[1])]
@@ -0,0 +1,81 @@
+import heapq
+
+from typing import Callable
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+
+INFINITY = float('inf')
+
+
+def max_reachable_weights(num_states: int,
+                          next_states: Callable[[int], Iterable[int]],
+                          final_weight: Callable[[int], float]) -> List[float]:
+    """For each state of an acyclic machine, the greatest final weight reachable from it
+
+    Non-final states have a final weight of infinity (the tropical Zero); the
+    result is -infinity for states from which no final state can be reached.
+
+    :param num_states: number of states, numbered from 0
+    :param next_states: the states each state has arcs to
+    :param final_weight: the final weight of each state
+    :returns: the bound for each state
+    :raises ValueError: if the machine has a cycle
+    """
+    bounds = [None] * num_states
+    on_stack = set()
+    for root in range(num_states):
+        if bounds[root] is not None:
+            continue
+        # Iterative post-order traversal, as paths can be far longer than the recursion limit
+        stack = [(root, iter(next_states(root)))]
+        on_stack.add(root)
+        bounds[root] = _own_weight(final_weight(root))
+        while stack:
+            state, successors = stack[-1]
+            for nxt in successors:
+                if nxt in on_stack:
+                    raise ValueError('Machine has a cycle through state {}'.format(nxt))
+                if bounds[nxt] is None:
+                    bounds[nxt] = _own_weight(final_weight(nxt))
+                    stack.append((nxt, iter(next_states(nxt))))
+                    on_stack.add(nxt)
+                    break
+                bounds[state] = max(bounds[state], bounds[nxt])
+            else:
+                stack.pop()
+                on_stack.discard(state)
+                if stack:
+                    parent = stack[-1][0]
+                    bounds[parent] = max(bounds[parent], bounds[state])
+    return bounds
+
+
+def best_emissions(emissions: Iterable[Tuple[Sequence[int], float]],
+                   k: Optional[int] = None,
+                   min_score: Optional[float] = None) -> List[Tuple[Sequence[int], float]]:
+    """Select the k highest weighted emissions and/or those weighted at least min_score
+
+    Emissions tied with the k-th best are all kept, leaving the caller to break ties.
+
+    :param emissions: (interned emission symbols, weight) tuples
+    :param k: number of emissions wanted
+    :param min_score: lowest weight wanted
+    :returns: the selected emissions, in no particular order
+    """
+    if min_score is not None:
+        emissions = [e for e in emissions if e[1] >= min_score]
+    if k is None:
+        return list(emissions)
+    emissions = list(emissions)
+    if len(emissions) <= k:
+        return emissions
+    threshold = heapq.nlargest(k, (e[1] for e in emissions))[-1]
+    return [e for e in emissions if e[1] >= threshold]
+
+
+def _own_weight(weight):
+    return -INFINITY if weight == INFINITY else weight
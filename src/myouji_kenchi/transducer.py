@@ -1,43 +1,716 @@
-import numpy as np
-
-import pywrapfst as fst
-import pkg_resources
+import contextlib
+import functools
+import hashlib
+import itertools
+import json
+import os
+import threading
 import unicodedata
+import warnings
 
-from pywrapfst import Arc
+from importlib import resources
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
 from typing import Tuple
 
+from .array_transducer import ArrayTransducer, is_array_file
+from .cache import CacheStats, LRUCache, PersistentCache
+from .input_filter import FilterStats, InputFilter
+from .instrumentation import NO_TRACE, LookupTrace
+from .limits import LimitCounter, LimitExceeded, LimitStats, LookupGuard, LookupLimits
+from .lazy import LazyModule
+from .lexicon_builder import build_lexicon, build_shards
+from .lexicon_shards import ShardedLexicon, ShardStats, initial_routes, load_shard_sources, write_shards
+from .romaji_index import IndexStats, RomajiIndex, lexicon_entries, most_frequent_readings
+from .search import INFINITY, best_emissions
 from .symbol_table import SYMBOL_TABLE, REVERSE_SYMBOL_TABLE, EPSILON
 
 
-LEXICAL_FREQUENCY_FST_FILE = pkg_resources.resource_filename('myouji_kenchi',
-                                                             'data/lexical_data_fst.txt')
+# OpenFst is only needed to compose at startup and by the fst engine
+fst = LazyModule('pywrapfst')
 
 
-class MyoujiBackTransliteration():
-    def __init__(self):
-        transliterator = _build_transliterator()
-        acceptor = _build_attested_acceptor()
-        self._transducer = fst.compose(transliterator, acceptor)
+def _data_path(name):
+    return str(resources.files('myouji_kenchi') / 'data' / name)
+
+
+LEXICAL_FREQUENCY_FST_FILE = _data_path('lexical_data_fst.txt')
+COMPILED_TRANSDUCER_FILE = _data_path('composed_transducer.fst')
+COMPILED_ARRAY_TRANSDUCER_FILE = _data_path('composed_transducer.bin')
+COMPILED_INPUT_FILTER_FILE = _data_path('input_filter.json')
+COMPILED_TRANSDUCER_MANIFEST_FILE = _data_path('composed_transducer.json')
+LEXICON_SHARDS_DIR = _data_path('lexicon_shards')
+
+# Bump whenever the layout of the compiled transducer artifact changes
+COMPILED_TRANSDUCER_FORMAT_VERSION = 6
+
+# Above this many states, a lookup lattice is searched rather than enumerated
+SMALL_LATTICE_STATES = 64
+# Entries kept by a persistent cache when cache_size is not given
+PERSISTENT_CACHE_SIZE = 1000000
 
-    def back_transliterate(self, romaji: str) -> List[Tuple[str, float]]:
+ENGINES = ('fst', 'array')
+SHARD_MODES = ('lazy', 'all')
+
+
+class MyoujiBackTransliteration():
+    def __init__(self,
+                 precompiled=True,
+                 cache_size=None,
+                 engine='fst',
+                 prefilter=True,
+                 index_size=None,
+                 on_lookup: Optional[Callable[[LookupTrace], None]] = None,
+                 limits: Optional[LookupLimits] = None,
+                 extra_lexicon: Optional[Mapping[str, float]] = None,
+                 cache_path: Optional[str] = None,
+                 lexicon_shards: Optional[str] = None,
+                 max_shards: Optional[int] = None):
+        """
+        :param precompiled: load the shipped compiled transducer if it is up to
+            date, rather than compiling the lexicon text and composing at startup
+        :param cache_size: if given, keep the results for this many normalized
+            inputs in an LRU cache
+        :param engine: 'fst' to look up with OpenFst composition, or 'array' to
+            walk a flat array copy of the transducer in Python; the compiled
+            copy is memory-mapped, so processes on a host share it
+        :param prefilter: reject romaji the transducer cannot accept (e.g.
+            most foreign names) with cheap checks before looking them up
+        :param index_size: if given, precompute the results for every
+            romanization of this many of the most frequent surnames at startup,
+            answering those inputs without a lookup
+        :param on_lookup: if given, time the stages of each back_transliterate
+            call and pass the LookupTrace to this, e.g. a TraceAggregator
+        :param limits: if given, bound the work of each lookup; one that goes
+            over returns no readings (a score of 0) rather than raising, is
+            not cached, and is counted in limit_stats
+        :param extra_lexicon: katakana readings and frequency scores to add to
+            the lexicon, or to replace the scores of readings already in it;
+            see add_surnames
+        :param cache_path: if given, keep results in an SQLite file here rather
+            than in memory, shared by every process using the file and across
+            restarts; cache_size entries are kept (a million by default), and
+            entries are only read back by a transliterator with the same
+            lexicon and additions to it
+        :param lexicon_shards: 'lazy' to compose the lexicon with the
+            transliterator in shards, one for each first katakana of its
+            readings, as inputs first need them, rather than loading the whole
+            compiled transducer; or 'all' to compose every shard at startup.
+            The shipped shards are read if precompiled is set and they are up
+            to date, else the lexicon text. The prefilter is only used if its
+            compiled copy is up to date, and index_size cannot be given
+        :param max_shards: in lazy mode, if given, the most composed shards to
+            keep, dropping the least recently used; an input needs up to seven,
+            and varied inputs need them all, so a low bound trades lookup
+            time for memory
+        """
+        if engine not in ENGINES:
+            raise ValueError('engine must be one of {}'.format(', '.join(ENGINES)))
+        if lexicon_shards is not None and lexicon_shards not in SHARD_MODES:
+            raise ValueError('lexicon_shards must be one of {}'.format(', '.join(SHARD_MODES)))
+        if lexicon_shards is not None and index_size:
+            raise ValueError('index_size cannot be given with lexicon_shards')
+        self._engine = engine
+        self._on_lookup = on_lookup
+        self._limits = limits
+        self._limit_counter = LimitCounter() if limits is not None else None
+        self._transliterator = None
+        self._shards = None
+        if lexicon_shards is not None:
+            self._transliterator = _build_transliterator()
+            self._shards = ShardedLexicon(_load_lexicon_shard_sources() if precompiled else _lexicon_shard_sources(),
+                                          initial_routes(self._transliterator),
+                                          self._compose_shard,
+                                          None if lexicon_shards == 'all' else max_shards)
+            if lexicon_shards == 'all':
+                self._shards.load_all()
+            self._iter_valid_strings = self._sharded_iter_valid_strings
+            self._best_valid_strings = self._sharded_best_valid_strings
+        elif engine == 'array':
+            self._arrays = _load_compiled_array_transducer() if precompiled else None
+            if self._arrays is None:
+                self._arrays = ArrayTransducer.from_fst(build_transducer())
+            self._iter_valid_strings = self._arrays.iter_valid_strings
+            self._best_valid_strings = self._arrays.best_valid_strings
+        else:
+            self._transducer = _load_compiled_transducer() if precompiled else None
+            if self._transducer is None:
+                self._transducer = build_transducer()
+            self._iter_valid_strings = self._fst_iter_valid_strings
+            self._best_valid_strings = self._fst_best_valid_strings
+        self._precompiled = precompiled
+        self._span_arrays = None
+        if cache_path is not None:
+            self._cache = PersistentCache(cache_path, cache_size or PERSISTENT_CACHE_SIZE, _cache_namespace({}))
+        else:
+            self._cache = LRUCache(cache_size) if cache_size else None
+        self._filter = None
+        if prefilter:
+            self._filter = _load_compiled_input_filter() if precompiled else None
+            if self._filter is None and self._shards is None:
+                self._filter = InputFilter.from_array_transducer(self._array_transducer(engine, precompiled))
+        self._index = None
+        self._overlay = None
+        self._overlay_lock = threading.Lock()
+        if extra_lexicon:
+            self.add_surnames(extra_lexicon)
+        if index_size:
+            self._index = RomajiIndex.build(self._array_transducer(engine, precompiled),
+                                            most_frequent_readings(LEXICAL_FREQUENCY_FST_FILE, index_size),
+                                            lambda romaji: self._lookup(romaji, None, None))
+
+    def back_transliterate(self,
+                           romaji: str,
+                           k: Optional[int] = None,
+                           min_score: Optional[float] = None) -> List[Tuple[str, float]]:
         """Back transliterate romaji to candidate myouji readings and frequency scores
 
+        Passing k or min_score prunes the search instead of enumerating every
+        reading and filtering afterwards.
+
+        :param romaji: romaji to back transliterate
+        :param k: if given, only return the k highest scoring readings
+        :param min_score: if given, only return readings scoring at least this
+        :returns: tuples of possible readings and frequency scores, in ascending order of score
+        """
+        if self._on_lookup is None:
+            return self._back_transliterate_normalized(normalize(romaji), k, min_score)
+        trace = LookupTrace(romaji, k, min_score, self._engine)
+        normalized = normalize(romaji)
+        trace.normalized = normalized
+        trace.input_length = len(normalized)
+        trace.mark('normalize')
+        results = self._back_transliterate_normalized(normalized, k, min_score, trace)
+        self._on_lookup(trace)
+        return results
+
+    def back_transliterate_many(self,
+                                romajis: Iterable[str],
+                                k: Optional[int] = None,
+                                min_score: Optional[float] = None) -> List[List[Tuple[str, float]]]:
+        """Back transliterate many romaji strings, looking up each distinct
+        normalized string only once
+
+        :param romajis: romaji to back transliterate
+        :param k: as for back_transliterate
+        :param min_score: as for back_transliterate
+        :returns: for each input, in order, the result of back_transliterate
+        """
+        if self._on_lookup is not None:
+            # Traced one by one, so that each input gets its own trace
+            return [self.back_transliterate(romaji, k, min_score) for romaji in romajis]
+        normalized = [normalize(romaji) for romaji in romajis]
+        unique = set(normalized)
+        with self._cache_batch([(n, k, min_score) for n in unique]):
+            results = {n: self._back_transliterate_normalized(n, k, min_score) for n in unique}
+        return [list(results[n]) for n in normalized]
+
+    def iter_back_transliterate(self, romaji: str) -> Iterator[Tuple[str, float]]:
+        """Lazily back transliterate romaji, so callers can stop early
+
+        Yields the same readings and scores as back_transliterate, but in no
+        particular order, each one de-interned only when it is reached. The
+        lookup is limited as back_transliterate's are, checking the path limit
+        and deadline as each path is reached; a limit tripped partway ends the
+        iteration there. Results are cached once every one has been yielded.
+
         :param romaji: romaji to back transliterate
-        :returns: tuples of possible readings and frequency scores
+        :returns: an iterator of (reading, frequency score) tuples
+        """
+        normalized = normalize(romaji)
+        if self._filter is not None and self._filter.check(normalized) is not None:
+            return
+        key = (normalized, None, None)
+        if self._cache is not None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                yield from cached
+                return
+        results = []
+        try:
+            guard = self._limits.start(len(normalized)) if self._limits is not None else None
+            if self._overlay is not None and self._overlay.lookup(normalized, guard):
+                results = self._lookup(normalized, None, None, guard)
+                yield from results
+            else:
+                try:
+                    interned_results = self._iter_valid_strings(normalized, guard)
+                except ValueError:
+                    return
+                for result in _deintern_results(interned_results):
+                    results.append(result)
+                    yield result
+        except LimitExceeded as e:
+            self._limit_counter.record(e.limit)
+            return
+        if self._cache is not None:
+            self._cache.put(key, tuple(sorted(results, key=lambda x: (x[1], x[0]))))
+
+    def best_score(self, romaji: str) -> float:
+        """The highest frequency score of any reading of romaji, or 0 if there is none
+
+        :param romaji: romaji to score
+        """
+        results = self.back_transliterate(romaji, k=1)
+        return results[-1][1] if results else 0
+
+    def add_surnames(self, entries: Mapping[str, float]):
+        """Add readings to the lexicon, or replace the scores of readings already in it
+
+        The additions are kept in an overlay, composed with the transliterator
+        apart from the base lexicon, so each call costs time in proportion to
+        the readings added so far rather than to the whole lexicon. Where a
+        reading is in both, the overlay's score is used.
+
+        :param entries: katakana readings and their frequency scores
+        :raises ValueError: if a reading is not katakana or a score is not positive and finite
+        """
+        entries = dict(entries)
+        for reading, score in entries.items():
+            if not reading or not all(c in SYMBOL_TABLE and 'ァ' <= c <= 'ヺ' for c in reading):
+                raise ValueError('Reading {!r} is not katakana'.format(reading))
+            if not 0 < score < INFINITY:
+                raise ValueError('Score of {!r} must be positive and finite'.format(reading))
+        if not entries:
+            return
+        with self._overlay_lock:
+            if self._transliterator is None:
+                self._transliterator = _build_transliterator()
+            merged = dict(self._overlay.entries) if self._overlay is not None else {}
+            merged.update(entries)
+            overlay = _build_overlay(self._transliterator, merged)
+            if self._filter is not None:
+                self._filter = self._filter.union(overlay.filter)
+            self._overlay = overlay
+        if self._index is not None:
+            # Results for any input the new readings can be spelled as have changed
+            self._index.discard(''.join(REVERSE_SYMBOL_TABLE[i] for i in inputs)
+                                for reading in entries
+                                for inputs in overlay.arrays.iter_inputs([SYMBOL_TABLE[c] for c in reading]))
+        if isinstance(self._cache, PersistentCache):
+            # Other processes may still be using the entries of the old lexicon
+            self._cache.namespace = _cache_namespace(overlay.entries)
+        elif self._cache is not None:
+            self._cache.clear()
+
+    def span_scores(self, parts: Sequence[str], spans: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], float]:
+        """The best_score of each of several spans of romaji, found in a single walk over it
+
+        Lookups are not cached, indexed or limited by length, as each input is
+        a whole full name rather than a surname.
+
+        :param parts: romaji, in pieces that spans begin and end between
+        :param spans: (i, j) pairs, standing for the romaji of parts[i:j]
+        :returns: the score of each span, 0 if it has no reading
         """
-        # It is convenient to match on COMBINING MACRON and COMBINING CIRCUMFLEX
-        # separately from their vowels
-        normalized = unicodedata.normalize('NFKD', romaji).lower()
+        pieces = [normalize(part) for part in parts]
+        positions = list(itertools.accumulate((len(piece) for piece in pieces), initial=0))
+        spans_at = {}
+        for i, j in spans:
+            spans_at.setdefault((positions[i], positions[j]), []).append((i, j))
+        guard = self._limits.start(0) if self._limits is not None else None
+        normalized = ''.join(pieces)
+        readings = {}
+        overlay = self._overlay
+        try:
+            for span, output, weight in self._arrays_for_spans().iter_spans(normalized, spans_at, guard):
+                readings.setdefault(span, {})[output] = weight
+            if overlay is not None:
+                # As in _lookup, the overlay's scores replace the base scores
+                for span, output, weight in overlay.arrays.iter_spans(normalized, spans_at, guard):
+                    readings.setdefault(span, {})[output] = weight
+        except LimitExceeded as e:
+            self._limit_counter.record(e.limit)
+            readings = {}
+        scores = {(i, j): 0 for i, j in spans}
+        for position_span, outputs in readings.items():
+            for span in spans_at[position_span]:
+                scores[span] = max(outputs.values())
+        return scores
+
+    def cache_stats(self) -> Optional[CacheStats]:
+        """Statistics of the result cache, or None if caching is disabled"""
+        return self._cache.stats() if self._cache is not None else None
+
+    def filter_stats(self) -> Optional[FilterStats]:
+        """How many inputs the prefilter checked and rejected (by reason), or
+        None if prefiltering is disabled"""
+        return self._filter.stats() if self._filter is not None else None
+
+    def index_stats(self) -> Optional[IndexStats]:
+        """The size of the precomputed index and how many inputs it answered
+        (hits) or left to a lookup (misses), or None if there is no index"""
+        return self._index.stats() if self._index is not None else None
+
+    def limit_stats(self) -> Optional[LimitStats]:
+        """How many lookups went over their limits (by limit), or None if
+        lookups are not limited"""
+        return self._limit_counter.stats() if self._limit_counter is not None else None
+
+    def shard_stats(self) -> Optional[ShardStats]:
+        """How many lexicon shards there are and are composed, and the time
+        spent composing them, or None if the lexicon is not sharded"""
+        return self._shards.stats() if self._shards is not None else None
+
+    def _back_transliterate_normalized(self, normalized, k=None, min_score=None, trace=NO_TRACE):
+        # Each stage is marked on the trace as it ends, and how the call was
+        # answered is recorded by finish; untraced, both do nothing
+        if k is not None and k < 0:
+            raise ValueError('k must not be negative')
+        # Rejected before the cache, so that foreign names do not crowd it
+        if self._filter is not None:
+            rejected = self._filter.check(normalized) is not None
+            trace.mark('prefilter')
+            if rejected:
+                trace.finish('rejected', 0)
+                return []
+        if self._index is not None:
+            indexed = self._index.get(normalized)
+            trace.mark('index')
+            if indexed is not None:
+                results = _select(indexed, k, min_score)
+                trace.finish('index', len(results))
+                return results
+        try:
+            if self._cache is None:
+                results = self._guarded_lookup(normalized, k, min_score, trace)
+            else:
+                key = (normalized, k, min_score)
+                cached = self._cache.get(key)
+                trace.mark('cache')
+                if cached is not None:
+                    trace.finish('cache', len(cached))
+                    return list(cached)
+                results = self._guarded_lookup(normalized, k, min_score, trace)
+                self._cache.put(key, tuple(results))
+        except LimitExceeded as e:
+            self._limit_counter.record(e.limit)
+            trace.finish('limited', 0)
+            return []
+        trace.finish('lookup', len(results))
+        return results
+
+    def _guarded_lookup(self, normalized, k, min_score, trace=NO_TRACE):
+        guard = self._limits.start(len(normalized)) if self._limits is not None else None
+        return self._lookup(normalized, k, min_score, guard, trace)
+
+    def _lookup(self, normalized, k, min_score, guard=None, trace=NO_TRACE):
+        overlay = self._overlay
+        if overlay is not None:
+            overlay_results = overlay.lookup(normalized, guard)
+            trace.mark('overlay')
+            if overlay_results:
+                # The overlay may lower a base reading's score, so k and
+                # min_score can only be applied once the two are merged
+                results = dict(self._base_lookup(normalized, None, None, guard, trace))
+                results.update(overlay_results)
+                results = _select(sorted(results.items(), key=lambda x: (x[1], x[0])), k, min_score)
+                trace.mark('overlay')
+                return results
+        return self._base_lookup(normalized, k, min_score, guard, trace)
+
+    def _base_lookup(self, normalized, k, min_score, guard=None, trace=NO_TRACE):
+        if k == 0:
+            return []
         try:
-            input_fst = _make_input_fst(normalized)
+            if k is None and min_score is None:
+                interned_results = list(self._iter_valid_strings(normalized, guard, trace))
+            else:
+                interned_results = self._best_valid_strings(normalized, k, min_score, guard, trace)
         except ValueError:
             return []
-        result_fst = fst.compose(input_fst, self._transducer)
-        interned_results = _all_valid_strings(result_fst)
-        deinterned_results = [(_deintern_tokens(ts[0]), ts[1]) for ts in interned_results]
-        return sorted(deinterned_results, key=lambda x: x[1])
+        trace.candidates = len(interned_results)
+        trace.mark('search')
+        # Break ties on the reading so the order does not depend on the shape of the transducer
+        results = sorted(_deintern_results(interned_results), key=lambda x: (x[1], x[0]))
+        results = results[-k:] if k is not None else results
+        trace.mark('deintern_sort')
+        return results
+
+    def _array_transducer(self, engine, precompiled):
+        # The array form also backs the prefilter and index for the fst engine,
+        # and span lookups for a sharded lexicon
+        if engine == 'array' and self._shards is None:
+            return self._arrays
+        arrays = _load_compiled_array_transducer() if precompiled else None
+        if arrays is None:
+            arrays = ArrayTransducer.from_fst(self._transducer if self._shards is None else build_transducer())
+        return arrays
+
+    def _cache_batch(self, keys):
+        # A persistent cache reads the batch's entries in one query, and writes in one transaction
+        if isinstance(self._cache, PersistentCache):
+            return self._cache.batch(keys)
+        return contextlib.nullcontext()
+
+    def _arrays_for_spans(self):
+        # Span lookups walk the array form whichever the engine, loading it for
+        # the fst engine on first use
+        if self._engine == 'array' and self._shards is None:
+            return self._arrays
+        if self._span_arrays is None:
+            with self._overlay_lock:
+                if self._span_arrays is None:
+                    self._span_arrays = self._array_transducer(self._engine, self._precompiled)
+        return self._span_arrays
+
+    def _sharded_iter_valid_strings(self, normalized, guard=None, trace=NO_TRACE):
+        # Readings in different shards begin differently, so their results never overlap
+        results = []
+        for piece in self._shards.pieces(normalized):
+            if self._engine == 'array':
+                results += piece.iter_valid_strings(normalized, guard)
+            else:
+                results += _iter_valid_strings(self._fst_compose(normalized, guard, piece), guard)
+        trace.mark('shards')
+        return results
+
+    def _sharded_best_valid_strings(self, normalized, k, min_score, guard=None, trace=NO_TRACE):
+        # Each shard's best are found apart, and _base_lookup keeps the k best of them all
+        results = []
+        for piece in self._shards.pieces(normalized):
+            if self._engine == 'array':
+                results += piece.best_valid_strings(normalized, k, min_score, guard)
+            else:
+                results += _best_valid_strings(self._fst_compose(normalized, guard, piece), k, min_score, guard)
+        trace.mark('shards')
+        return results
+
+    def _compose_shard(self, acceptor):
+        acceptor = _fst_from_arrays(acceptor)
+        acceptor.arcsort('ilabel')
+        td = _compose_lexicon(self._transliterator, acceptor)
+        return ArrayTransducer.from_fst(td) if self._engine == 'array' else td
+
+    def _fst_iter_valid_strings(self, normalized, guard=None, trace=NO_TRACE):
+        result_fst = self._fst_compose(normalized, guard, trace=trace)
+        return _iter_valid_strings(result_fst, guard)
+
+    def _fst_best_valid_strings(self, normalized, k, min_score, guard=None, trace=NO_TRACE):
+        result_fst = self._fst_compose(normalized, guard, trace=trace)
+        return _best_valid_strings(result_fst, k, min_score, guard)
+
+    def _fst_compose(self, normalized, guard, td=None, trace=NO_TRACE):
+        input_fst = _make_input_fst(normalized)
+        trace.mark('input_fst')
+        result_fst = fst.compose(input_fst, self._transducer if td is None else td)
+        trace.mark('compose')
+        if trace is not NO_TRACE:
+            # Counting arcs visits every state, so is only done when tracing
+            trace.lattice_states = result_fst.num_states()
+            trace.lattice_arcs = sum(result_fst.num_arcs(s) for s in result_fst.states())
+            trace.mark('count')
+        if guard is not None:
+            guard.check_states(result_fst.num_states())
+        return result_fst
+
+
+def build_transducer(acceptor_path: str = LEXICAL_FREQUENCY_FST_FILE,
+                     optimize: bool = True) -> 'fst.Fst':
+    """Compose the transliterator with the attested acceptor, ready for lookup
+
+    :param acceptor_path: path to the lexical acceptor, as OpenFst text or in the array file format
+    :param optimize: remove epsilons, determinize and minimize the result
+    :returns: the composed transducer, sorted on input labels
+    """
+    return _compose_lexicon(_build_transliterator(), _build_attested_acceptor(acceptor_path), optimize)
+
+
+def _compose_lexicon(transliterator, acceptor, optimize=True):
+    td = fst.compose(transliterator, acceptor)
+    if optimize:
+        td = _optimize_transducer(td)
+    td.arcsort('ilabel')
+    return td
+
+
+def _optimize_transducer(td):
+    # The transducer is not functional (e.g. 'zu' is both ズ and ヅ), so it is
+    # determinized and minimized as an acceptor over encoded (input, output,
+    # weight) triples. Weights only sit on final states and are a function of
+    # the output string, so none of this changes the scores
+    td.rmepsilon()
+    mapper = fst.EncodeMapper(td.arc_type(), True, True)
+    td.encode(mapper)
+    td = fst.determinize(td)
+    td.minimize()
+    td.decode(mapper)
+    return td
+
+
+def write_compiled_transducer(path: str,
+                              manifest_path: str,
+                              acceptor_path: str = LEXICAL_FREQUENCY_FST_FILE,
+                              array_path: Optional[str] = None,
+                              filter_path: Optional[str] = None):
+    """Write the composed transducer as a binary artifact plus the manifest used
+    to recognize when that artifact has gone stale
+
+    :param path: destination of the binary transducer
+    :param manifest_path: destination of the JSON manifest
+    :param acceptor_path: path to the lexical acceptor, as OpenFst text or in the array file format
+    :param array_path: if given, also write the transducer for the array engine here
+    :param filter_path: if given, also write the input prefilter here
+    """
+    td = build_transducer(acceptor_path)
+    fst.convert(td, 'const').write(path)
+    arrays = ArrayTransducer.from_fst(td)
+    if array_path is not None:
+        arrays.save(array_path)
+    if filter_path is not None:
+        InputFilter.from_array_transducer(arrays).save(filter_path)
+    with open(manifest_path, mode='w') as manifest_file:
+        json.dump(_compiled_transducer_manifest(acceptor_path), manifest_file, indent=2, sort_keys=True)
+
+
+def write_lexicon_shards(directory: str, acceptor_path: str = LEXICAL_FREQUENCY_FST_FILE):
+    """Write the lexical acceptor split by the first katakana of its readings,
+    one minimal acceptor in the array file format each, for lexicon_shards
+
+    :param directory: where to write the shards and their manifest
+    :param acceptor_path: path to the lexical acceptor, as OpenFst text or in the array file format
+    """
+    write_shards(build_shards(*zip(*lexicon_entries(acceptor_path))),
+                 directory,
+                 _compiled_transducer_manifest(acceptor_path, check_transliterator=False))
+
+
+def _lexicon_shard_sources(acceptor_path=LEXICAL_FREQUENCY_FST_FILE):
+    shards = build_shards(*zip(*lexicon_entries(acceptor_path)))
+    return {initial: (lambda acceptor=acceptor: acceptor) for initial, acceptor in shards.items()}
+
+
+def _load_lexicon_shard_sources(directory=LEXICON_SHARDS_DIR, acceptor_path=LEXICAL_FREQUENCY_FST_FILE):
+    # Shards depend only on the lexicon, not on the transliteration rules
+    try:
+        manifest, sources = load_shard_sources(directory)
+    except (OSError, ValueError):
+        return _lexicon_shard_sources(acceptor_path)
+    expected = _compiled_transducer_manifest(acceptor_path, check_transliterator=False)
+    if {key: manifest.get(key) for key in expected} != expected:
+        warnings.warn('Lexicon shards in {} are stale; sharding {}'.format(directory, acceptor_path))
+        return _lexicon_shard_sources(acceptor_path)
+    return sources
+
+
+def _load_compiled_transducer(path=COMPILED_TRANSDUCER_FILE,
+                              manifest_path=COMPILED_TRANSDUCER_MANIFEST_FILE,
+                              acceptor_path=LEXICAL_FREQUENCY_FST_FILE):
+    if not _is_compiled_transducer_current(path, manifest_path, acceptor_path):
+        return None
+    try:
+        return fst.Fst.read(path)
+    except fst.FstIOError:
+        return None
+
+
+def _load_compiled_array_transducer(path=COMPILED_ARRAY_TRANSDUCER_FILE,
+                                    manifest_path=COMPILED_TRANSDUCER_MANIFEST_FILE,
+                                    acceptor_path=LEXICAL_FREQUENCY_FST_FILE):
+    if not _is_compiled_transducer_current(path, manifest_path, acceptor_path):
+        return None
+    try:
+        return ArrayTransducer.load(path)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _load_compiled_input_filter(path=COMPILED_INPUT_FILTER_FILE,
+                                manifest_path=COMPILED_TRANSDUCER_MANIFEST_FILE,
+                                acceptor_path=LEXICAL_FREQUENCY_FST_FILE):
+    if not _is_compiled_transducer_current(path, manifest_path, acceptor_path):
+        return None
+    try:
+        return InputFilter.load(path)
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def _is_compiled_transducer_current(path, manifest_path, acceptor_path):
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return False
+    expected = _compiled_transducer_manifest(acceptor_path, check_transliterator=_has_openfst())
+    if {key: manifest.get(key) for key in expected} != expected:
+        warnings.warn('Compiled transducer {} is stale; compiling from {}'.format(path, acceptor_path))
+        return False
+    return True
+
+
+def _compiled_transducer_manifest(acceptor_path, check_transliterator=True):
+    # The artifact depends on both the lexicon and the transliteration rules,
+    # so a change to either invalidates it. The rules can only be checked with
+    # OpenFst; without it the array engine trusts the shipped artifacts
+    acceptor_stat = os.stat(acceptor_path)
+    manifest = {'format_version': COMPILED_TRANSDUCER_FORMAT_VERSION,
+                'lexicon_sha256': _file_digest(acceptor_path, acceptor_stat.st_mtime_ns, acceptor_stat.st_size)}
+    if check_transliterator:
+        manifest['transliterator_sha256'] = _transliterator_digest()
+    return manifest
+
+
+@functools.lru_cache(maxsize=16)
+def _file_digest(path, mtime_ns, size):
+    # Keyed on the modification time and size as well, so a file is only
+    # hashed again once it has changed
+    with open(path, mode='rb') as hashed_file:
+        return hashlib.sha256(hashed_file.read()).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _transliterator_digest():
+    # The rules are in code, so cannot change while the process runs
+    return _fst_digest(_build_transliterator())
+
+
+def _cache_namespace(overlay_entries):
+    # Results depend on the lexicon, the transliteration rules and the format
+    # of the compiled artifacts built from them, and on any readings added
+    manifest = _compiled_transducer_manifest(LEXICAL_FREQUENCY_FST_FILE, check_transliterator=False)
+    manifest['transliterator_sha256'] = _rules_digest()
+    overlay = sorted(overlay_entries.items())
+    return hashlib.sha256(json.dumps([manifest, overlay], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _rules_digest():
+    # Without OpenFst the rules cannot be built, but the shipped artifacts,
+    # which are then used as they are, record the digest of those they embody
+    if _has_openfst():
+        return _transliterator_digest()
+    try:
+        with open(COMPILED_TRANSDUCER_MANIFEST_FILE) as manifest_file:
+            return json.load(manifest_file).get('transliterator_sha256')
+    except (OSError, ValueError):
+        return None
+
+
+def _has_openfst():
+    try:
+        fst.Fst
+    except ImportError:
+        return False
+    return True
+
+
+def _fst_digest(td):
+    # Hash a canonical rendering rather than the binary serialization, which
+    # varies between OpenFst versions
+    digest = hashlib.sha256()
+    digest.update('{}\n'.format(td.start()).encode('ascii'))
+    for state in td.states():
+        digest.update('{} {}\n'.format(state, float(td.final(state))).encode('ascii'))
+        for a in td.arcs(state):
+            digest.update('{} {} {} {}\n'.format(a.ilabel, a.olabel, float(a.weight), a.nextstate).encode('ascii'))
+    return digest.hexdigest()
 
 
 def _build_transliterator():
@@ -68,16 +741,25 @@ def _build_transliterator():
     return td
 
 
-def _build_attested_acceptor():
+def _build_attested_acceptor(path=LEXICAL_FREQUENCY_FST_FILE):
     # The basic strategy of the transliterator is to generate all
     # theoretically (i.e. w/o lexical knowledge) possible strings, which we
     # filter down with reference to lexical knowledge
-    fst_txt = ''.join(open(LEXICAL_FREQUENCY_FST_FILE, encoding='ascii'))
+    if is_array_file(path):
+        return _fst_from_arrays(ArrayTransducer.load(path, mmap=False))
+    fst_txt = ''.join(open(path, encoding='ascii'))
     compiler = fst.Compiler()
     compiler.write(fst_txt)
     return compiler.compile()
 
 
+def normalize(romaji: str) -> str:
+    """The form romaji is looked up in; inputs normalizing alike have the same readings"""
+    # It is convenient to match on COMBINING MACRON and COMBINING CIRCUMFLEX
+    # separately from their vowels
+    return unicodedata.normalize('NFKD', romaji).lower()
+
+
 def _make_input_fst(string):
     # Input is passed as acceptors that accept a single string
     td = fst.Fst()
@@ -314,10 +996,10 @@ def _multi_char_arc(td, start_state, input_str, output_str, end_state):
 
 def _char_arc(td, start_state, input_char, output_char, next_state):
     td.add_arc(start_state,
-               Arc(SYMBOL_TABLE[input_char],
-                   SYMBOL_TABLE[output_char],
-                   _const_w(td),
-                   next_state))
+               fst.Arc(SYMBOL_TABLE[input_char],
+                       SYMBOL_TABLE[output_char],
+                       _const_w(td),
+                       next_state))
 
 
 def _eps_arc(td, start_state, end_state):
@@ -329,65 +1011,210 @@ def _const_w(td):
     return fst.Weight.One(td.weight_type())
 
 
-def _all_valid_strings(td: fst.Fst) -> List[Tuple[List[int], float]]:
+def _all_valid_strings(td: 'fst.Fst', guard: Optional[LookupGuard] = None) -> List[Tuple[Tuple[int, ...], float]]:
     """Return an enumeration of the emission language. Essentially the equivalent of
     fstprint, but not handling the de-interning of strings.
 
     The weight returned is not the weight of the whole sequence, but the weight
-    of the final state in the sequence as a final state.
-
-    Does not check for duplicate emissions or cycles in the transducer.
+    of the final state in the sequence as a final state. Each emission is
+    returned once, with the best weight of the paths emitting it.
 
     :param td: transducer, the emission language of which to enumerate
+    :param guard: if given, checks the paths enumerated against its limits
     :returns: a list of (interned emission symbols, weight) tuples
+    """
+    best_weights = {}
+    for output, weight in _iter_emissions(td, guard):
+        if weight > best_weights.get(output, -INFINITY):
+            best_weights[output] = weight
+    return list(best_weights.items())
+
+
+def _iter_valid_strings(td: 'fst.Fst',
+                        guard: Optional[LookupGuard] = None) -> Iterator[Tuple[Tuple[int, ...], float]]:
+    """Lazily enumerate the emission language, each emission once
 
+    Unlike _all_valid_strings, the first path found for an emission decides
+    its weight. In the lexical transducers the weight is a function of the
+    emission, so the two agree.
+
+    :param td: transducer, the emission language of which to enumerate
+    :param guard: if given, checks the paths enumerated against its limits
+    :returns: an iterator of (interned emission symbols, weight) tuples
     """
+    seen = set()
+    for output, weight in _iter_emissions(td, guard):
+        if output not in seen:
+            seen.add(output)
+            yield output, weight
+
+
+def _iter_emissions(td, guard=None):
+    emissions = _iter_paths(td)
+    return emissions if guard is None else guard.count_paths(emissions)
+
+
+def _iter_paths(td):
+    # Depth-first over paths, each represented by a (state, output label,
+    # parent) node so that paths share their prefixes rather than copying
+    # them. Epsilon output labels are dropped when a path is unwound, so
+    # paths with the same emission yield equal tuples. Cycles are only looked
+    # for (walking the path back) when the transducer has any, in which case
+    # only paths not revisiting a state are enumerated
+    if td.start() == -1:
+        return
+    cyclic = not td.properties(fst.ACYCLIC, True)
+    stack = [(td.start(), 0, None)]
+    while stack:
+        node = stack.pop()
+        state = node[0]
+        final_weight = float(td.final(state))
+        if final_weight != INFINITY:
+            yield _unwind_path(node), final_weight
+        for a in td.arcs(state):
+            if cyclic and _path_visits(node, a.nextstate):
+                continue
+            stack.append((a.nextstate, a.olabel, node))
+
+
+def _unwind_path(node):
+    output = []
+    while node is not None:
+        if node[1]:
+            output.append(node[1])
+        node = node[2]
+    output.reverse()
+    return tuple(output)
+
+
+def _path_visits(node, state):
+    while node is not None:
+        if node[0] == state:
+            return True
+        node = node[2]
+    return False
+
+
+def _best_valid_strings(td: 'fst.Fst',
+                        k: Optional[int] = None,
+                        min_score: Optional[float] = None,
+                        guard: Optional[LookupGuard] = None) -> List[Tuple[List[int], float]]:
+    """Like _all_valid_strings, but only the k best emissions and/or those
+    weighted at least min_score
+
+    Emissions tied in weight with the k-th best are also returned.
+
+    :param td: acyclic transducer, the emission language of which to search
+    :param k: number of emissions wanted
+    :param min_score: lowest weight wanted
+    :param guard: if given, checks the paths enumerated against its limits
+    :returns: a list of (interned emission symbols, weight) tuples
+    """
+    if td.start() == -1:
+        return []
+    # Lattices for real names are a handful of states, which are cheaper to
+    # enumerate outright than to search
+    if td.num_states() <= SMALL_LATTICE_STATES:
+        return best_emissions(_all_valid_strings(td, guard), k, min_score)
+
+    # Higher frequencies are better, so negate them to search with the tropical semiring
+    inverted = fst.arcmap(td, map_type='invert')
+    # A reading can be emitted by several paths, so the search is over the
+    # distinct emissions, lest the k best paths be fewer than k readings
+    emissions = inverted.copy().project('output').rmepsilon()
+    shortest = fst.shortestpath(emissions, nshortest=k or 1, unique=True)
+    scores = sorted(-w for w in _path_weights(shortest))
+    if not scores:
+        return []
+    best = scores[-1]
+    threshold = scores[0] if k is not None else min_score
+    if min_score is not None:
+        threshold = max(threshold, min_score)
+    if best < threshold:
+        return []
+    # Pruning keeps every state on a path scoring within (best - threshold) of
+    # the best, though such states may also be final with a worse score
+    if guard is not None:
+        guard.check_deadline()
+    pruned = fst.arcmap(fst.prune(inverted, weight=best - threshold), map_type='invert')
+    return [(output, w) for output, w in _all_valid_strings(pruned, guard) if w >= threshold]
+
+
+def _path_weights(td):
+    # Unlike the lexical transducers, shortest path output carries weight on arcs
     if td.start() == -1:
         return []
-    stack = [(td.start(), [])]
-    complete_emissions = []
+    stack = [(td.start(), 0.0)]
+    weights = []
     while stack:
-        state, output = stack.pop()
+        state, weight = stack.pop()
         final_weight = float(td.final(state))
-        if np.isfinite(final_weight):
-            complete_emissions.append((output, final_weight))
-        stack += [(a.nextstate, output + [a.olabel]) for a in td.arcs(state)]
-    return complete_emissions
+        if final_weight != INFINITY:
+            weights.append(weight + final_weight)
+        stack += [(a.nextstate, weight + float(a.weight)) for a in td.arcs(state)]
+    return weights
+
+
+class _LexiconOverlay(NamedTuple):
+    entries: dict
+    arrays: ArrayTransducer
+    filter: InputFilter
+
+    def lookup(self, normalized, guard=None):
+        """The overlay's readings of normalized romaji, as a dict of scores"""
+        if not self.filter.passes(normalized):
+            return {}
+        try:
+            return dict(_deintern_results(self.arrays.iter_valid_strings(normalized, guard)))
+        except ValueError:
+            return {}
+
+
+def _build_overlay(transliterator, entries):
+    readings = sorted(entries)
+    acceptor = acceptor_for_strings(readings, [entries[r] for r in readings])
+    acceptor.arcsort('ilabel')
+    arrays = ArrayTransducer.from_fst(_compose_lexicon(transliterator, acceptor))
+    return _LexiconOverlay(entries, arrays, InputFilter.from_array_transducer(arrays))
+
+
+def _select(results, k, min_score):
+    # results are sorted in ascending order of score, as _lookup returns them
+    if k == 0:
+        return []
+    if min_score is not None:
+        results = [r for r in results if r[1] >= min_score]
+    return list(results[-k:] if k is not None else results)
 
 
 def _deintern_tokens(tokens):
     return ''.join([REVERSE_SYMBOL_TABLE[t] for t in tokens if t != 0])
 
 
-def acceptor_for_strings(strings: List[str], weights: List[float]) -> fst.Fst:
-    """Create an acceptor for strings with weights"""
-    strings, weights = zip(*sorted(zip(strings, weights)))
-    td = fst.Fst()
-    start_state = td.add_state()
-    td.set_start(start_state)
-    _build_acceptor_recursive(td, strings, weights, start_state, 0, 0, len(strings))
-    return td
+def _deintern_results(interned_results):
+    return ((_deintern_tokens(tokens), weight) for tokens, weight in interned_results)
 
 
-def _build_acceptor_recursive(td, strings, weights, start_state, str_idx, si, sj):
-    if si == sj:
-        return
-    i = si
-    set_final = False
-    # look for finished strings
-    while i < sj and len(strings[i]) <= str_idx:
-        if not set_final:
-            set_final = True
-            td.set_final(start_state, weights[i])
-        i += 1
+def acceptor_for_strings(strings: List[str], weights: List[float]) -> 'fst.Fst':
+    """Create a minimal acceptor for strings with weights
 
-    # descend further into the strings
-    while i < sj:
-        first_char = strings[i][str_idx]
-        next_state = td.add_state()
-        j = i
-        while j < sj and strings[j][str_idx] == first_char:
-            j += 1
-        _char_arc(td, start_state, first_char, first_char, next_state)
-        _build_acceptor_recursive(td, strings, weights, next_state, str_idx + 1, i, j)
-        i = j
+    :raises ValueError: if a string is repeated or has a character outside the symbol table
+    """
+    return _fst_from_arrays(build_lexicon(strings, weights))
+
+
+def _fst_from_arrays(arrays):
+    # The inverse of ArrayTransducer.from_fst. Lists index far faster than the arrays
+    offsets, ilabels, olabels = arrays.offsets.tolist(), arrays.ilabels.tolist(), arrays.olabels.tolist()
+    nextstates, finals = arrays.nextstates.tolist(), arrays.finals.tolist()
+    td = fst.Fst()
+    for _ in finals:
+        td.add_state()
+    td.set_start(int(arrays.start))
+    one = _const_w(td)
+    for state, weight in enumerate(finals):
+        for i in range(offsets[state], offsets[state + 1]):
+            td.add_arc(state, fst.Arc(ilabels[i], olabels[i], one, nextstates[i]))
+        if weight != INFINITY:
+            td.set_final(state, weight)
+    return td
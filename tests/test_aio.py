@@ -0,0 +1,126 @@
+import asyncio
+import threading
+
+import myouji_kenchi
+import pytest
+
+from concurrent import futures
+
+from myouji_kenchi import aio
+from myouji_kenchi import kenchi
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class TestAsyncScorer():
+    def test_matches_sync(self):
+        names = ['Yamada', 'Sato', 'Duckscallion', '@', 'Takahashi']
+
+        async def score():
+            return await asyncio.gather(*(aio.get_score_as_myouji(n) for n in names))
+        assert run(score()) == [myouji_kenchi.get_score_as_myouji(n) for n in names]
+
+    def test_order_names(self):
+        pairs = [['Satoshi', 'Yamada'], ['Yamada', 'Satoshi'], ['K.', 'Yoshida'], ['Takashi', 'Ise']]
+
+        async def order():
+            return await asyncio.gather(*(aio.order_names(p) for p in pairs))
+        assert run(order()) == [myouji_kenchi.order_names(p) for p in pairs]
+
+    def test_coalesces_and_batches(self):
+        scorer = aio.AsyncScorer(batch_window=0.05)
+
+        async def score():
+            return await asyncio.gather(*(scorer.get_score_as_myouji(n)
+                                          for n in ['Yamada', 'YAMADA', 'yamada', 'Sato', 'Tanaka']))
+        scores = run(score())
+        assert scores[0] == scores[1] == scores[2] > 0
+        stats = scorer.stats()
+        assert (stats.requests, stats.coalesced, stats.batches, stats.names_scored) == (5, 2, 1, 3)
+        assert stats.largest_batch == 3
+        assert (stats.queue_depth, stats.in_flight) == (0, 0)
+
+    def test_max_batch_size(self):
+        scorer = aio.AsyncScorer(batch_window=10, max_batch_size=2)
+        names = ['Yamada', 'Sato', 'Tanaka', 'Ito', 'Kato']
+
+        async def score():
+            return await asyncio.gather(*(scorer.get_score_as_myouji(n) for n in names))
+        # A long window is not waited out by full batches, nor by names
+        # left over once a batch finishes
+        assert run(asyncio.wait_for(score(), 5)) == [myouji_kenchi.get_score_as_myouji(n) for n in names]
+        stats = scorer.stats()
+        assert stats.largest_batch == 2
+        assert stats.names_scored == 5
+
+    def test_queue_depth(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        class BlockingExecutor(futures.ThreadPoolExecutor):
+            def submit(self, fn, *args):
+                def blocked():
+                    started.set()
+                    release.wait()
+                    return fn(*args)
+                return super().submit(blocked)
+
+        with BlockingExecutor(max_workers=1) as executor:
+            scorer = aio.AsyncScorer(executor=executor, batch_window=0)
+
+            async def score():
+                first = asyncio.ensure_future(scorer.get_score_as_myouji('Yamada'))
+                await asyncio.get_running_loop().run_in_executor(None, started.wait)
+                rest = [asyncio.ensure_future(scorer.get_score_as_myouji(n)) for n in ['Sato', 'Tanaka']]
+                await asyncio.sleep(0.01)
+                stats = scorer.stats()
+                release.set()
+                return stats, await asyncio.gather(first, *rest)
+            stats, scores = run(score())
+        assert (stats.queue_depth, stats.in_flight, stats.batches) == (2, 3, 1)
+        assert scores == [myouji_kenchi.get_score_as_myouji(n) for n in ['Yamada', 'Sato', 'Tanaka']]
+        assert scorer.stats().batches == 2
+
+    @pytest.mark.parametrize('max_batches', [None, 2])
+    def test_max_batches(self, max_batches):
+        release = threading.Event()
+
+        class BlockingExecutor(futures.ThreadPoolExecutor):
+            def submit(self, fn, *args):
+                def blocked():
+                    release.wait()
+                    return fn(*args)
+                return super().submit(blocked)
+
+        options = {} if max_batches is None else {'max_batches': max_batches}
+        with BlockingExecutor(max_workers=2) as executor:
+            # The executor's workers are not counted; only max_batches bounds the batches
+            scorer = aio.AsyncScorer(executor=executor, batch_window=0, max_batch_size=1, **options)
+
+            async def score():
+                scores = [asyncio.ensure_future(scorer.get_score_as_myouji(n)) for n in ['Yamada', 'Sato']]
+                await asyncio.sleep(0.01)
+                stats = scorer.stats()
+                release.set()
+                return stats, await asyncio.gather(*scores)
+            stats, scores = run(score())
+        assert stats.batches == (max_batches or 1)
+        assert scores == [myouji_kenchi.get_score_as_myouji(n) for n in ['Yamada', 'Sato']]
+
+    def test_failure(self, monkeypatch):
+        def fail(names):
+            raise RuntimeError('scoring failed')
+        monkeypatch.setattr(kenchi, 'score_many', fail)
+        scorer = aio.AsyncScorer()
+        with pytest.raises(RuntimeError):
+            run(scorer.get_score_as_myouji('Yamada'))
+        assert scorer.stats().in_flight == 0
+
+    def test_invalid(self):
+        for options in [{'batch_window': -1}, {'max_batch_size': 0}, {'max_batches': 0}]:
+            with pytest.raises(ValueError):
+                aio.AsyncScorer(**options)
+        with pytest.raises(ValueError):
+            run(aio.order_names(['Yamada']))
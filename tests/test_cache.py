@@ -0,0 +1,42 @@
+import threading
+
+from myouji_kenchi.cache import CacheStats, LRUCache
+
+
+class TestLRUCache():
+    def test_hits_and_misses(self):
+        cache = LRUCache(2)
+        assert cache.get('a') is None
+        cache.put('a', 1)
+        assert cache.get('a') == 1
+        assert cache.stats() == CacheStats(hits=1, misses=1, evictions=0, size=1, maxsize=2)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert cache.stats().evictions == 1
+        assert cache.stats().size == 2
+
+    def test_concurrent_use(self):
+        cache = LRUCache(50)
+
+        def work(offset):
+            for i in range(1000):
+                key = (i + offset) % 100
+                if cache.get(key) is None:
+                    cache.put(key, key)
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = cache.stats()
+        assert stats.hits + stats.misses == 8000
+        assert stats.size == 50
@@ -0,0 +1,94 @@
+import json
+import myouji_kenchi
+import pytest
+
+from myouji_kenchi import cli
+
+
+@pytest.fixture(autouse=True)
+def reset_configuration():
+    yield
+    myouji_kenchi.configure()
+
+
+class TestCli():
+    def test_order_csv(self, tmp_path, capsys):
+        input_path = tmp_path / 'names.csv'
+        input_path.write_text('first,last,id\nYamada,Satoshi,1\nKaori,Sato,2\nYamada,Satoshi,3\n')
+        cli.main([str(input_path), '--chunk-size', '2'])
+        output, summary = capsys.readouterr()
+        assert output.splitlines() == ['first,last,id,given_name,family_name',
+                                       'Yamada,Satoshi,1,Satoshi,Yamada',
+                                       'Kaori,Sato,2,Kaori,Sato',
+                                       'Yamada,Satoshi,3,Satoshi,Yamada']
+        assert '3 rows' in summary and 'cache hit rate' in summary
+
+    def test_score_jsonl(self, tmp_path, capsys):
+        input_path = tmp_path / 'names.jsonl'
+        input_path.write_text('{"name": "Yamada"}\n{"name": "Duckscallion"}\n')
+        cli.main([str(input_path), '--mode', 'score', '--fields', 'name', '--quiet'])
+        output, summary = capsys.readouterr()
+        rows = [json.loads(line) for line in output.splitlines()]
+        assert [r['name_score'] for r in rows] == [myouji_kenchi.get_score_as_myouji('Yamada'), 0]
+        assert summary == ''
+
+    def test_prior(self, tmp_path, capsys):
+        input_path = tmp_path / 'names.tsv'
+        input_path.write_text('a\tb\nTakashi\tIse\n')
+        cli.main([str(input_path), '--prior', '0.75', '--quiet'])
+        output, _ = capsys.readouterr()
+        assert output.splitlines()[1].split('\t')[2:] == myouji_kenchi.order_names(['Takashi', 'Ise'], prior=0.75)
+
+    def test_missing_fields(self, tmp_path):
+        input_path = tmp_path / 'names.jsonl'
+        input_path.write_text('{"name": "Yamada"}\n')
+        with pytest.raises(SystemExit):
+            cli.main([str(input_path)])
+
+    @pytest.mark.parametrize('header, options', [('name\n', []), ('first,last\n', ['--fields', 'first'])])
+    def test_order_needs_two_fields(self, tmp_path, capsys, header, options):
+        input_path = tmp_path / 'names.csv'
+        input_path.write_text(header + 'Yamada\n')
+        with pytest.raises(SystemExit):
+            cli.main([str(input_path)] + options)
+        assert 'exactly two name fields' in capsys.readouterr().err
+
+    def test_missing_and_non_string_values(self, tmp_path, capsys):
+        input_path = tmp_path / 'names.csv'
+        input_path.write_text('first,last\nYamada\nKaori,Sato\n')
+        cli.main([str(input_path), '--scores', '--quiet'])
+        output, _ = capsys.readouterr()
+        assert output.splitlines()[1:] == ['Yamada,,,Yamada,{},0'.format(myouji_kenchi.get_score_as_myouji('Yamada')),
+                                           'Kaori,Sato,Kaori,Sato,0,{}'.format(myouji_kenchi.get_score_as_myouji('Sato'))]
+        input_path = tmp_path / 'names.jsonl'
+        input_path.write_text('{"name": null}\n{"name": 12}\n{"name": "Yamada"}\n')
+        cli.main([str(input_path), '--mode', 'score', '--fields', 'name', '--quiet'])
+        output, _ = capsys.readouterr()
+        rows = [json.loads(line) for line in output.splitlines()]
+        assert [r['name_score'] for r in rows] == [0, 0, myouji_kenchi.get_score_as_myouji('Yamada')]
+        assert [r['name'] for r in rows] == [None, 12, 'Yamada']
+
+    def test_order_with_scores_scores_once(self, tmp_path, capsys, monkeypatch):
+        input_path = tmp_path / 'names.csv'
+        input_path.write_text('first,last\nYamada,Satoshi\nKaori,Sato\nSATO,Kaori\n')
+        scored = []
+        score_many = myouji_kenchi.kenchi.score_many
+
+        def counting_score_many(names, *args, **kwargs):
+            names = list(names)
+            scored.extend(names)
+            return score_many(names, *args, **kwargs)
+
+        monkeypatch.setattr(myouji_kenchi.kenchi, 'score_many', counting_score_many)
+        cli.main([str(input_path), '--scores', '--cache-size', '0', '--quiet'])
+        output, _ = capsys.readouterr()
+        assert len(scored) == 6
+        rows = [line.split(',') for line in output.splitlines()[1:]]
+        assert [row[2:4] for row in rows] == [myouji_kenchi.order_names(row[:2]) for row in rows]
+
+    def test_summary_with_workers(self, tmp_path, capsys):
+        input_path = tmp_path / 'names.csv'
+        input_path.write_text('first,last\nYamada,Satoshi\n')
+        cli.main([str(input_path), '--workers', '2'])
+        _, summary = capsys.readouterr()
+        assert '1 rows' in summary and 'unavailable with --workers' in summary
@@ -0,0 +1,50 @@
+import myouji_kenchi
+import numpy as np
+import pytest
+
+from myouji_kenchi import columnar
+
+
+NAMES = ['Yamada', 'Sato', 'Yamada', 'Duckscallion', None, 'YAMADA', 'Satoshi', 'K.', float('nan'), 'Ito']
+
+
+class TestColumnar():
+    def test_factorize(self):
+        codes, uniques = columnar.factorize(NAMES)
+        assert uniques == ['Yamada', 'Sato', 'Duckscallion', '', 'YAMADA', 'Satoshi', 'K.', 'Ito']
+        assert codes.tolist() == [0, 1, 0, 2, 3, 4, 5, 6, 3, 7]
+
+    def test_score_array(self):
+        scores = columnar.score_array(np.array(NAMES, dtype=object))
+        assert scores.dtype == np.float64
+        assert scores.tolist() == [myouji_kenchi.get_score_as_myouji(n if isinstance(n, str) else '') for n in NAMES]
+
+    def test_candidate_arrays(self):
+        transliterator = myouji_kenchi.MyoujiBackTransliteration()
+        for k in [None, 1]:
+            candidates = columnar.candidate_arrays(NAMES, k=k)
+            assert len(candidates.offsets) == len(set(candidates.codes.tolist())) + 1
+            assert len(candidates.readings) == len(candidates.scores) == candidates.offsets[-1]
+            for i, name in enumerate(NAMES):
+                expected = transliterator.back_transliterate(name, k=k) if isinstance(name, str) else []
+                assert candidates.row(i) == expected
+
+    def test_swap_mask(self):
+        pairs = [['Shougo', 'ITO'], ['ITO', 'Shougo'], ['Satoshi', 'Yamada'], ['Yamada', 'Satoshi'],
+                 ['K.', 'Yoshida'], ['Yoshida', 'K.'], ['Takegawa', 'Sho'], ['TAKEGAWA', 'Sho'],
+                 ['Legokichi', 'Duckscallion'], ['Takashi', 'Ise']]
+        first, second = zip(*pairs)
+        for prior in [0.5, 0.75]:
+            expected = [myouji_kenchi.order_names(p, prior=prior) != p for p in pairs]
+            assert columnar.swap_mask(first, second, prior=prior).tolist() == expected
+
+    def test_swap_mask_invalid(self):
+        with pytest.raises(ValueError):
+            columnar.swap_mask(['Yamada'], ['Satoshi', 'Ito'])
+        with pytest.raises(ValueError):
+            columnar.swap_mask(['Yamada'], ['Satoshi'], prior=2)
+
+    def test_empty(self):
+        assert columnar.score_array([]).tolist() == []
+        assert columnar.swap_mask([], []).tolist() == []
+        assert columnar.candidate_arrays([]).offsets.tolist() == [0]
@@ -0,0 +1,42 @@
+import subprocess
+import sys
+
+
+# Generous, so that only a heavy dependency creeping back into the import path trips it
+IMPORT_BUDGET_MICROSECONDS = 100000
+
+HEAVY_MODULES = ['pywrapfst', 'numpy', 'pkg_resources', 'concurrent.futures']
+
+
+def run_python(code, *options):
+    return subprocess.run([sys.executable, *options, '-c', code],
+                          capture_output=True, text=True, check=True)
+
+
+class TestImport():
+    def test_heavy_modules_not_imported(self):
+        result = run_python('import sys\n'
+                            'import myouji_kenchi\n'
+                            'from myouji_kenchi import kenchi\n'
+                            'kenchi.is_initial("A.")\n'
+                            'kenchi.is_all_uppercase("YAMADA")\n'
+                            'print(" ".join(m for m in {!r} if m in sys.modules))'.format(HEAVY_MODULES))
+        assert result.stdout.split() == []
+
+    def test_import_time_budget(self):
+        result = run_python('import myouji_kenchi.kenchi', '-X', 'importtime')
+        cumulative = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and '|' in line:
+                _, total, name = line.split('|')
+                if total.strip().isdigit():
+                    cumulative[name.strip()] = int(total)
+        assert cumulative['myouji_kenchi'] + cumulative['myouji_kenchi.kenchi'] < IMPORT_BUDGET_MICROSECONDS
+
+    def test_array_engine_without_openfst(self):
+        result = run_python('import sys\n'
+                            'sys.modules["pywrapfst"] = None\n'
+                            'import myouji_kenchi\n'
+                            'nbt = myouji_kenchi.MyoujiBackTransliteration(engine="array")\n'
+                            'print(nbt.back_transliterate("Yamada")[-1][0])')
+        assert result.stdout.strip() == 'ヤマダ'
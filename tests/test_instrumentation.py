@@ -0,0 +1,47 @@
+from myouji_kenchi.instrumentation import LookupTrace, TraceAggregator
+
+
+def make_trace(romaji, total, outcome='lookup', **stages):
+    trace = LookupTrace(romaji, None, None, 'fst')
+    trace.stages = stages
+    trace.outcome = outcome
+    trace.total = total
+    return trace
+
+
+class TestTraceAggregator():
+    def test_percentiles(self):
+        aggregator = TraceAggregator()
+        for i in range(1, 101):
+            aggregator(make_trace(str(i), i / 1000, compose=i / 2000))
+        stats = aggregator.stats()
+        assert set(stats) == {'total', 'compose'}
+        assert stats['total'].count == 100
+        assert stats['total'].max == 0.1
+        assert 0.049 <= stats['total'].p50 <= 0.052
+        assert 0.089 <= stats['total'].p90 <= 0.092
+        assert stats['compose'].p99 <= stats['compose'].max == 0.05
+
+    def test_slowest(self):
+        aggregator = TraceAggregator(slowest=3)
+        for i, total in enumerate([5, 1, 9, 3, 7, 7]):
+            aggregator(make_trace(str(i), total))
+        assert [t.total for t in aggregator.slowest()] == [9, 7, 7]
+
+    def test_outcomes_and_reset(self):
+        aggregator = TraceAggregator()
+        for outcome in ['lookup', 'rejected', 'lookup', 'cache']:
+            aggregator(make_trace('a', 1, outcome))
+        assert aggregator.outcomes() == {'lookup': 2, 'rejected': 1, 'cache': 1}
+        aggregator.reset()
+        assert aggregator.outcomes() == {} and aggregator.stats() == {} and aggregator.slowest() == []
+
+    def test_bounded_samples(self):
+        aggregator = TraceAggregator(max_samples=10)
+        for i in range(1000):
+            aggregator(make_trace('a', i))
+        stats = aggregator.stats()['total']
+        assert stats.count == 1000
+        assert len(aggregator._samples['total']) == 10
+        # Mean and max are over every call, not the sample
+        assert (stats.mean, stats.max) == (499.5, 999)
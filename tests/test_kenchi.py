@@ -1,4 +1,8 @@
 import myouji_kenchi
+import pytest
+import threading
+
+from myouji_kenchi import kenchi
 
 
 class TestKenchi():
@@ -42,6 +46,171 @@ class TestKenchi():
         assert_ordered(True, 'Ito', 'SHŌ')  # composed macron
         assert_ordered(True, 'Ito', 'SHŌ')  # decomposed macron
 
+    def test_order_names_many(self):
+        pairs = [('Shougo', 'ITO'), ('Satoshi', 'Yamada'), ('Yamada', 'Satoshi'), ('K.', 'Yoshida'),
+                 ('Legokichi', 'Duckscallion'), ('@', 'Yamada'), ('Takashi', 'Ise'), ('Satoshi', 'Yamada')]
+        for prior in [0.5, 0.75]:
+            expected = [myouji_kenchi.order_names(pair, prior=prior) for pair in pairs]
+            assert myouji_kenchi.order_names_many(pairs, prior=prior) == expected
+
+    def test_score_many(self):
+        names = ['Yamada', 'Satoshi', 'YAMADA', 'Duckscallion', '@', 'Yamada', 'Sato']
+        assert myouji_kenchi.score_many(names) == [myouji_kenchi.get_score_as_myouji(n) for n in names]
+
+    def test_workers(self):
+        names = ['Yamada', 'Satoshi', 'YAMADA', 'Duckscallion', '@', 'Yamada', 'Sato'] * 3
+        expected = [myouji_kenchi.get_score_as_myouji(n) for n in names]
+        assert myouji_kenchi.score_many(names, workers=2, chunksize=2) == expected
+        pairs = [('Satoshi', 'Yamada'), ('Yamada', 'Satoshi'), ('Takashi', 'Ise'), ('K.', 'Yoshida')]
+        assert myouji_kenchi.order_names_many(pairs, workers=2) == [myouji_kenchi.order_names(p) for p in pairs]
+
+    def test_workers_without_names(self, monkeypatch):
+        def no_pool(workers):
+            raise AssertionError('no pool is needed')
+        monkeypatch.setattr(kenchi, 'scoring_pool', no_pool)
+        assert myouji_kenchi.score_many([], workers=2) == []
+
+    def test_concurrent_load(self, monkeypatch):
+        constructed = []
+        original = myouji_kenchi.MyoujiBackTransliteration
+
+        def counting_constructor(**options):
+            constructed.append(options)
+            return original(**options)
+
+        monkeypatch.setattr(myouji_kenchi, 'MyoujiBackTransliteration', counting_constructor)
+        try:
+            myouji_kenchi.configure()
+            threads = [threading.Thread(target=myouji_kenchi.get_score_as_myouji, args=('Yamada',))
+                       for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert len(constructed) == 1
+        finally:
+            myouji_kenchi.configure()
+
+    def test_preload(self, monkeypatch):
+        constructed = []
+        release = threading.Event()
+        original = myouji_kenchi.MyoujiBackTransliteration
+
+        def slow_constructor(**options):
+            constructed.append(options)
+            release.wait()
+            return original(**options)
+
+        monkeypatch.setattr(myouji_kenchi, 'MyoujiBackTransliteration', slow_constructor)
+        try:
+            myouji_kenchi.configure()
+            load = myouji_kenchi.preload()
+            assert not load.done() and not myouji_kenchi.is_ready()
+            scorer = threading.Thread(target=myouji_kenchi.get_score_as_myouji, args=('Yamada',))
+            scorer.start()
+            assert myouji_kenchi.preload() is load
+            release.set()
+            scorer.join()
+            assert load.result() is not None and myouji_kenchi.is_ready()
+            assert len(constructed) == 1
+        finally:
+            release.set()
+            myouji_kenchi.configure()
+
+    def test_failed_preload_retried(self, monkeypatch):
+        original = myouji_kenchi.MyoujiBackTransliteration
+        failures = [RuntimeError('lexicon unavailable')]
+
+        def flaky_constructor(**options):
+            if failures:
+                raise failures.pop()
+            return original(**options)
+
+        monkeypatch.setattr(myouji_kenchi, 'MyoujiBackTransliteration', flaky_constructor)
+        try:
+            myouji_kenchi.configure()
+            with pytest.raises(RuntimeError):
+                myouji_kenchi.preload().result()
+            assert not myouji_kenchi.is_ready()
+            assert myouji_kenchi.get_score_as_myouji('Yamada') > 0
+            assert myouji_kenchi.is_ready()
+        finally:
+            myouji_kenchi.configure()
+
+    def test_configure_cache(self):
+        try:
+            myouji_kenchi.configure(cache_size=10)
+            myouji_kenchi.get_score_as_myouji('Yamada')
+            myouji_kenchi.get_score_as_myouji('YAMADA')
+            stats = myouji_kenchi.cache_stats()
+            assert (stats.hits, stats.misses, stats.maxsize) == (1, 1, 10)
+        finally:
+            myouji_kenchi.configure()
+        assert myouji_kenchi.cache_stats() is None
+
+    def test_configure_limits(self):
+        try:
+            myouji_kenchi.configure(limits=myouji_kenchi.LookupLimits(max_length=6))
+            assert myouji_kenchi.get_score_as_myouji('Yamamoto') == 0
+            assert myouji_kenchi.get_score_as_myouji('Yamada') > 0
+            assert myouji_kenchi.limit_stats().tripped_by_limit == {'length': 1}
+        finally:
+            myouji_kenchi.configure()
+        assert myouji_kenchi.limit_stats() is None
+
+    def test_configure_index(self):
+        try:
+            myouji_kenchi.configure(index_size=100)
+            unindexed_score = myouji_kenchi.MyoujiBackTransliteration().best_score('Sato')
+            assert myouji_kenchi.get_score_as_myouji('Sato') == unindexed_score
+            myouji_kenchi.get_score_as_myouji('Inudzuka')
+            stats = myouji_kenchi.index_stats()
+            assert (stats.hits, stats.misses) == (1, 1)
+        finally:
+            myouji_kenchi.configure()
+        assert myouji_kenchi.index_stats() is None
+
+    def test_configure_shards(self):
+        try:
+            myouji_kenchi.configure(lexicon_shards='lazy')
+            assert myouji_kenchi.shard_stats().loaded == 0
+            assert myouji_kenchi.get_score_as_myouji('Yamada') == 201046.0
+            assert myouji_kenchi.shard_stats().loaded == 3
+        finally:
+            myouji_kenchi.configure()
+        assert myouji_kenchi.shard_stats() is None
+
+
+class TestSplitFullName():
+    def test_tokens(self):
+        assert myouji_kenchi.split_full_name('Taro Yamada') == ['Taro', 'Yamada']
+        assert myouji_kenchi.split_full_name('Yamada Satoshi') == ['Satoshi', 'Yamada']
+        assert myouji_kenchi.split_full_name('Yamada, Taro') == ['Taro', 'Yamada']
+        assert myouji_kenchi.split_full_name('Taro Ken Yamada') == ['Taro Ken', 'Yamada']
+
+    def test_agrees_with_order_names(self):
+        for names in [['Shougo', 'ITO'], ['ITO', 'Shougo'], ['K.', 'Yoshida'], ['Yoshida', 'K.'],
+                      ['Legokichi', 'Duckscallion'], ['Duckscallion', 'Legokichi']]:
+            assert myouji_kenchi.split_full_name(' '.join(names)) == myouji_kenchi.order_names(names)
+        assert (myouji_kenchi.split_full_name('Takashi Ise', prior=0.75) ==
+                myouji_kenchi.order_names(['Takashi', 'Ise'], prior=0.75))
+
+    def test_camel_case(self):
+        assert myouji_kenchi.split_full_name('TaroYamada') == ['Taro', 'Yamada']
+        assert myouji_kenchi.split_full_name('YamadaTaro') == ['Taro', 'Yamada']
+
+    def test_unsplit(self):
+        assert myouji_kenchi.split_full_name('yamadataro') == ['taro', 'yamada']
+        assert myouji_kenchi.split_full_name('ichirosuzuki') == ['ichiro', 'suzuki']
+        assert myouji_kenchi.split_full_name('satoutarou') == ['tarou', 'satou']
+        assert myouji_kenchi.split_full_name('Ōnoyōko') == ['yōko', 'Ōno']
+
+    def test_unsplittable(self):
+        assert myouji_kenchi.split_full_name('smithjohn') == ['smithjohn']
+        assert myouji_kenchi.split_full_name('x') == ['x']
+        with pytest.raises(ValueError):
+            myouji_kenchi.split_full_name(' , ')
+
 
 def assert_ordered(ordered, *names, **kwargs):
     ordering_result = myouji_kenchi.order_names(names, **kwargs)
@@ -0,0 +1,69 @@
+import pytest
+
+from myouji_kenchi import romaji_index
+from myouji_kenchi import transducer
+from myouji_kenchi.lexicon_builder import LexiconBuilder, build_lexicon, build_shards, write_text
+
+
+def entries_of(acceptor):
+    return sorted(romaji_index._array_lexicon_entries(acceptor))
+
+
+class TestLexiconBuilder():
+    def test_minimal(self):
+        # タナカ and ヤマナカ share their suffix ナカ, having the same final weight
+        entries = [('タナカ', 5.0), ('ヤマダ', 2.0), ('ヤマナカ', 5.0), ('ワダ', 2.0), ('ワダナ', 1.0)]
+        builder = LexiconBuilder()
+        for reading, weight in entries:
+            builder.add(reading, weight)
+        acceptor = builder.finish()
+        assert entries_of(acceptor) == entries
+        stats = builder.stats()
+        assert stats.strings == 5
+        assert (stats.states, stats.arcs) == (len(acceptor.finals), len(acceptor.ilabels)) == (10, 10)
+
+    def test_weights_not_merged(self):
+        acceptor = build_lexicon(['タナカ', 'ヤマナカ'], [5.0, 4.0])
+        assert entries_of(acceptor) == [('タナカ', 5.0), ('ヤマナカ', 4.0)]
+
+    def test_order(self):
+        builder = LexiconBuilder()
+        builder.add('ヤマダ', 1.0)
+        for reading in ['ヤマダ', 'タナカ']:
+            with pytest.raises(ValueError):
+                builder.add(reading, 1.0)
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            build_lexicon(['山田'], [1.0])
+        with pytest.raises(ValueError):
+            build_lexicon(['ヤマダ'], [float('inf')])
+
+    def test_long_strings(self):
+        readings = ['ア' * 5000 + 'イ', 'ア' * 5000 + 'ウ']
+        acceptor = build_lexicon(readings, [1.0, 1.0])
+        assert entries_of(acceptor) == sorted((r, 1.0) for r in readings)
+        assert len(acceptor.finals) == 5002
+
+    def test_shipped_lexicon(self, tmp_path):
+        entries = sorted(romaji_index.lexicon_entries(transducer.LEXICAL_FREQUENCY_FST_FILE))
+        acceptor = build_lexicon(*zip(*entries))
+        assert entries_of(acceptor) == entries
+        write_text(acceptor, str(tmp_path / 'lexicon.txt'))
+        acceptor.save(str(tmp_path / 'lexicon.bin'))
+        for name in ['lexicon.txt', 'lexicon.bin']:
+            assert sorted(romaji_index.lexicon_entries(str(tmp_path / name))) == entries
+
+    def test_binary_acceptor_composes(self, tmp_path):
+        entries = {'ヤマダ': 3.0, 'ヤマナカ': 2.0, 'タナカ': 2.0}
+        build_lexicon(list(entries), list(entries.values())).save(str(tmp_path / 'lexicon.bin'))
+        arrays = transducer.ArrayTransducer.from_fst(transducer.build_transducer(str(tmp_path / 'lexicon.bin')))
+        assert dict(transducer._deintern_results(arrays.iter_valid_strings('yamada'))) == {'ヤマダ': 3.0}
+
+    def test_shards(self):
+        entries = [('タナカ', 5.0), ('ヤマダ', 2.0), ('ヤマナカ', 5.0), ('ワダ', 2.0)]
+        shards = build_shards(*zip(*reversed(entries)))
+        assert sorted(shards) == ['タ', 'ヤ', 'ワ']
+        assert sorted(e for shard in shards.values() for e in entries_of(shard)) == entries
+        with pytest.raises(ValueError):
+            build_shards([''], [1.0])
@@ -0,0 +1,69 @@
+import myouji_kenchi
+import pytest
+
+from myouji_kenchi.limits import LimitCounter, LimitExceeded, LookupLimits
+
+
+class TestLookupLimits():
+    def test_length(self):
+        limits = LookupLimits(max_length=4)
+        limits.start(4)
+        with pytest.raises(LimitExceeded) as e:
+            limits.start(5)
+        assert e.value.limit == 'length'
+
+    def test_states(self):
+        guard = LookupLimits(max_states=10).start(1)
+        guard.check_states(10)
+        with pytest.raises(LimitExceeded) as e:
+            guard.check_states(11)
+        assert e.value.limit == 'states'
+
+    def test_paths(self):
+        guard = LookupLimits(max_paths=3).start(1)
+        assert list(guard.count_paths(range(3))) == [0, 1, 2]
+        with pytest.raises(LimitExceeded) as e:
+            list(guard.count_paths(range(4)))
+        assert e.value.limit == 'paths'
+
+    def test_deadline(self):
+        guard = LookupLimits(deadline=0).start(1)
+        with pytest.raises(LimitExceeded) as e:
+            guard.check_deadline()
+        assert e.value.limit == 'deadline'
+        LookupLimits(deadline=60).start(1).check_deadline()
+
+    def test_unlimited(self):
+        guard = LookupLimits().start(1000)
+        guard.check_states(10 ** 9)
+        assert len(list(guard.count_paths(range(10000)))) == 10000
+
+
+class TestLimitCounter():
+    def test_stats(self):
+        counter = LimitCounter()
+        for limit in ['paths', 'deadline', 'paths']:
+            counter.record(limit)
+        stats = counter.stats()
+        assert (stats.tripped, stats.tripped_by_limit) == (3, {'paths': 2, 'deadline': 1})
+
+
+class TestLimitedIteration():
+    def test_length(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(prefilter=False, limits=LookupLimits(max_length=30))
+        romaji = 'yamada' * 7
+        assert nbt.back_transliterate(romaji) == []
+        assert list(nbt.iter_back_transliterate(romaji)) == []
+        assert nbt.limit_stats().tripped_by_limit == {'length': 2}
+
+    def test_paths(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(engine='array', limits=LookupLimits(max_paths=3))
+        # The iteration stops where the limit is tripped
+        limited = list(nbt.iter_back_transliterate('Ono'))
+        assert set(limited) < set(myouji_kenchi.MyoujiBackTransliteration().back_transliterate('Ono'))
+        assert nbt.limit_stats().tripped_by_limit == {'paths': 1}
+
+    def test_deadline(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(limits=LookupLimits(deadline=0))
+        assert list(nbt.iter_back_transliterate('Ono')) == []
+        assert nbt.limit_stats().tripped_by_limit == {'deadline': 1}
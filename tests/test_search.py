@@ -0,0 +1,29 @@
+import pytest
+
+from myouji_kenchi.search import best_emissions, max_reachable_weights
+
+
+INFINITY = float('inf')
+
+
+class TestSearch():
+    def test_max_reachable_weights(self):
+        # 0 -> 1 -> 2, 0 -> 3; 2 and 3 final
+        arcs = {0: [1, 3], 1: [2], 2: [], 3: []}
+        finals = [INFINITY, INFINITY, 5.0, 2.0]
+        assert max_reachable_weights(4, arcs.get, finals.__getitem__) == [5.0, 5.0, 5.0, 2.0]
+
+    def test_unreachable_final(self):
+        arcs = {0: [1], 1: []}
+        assert max_reachable_weights(2, arcs.get, lambda s: INFINITY) == [-INFINITY, -INFINITY]
+
+    def test_cycle(self):
+        arcs = {0: [1], 1: [0]}
+        with pytest.raises(ValueError):
+            max_reachable_weights(2, arcs.get, lambda s: 1.0)
+
+    def test_best_emissions_keeps_ties(self):
+        emissions = [((1,), 3.0), ((2,), 2.0), ((3,), 2.0), ((4,), 1.0)]
+        assert best_emissions(emissions, k=2) == emissions[:3]
+        assert best_emissions(emissions, min_score=2.0) == emissions[:3]
+        assert best_emissions(emissions, k=1, min_score=2.0) == emissions[:1]
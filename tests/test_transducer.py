@@ -1,10 +1,38 @@
+import json
+import multiprocessing
 import myouji_kenchi
+import numpy as np
+import pytest
+import pywrapfst as fst
+import random
+import threading
+
+from concurrent import futures
+
+from myouji_kenchi import romaji_index
+from myouji_kenchi import transducer
+from myouji_kenchi.cache import PersistentCache
+from myouji_kenchi.instrumentation import TraceAggregator
+from myouji_kenchi.lexicon_shards import ShardedLexicon, initial_routes, write_shards
 
 
 # Given that the output depends on what goes into the attested myouji file I'm
 # hesitant to write too many tests in the blast radius of changes to that file
 
 
+SYLLABLES = ['a', 'i', 'u', 'e', 'o', 'ka', 'ki', 'ku', 'ke', 'ko', 'sa', 'shi', 'si', 'su', 'se', 'so',
+             'ta', 'chi', 'ti', 'tsu', 'tu', 'te', 'to', 'na', 'ni', 'nu', 'ne', 'no', 'ha', 'hi', 'fu',
+             'he', 'ho', 'ma', 'mi', 'mu', 'me', 'mo', 'ya', 'yu', 'yo', 'ra', 'ri', 'ru', 're', 'ro',
+             'wa', 'wo', 'n', 'n\'', 'ga', 'gi', 'gu', 'ge', 'go', 'za', 'ji', 'zi', 'zu', 'ze', 'zo',
+             'da', 'de', 'do', 'ba', 'bi', 'bu', 'be', 'bo', 'pa', 'pi', 'pu', 'pe', 'po', 'kyo', 'sho',
+             'ryu', 'chou', 'tt', 'kk', 'ss', 'ou', 'ō', 'oh', 'm']
+
+
+def synthetic_corpus(seed, size):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 5))) for _ in range(size)]
+
+
 class TestTransducer():
     nbt = myouji_kenchi.MyoujiBackTransliteration()
 
@@ -68,3 +96,607 @@ class TestTransducer():
 
     def test_bad_characters(self):
         self.assert_transliteration('@')
+
+    def test_pruned_search(self):
+        for romaji in synthetic_corpus(seed=3, size=1000) + ['SATO', 'Kojima', 'ho', 'Ohnishi', '@']:
+            results = self.nbt.back_transliterate(romaji)
+            for k in [0, 1, 2, 5]:
+                assert self.nbt.back_transliterate(romaji, k=k) == (results[-k:] if k else [])
+            for min_score in [1, 2, 1000]:
+                expected = [r for r in results if r[1] >= min_score]
+                assert self.nbt.back_transliterate(romaji, min_score=min_score) == expected
+                assert self.nbt.back_transliterate(romaji, k=1, min_score=min_score) == expected[-1:]
+            assert self.nbt.best_score(romaji) == max((r[1] for r in results), default=0)
+
+    def test_no_duplicate_readings(self):
+        self.assert_transliteration('tou', 'トウ', 'トウウ')
+        for romaji in synthetic_corpus(seed=4, size=2000) + ['tou', 'shii', 'nii']:
+            readings = [r[0] for r in self.nbt.back_transliterate(romaji)]
+            assert len(readings) == len(set(readings))
+
+    def test_iter_back_transliterate(self):
+        for romaji in ['SATO', 'Kojima', 'Inuzuka', 'tou', '@', 'Duckscallion']:
+            results = self.nbt.back_transliterate(romaji)
+            assert sorted(self.nbt.iter_back_transliterate(romaji)) == sorted(results)
+
+    def test_many(self):
+        romajis = ['Sato', 'SATO', 'Ｓａｔｏ', 'Kojima', '@', 'Sato']
+        results = self.nbt.back_transliterate_many(romajis)
+        assert results == [self.nbt.back_transliterate(r) for r in romajis]
+
+
+class TestEnumeration():
+    def test_cyclic_transducer(self):
+        # 0 -a:a-> 1 -b:b-> 0, with 1 final: enumeration must stop rather than loop
+        td = fst.Fst()
+        states = [td.add_state(), td.add_state()]
+        td.set_start(states[0])
+        td.set_final(states[1], 3)
+        td.add_arc(states[0], fst.Arc(1, 1, fst.Weight.One(td.weight_type()), states[1]))
+        td.add_arc(states[1], fst.Arc(2, 2, fst.Weight.One(td.weight_type()), states[0]))
+        assert transducer._all_valid_strings(td) == [((1,), 3.0)]
+
+    def test_keeps_best_weight(self):
+        td = fst.Fst()
+        states = [td.add_state() for _ in range(3)]
+        td.set_start(states[0])
+        td.set_final(states[1], 1)
+        td.set_final(states[2], 2)
+        for state in states[1:]:
+            td.add_arc(states[0], fst.Arc(1, 1, fst.Weight.One(td.weight_type()), state))
+        assert transducer._all_valid_strings(td) == [((1,), 2.0)]
+
+
+class TestArrayEngine(TestTransducer):
+    nbt = myouji_kenchi.MyoujiBackTransliteration(engine='array')
+
+    def test_equivalent_to_fst_engine(self):
+        corpus = synthetic_corpus(seed=1, size=5000)
+        fst_engine = myouji_kenchi.MyoujiBackTransliteration()
+        for romaji in corpus:
+            assert self.nbt.back_transliterate(romaji) == fst_engine.back_transliterate(romaji)
+
+    def test_unknown_engine(self):
+        with pytest.raises(ValueError):
+            myouji_kenchi.MyoujiBackTransliteration(engine='nope')
+
+    def test_best_k_pruned(self):
+        arrays = self.nbt._arrays
+        for romaji in synthetic_corpus(seed=8, size=1000):
+            normalized = transducer.normalize(romaji)
+            try:
+                everything = list(arrays.iter_valid_strings(normalized))
+            except ValueError:
+                continue
+            for k in (1, 3):
+                expected = transducer.best_emissions(everything, k)
+                assert sorted(arrays.best_valid_strings(normalized, k)) == sorted(expected)
+
+    def test_best_k_keeps_ties(self):
+        # Three readings of one input, weighted 2, 2 and 1: the best one is tied
+        td = fst.Fst()
+        states = [td.add_state() for _ in range(4)]
+        td.set_start(states[0])
+        for olabel, (state, weight) in enumerate(zip(states[1:], (1, 2, 2)), start=1):
+            td.set_final(state, weight)
+            td.add_arc(states[0], fst.Arc(1, olabel, fst.Weight.One(td.weight_type()), state))
+        arrays = transducer.ArrayTransducer.from_fst(td)
+        string = transducer.REVERSE_SYMBOL_TABLE[1]
+        assert sorted(arrays.best_valid_strings(string, 1)) == [((2,), 2.0), ((3,), 2.0)]
+
+
+class TestLatticeSearch(TestTransducer):
+    @pytest.fixture(autouse=True)
+    def always_search(self, monkeypatch):
+        monkeypatch.setattr(transducer, 'SMALL_LATTICE_STATES', 0)
+
+    @pytest.mark.parametrize('romaji', ['syouchi', 'douchi'])
+    def test_best_reading_on_several_paths(self, romaji):
+        # The best reading of each is emitted by more than one path
+        everything = self.nbt.back_transliterate(romaji)
+        assert self.nbt.back_transliterate(romaji, k=2) == everything[-2:]
+
+
+class TestInputFilter():
+    def test_no_false_negatives(self):
+        unfiltered = myouji_kenchi.MyoujiBackTransliteration(engine='array', prefilter=False)
+        input_filter = myouji_kenchi.MyoujiBackTransliteration(engine='array')._filter
+        for romaji in synthetic_corpus(seed=6, size=5000) + sample_accepted_inputs(unfiltered._arrays, 5000):
+            if unfiltered.back_transliterate(romaji):
+                assert input_filter.check(transducer.normalize(romaji)) is None
+
+    def test_rejects_foreign(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration()
+        for romaji in ['Duckscallion', 'Legokichi', 'Smith', 'Brown', 'Thomas', '']:
+            assert nbt.back_transliterate(romaji) == []
+        assert nbt.back_transliterate('Yamada') != []
+        stats = nbt.filter_stats()
+        assert (stats.checked, stats.rejected) == (7, 6)
+        assert sum(stats.rejected_by_reason.values()) == 6
+
+    def test_disabled(self):
+        assert myouji_kenchi.MyoujiBackTransliteration(prefilter=False).filter_stats() is None
+
+
+def sample_accepted_inputs(arrays, size, seed=0):
+    # Random walks to final states through the array transducer, reading off the input side
+    rng = random.Random(seed)
+    samples = []
+    while len(samples) < size:
+        state, labels = arrays.start, []
+        while True:
+            is_final = arrays.finals[state] != float('inf')
+            arcs = range(arrays.offsets[state], arrays.offsets[state + 1])
+            if is_final and (not arcs or rng.random() < 0.3):
+                break
+            if not arcs:
+                break
+            arc = rng.choice(arcs)
+            if arrays.ilabels[arc]:
+                labels.append(transducer.REVERSE_SYMBOL_TABLE[int(arrays.ilabels[arc])])
+            state = int(arrays.nextstates[arc])
+        if is_final:
+            samples.append(''.join(labels))
+    return samples
+
+
+class TestIndexedTransducer(TestTransducer):
+    nbt = myouji_kenchi.MyoujiBackTransliteration(index_size=1000)
+
+
+class TestTracedTransducer(TestTransducer):
+    nbt = myouji_kenchi.MyoujiBackTransliteration(on_lookup=TraceAggregator())
+
+
+class TestTracedArrayEngine(TestTransducer):
+    nbt = myouji_kenchi.MyoujiBackTransliteration(engine='array', on_lookup=TraceAggregator())
+
+
+class TestInstrumentation():
+    def test_equivalent_to_untraced(self):
+        for engine in transducer.ENGINES:
+            traced = myouji_kenchi.MyoujiBackTransliteration(engine=engine, cache_size=100, on_lookup=lambda t: None)
+            untraced = myouji_kenchi.MyoujiBackTransliteration(engine=engine)
+            for romaji in synthetic_corpus(seed=8, size=500):
+                for k, min_score in [(None, None), (1, None), (None, 1000)]:
+                    assert (traced.back_transliterate(romaji, k=k, min_score=min_score) ==
+                            untraced.back_transliterate(romaji, k=k, min_score=min_score))
+
+    def test_stages(self):
+        traces = []
+        nbt = myouji_kenchi.MyoujiBackTransliteration(cache_size=10, on_lookup=traces.append)
+        nbt.back_transliterate('Smith')
+        nbt.back_transliterate('Sato')
+        nbt.back_transliterate('SATO', k=1)
+        nbt.back_transliterate('sato')
+        rejected, lookup, pruned, cached = traces
+        assert rejected.outcome == 'rejected' and list(rejected.stages) == ['normalize', 'prefilter']
+        assert lookup.outcome == 'lookup'
+        assert list(lookup.stages) == ['normalize', 'prefilter', 'cache', 'input_fst', 'compose', 'count',
+                                       'search', 'deintern_sort']
+        assert (lookup.input_length, lookup.candidates, lookup.returned) == (4, 3, 3)
+        assert lookup.lattice_states > 0 and lookup.lattice_arcs > 0
+        assert (pruned.k, pruned.returned) == (1, 1)
+        assert cached.outcome == 'cache' and cached.returned == 3
+        assert all(t.total >= sum(t.stages.values()) * 0.999 for t in traces)
+
+    def test_array_engine_stages(self):
+        traces = []
+        nbt = myouji_kenchi.MyoujiBackTransliteration(engine='array', on_lookup=traces.append)
+        nbt.back_transliterate_many(['Sato', 'Sato'])
+        assert len(traces) == 2
+        assert list(traces[0].stages) == ['normalize', 'prefilter', 'walk', 'search', 'deintern_sort']
+        assert traces[0].paths >= 3 and traces[0].lattice_states is None
+
+
+class TestLimitedTransducer(TestTransducer):
+    # Generous enough that no real name goes over
+    nbt = myouji_kenchi.MyoujiBackTransliteration(limits=myouji_kenchi.LookupLimits(max_length=40,
+                                                                                    max_states=10000,
+                                                                                    max_paths=10000,
+                                                                                    deadline=60))
+
+
+class TestLimits():
+    @pytest.mark.parametrize('engine', transducer.ENGINES)
+    @pytest.mark.parametrize('limits, romaji, limit', [
+        (myouji_kenchi.LookupLimits(max_length=3), 'Sato', 'length'),
+        (myouji_kenchi.LookupLimits(max_states=2), 'Ono', 'states'),
+        (myouji_kenchi.LookupLimits(max_paths=3), 'Ono', 'paths'),
+        (myouji_kenchi.LookupLimits(deadline=0), 'Ono', 'deadline'),
+    ])
+    def test_degraded(self, engine, limits, romaji, limit):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(engine=engine, limits=limits, cache_size=10)
+        # Searching best first, the array engine finds the best reading on the first complete path
+        best_found = limit == 'paths' and engine == 'array'
+        assert nbt.back_transliterate(romaji) == []
+        assert (nbt.best_score(romaji) > 0) if best_found else (nbt.best_score(romaji) == 0)
+        assert nbt.back_transliterate_many([romaji]) == [[]]
+        assert nbt.limit_stats().tripped_by_limit == {limit: 2 if best_found else 3}
+        # Degraded results are not cached
+        assert nbt.cache_stats().size == (1 if best_found else 0)
+
+    def test_traced(self):
+        traces = []
+        nbt = myouji_kenchi.MyoujiBackTransliteration(limits=myouji_kenchi.LookupLimits(max_paths=3),
+                                                      on_lookup=traces.append)
+        assert nbt.back_transliterate('Ono') == []
+        assert nbt.back_transliterate('Sato') != []
+        assert [t.outcome for t in traces] == ['limited', 'lookup']
+        assert nbt.limit_stats().tripped_by_limit == {'paths': 1}
+
+    def test_unlimited(self):
+        assert myouji_kenchi.MyoujiBackTransliteration().limit_stats() is None
+
+
+class TestOverlaidTransducer(TestTransducer):
+    # Overriding a reading with its own score changes nothing
+    nbt = myouji_kenchi.MyoujiBackTransliteration(extra_lexicon={'ヤマダ': 201046.0})
+
+
+class TestLexiconOverlay():
+    @pytest.mark.parametrize('engine', transducer.ENGINES)
+    def test_new_surname(self, engine):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(engine=engine, cache_size=10)
+        assert nbt.back_transliterate('Duckscallion') == []
+        assert nbt.back_transliterate('Kyabetsu') == []
+        nbt.add_surnames({'キャベツ': 50.0})
+        assert nbt.back_transliterate('Kyabetsu') == [('キャベツ', 50.0)]
+        assert nbt.back_transliterate('KYABETU') == [('キャベツ', 50.0)]
+        assert nbt.best_score('kyabetsu') == 50.0
+        assert list(nbt.iter_back_transliterate('Kyabetsu')) == [('キャベツ', 50.0)]
+
+    def test_override_score(self):
+        base = myouji_kenchi.MyoujiBackTransliteration()
+        nbt = myouji_kenchi.MyoujiBackTransliteration(extra_lexicon={'サト': 1e7, 'サトウ': 1.0})
+        expected = sorted({**dict(base.back_transliterate('Sato')), 'サト': 1e7, 'サトウ': 1.0}.items(),
+                          key=lambda x: (x[1], x[0]))
+        assert nbt.back_transliterate('Sato') == expected
+        assert nbt.back_transliterate('Sato', k=1) == [('サト', 1e7)]
+        assert nbt.back_transliterate('Sato', min_score=2.0) == [r for r in expected if r[1] >= 2.0]
+        assert nbt.back_transliterate('Yamada') == base.back_transliterate('Yamada')
+
+    def test_updates_index_and_cache(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(index_size=100, cache_size=10)
+        assert nbt.best_score('Sato') > 1000 and nbt.best_score('Satou') > 1000
+        nbt.best_score('Tanaka')
+        nbt.best_score('Hanamura')
+        assert nbt.cache_stats().size == 1
+        nbt.add_surnames({'サトウ': 2.0, 'サト': 1.0, 'サトオ': 1.0})
+        assert nbt.cache_stats().size == 0
+        assert nbt.best_score('Sato') == nbt.best_score('Satou') == 2.0
+        assert nbt.best_score('Tanaka') > 1000
+
+    def test_invalid(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration()
+        for entries in [{'Yamada': 1.0}, {'': 1.0}, {'ヤマダ': 0}, {'ヤマダ': float('inf')}]:
+            with pytest.raises(ValueError):
+                nbt.add_surnames(entries)
+
+
+class TestShardedTransducer(TestTransducer):
+    nbt = myouji_kenchi.MyoujiBackTransliteration(lexicon_shards='lazy')
+
+
+class TestShardedArrayEngine(TestTransducer):
+    nbt = myouji_kenchi.MyoujiBackTransliteration(engine='array', lexicon_shards='lazy')
+
+
+class TestLexiconShards():
+    @pytest.mark.parametrize('engine', transducer.ENGINES)
+    def test_equivalent_to_whole(self, engine):
+        whole = myouji_kenchi.MyoujiBackTransliteration(engine=engine, prefilter=False)
+        sharded = myouji_kenchi.MyoujiBackTransliteration(engine=engine, prefilter=False, lexicon_shards='lazy')
+        for romaji in synthetic_corpus(seed=2, size=300) + ['Smith', 'nnaka', 'x', '']:
+            assert sharded.back_transliterate(romaji) == whole.back_transliterate(romaji)
+            assert sharded.back_transliterate(romaji, k=2) == whole.back_transliterate(romaji, k=2)
+            assert sharded.back_transliterate(romaji, min_score=100) == whole.back_transliterate(romaji, min_score=100)
+
+    def test_lazy(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(lexicon_shards='lazy')
+        assert nbt.shard_stats().loaded == 0
+        nbt.back_transliterate('Yamada')
+        # ヤ, ユ and ヨ
+        stats = nbt.shard_stats()
+        assert (stats.loaded, stats.loads, stats.hits) == (3, 3, 0)
+        assert stats.shards > 60
+        nbt.back_transliterate('Yoshida')
+        assert nbt.shard_stats().hits == 3
+        assert myouji_kenchi.MyoujiBackTransliteration().shard_stats() is None
+
+    def test_eviction(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(lexicon_shards='lazy', max_shards=3)
+        whole = myouji_kenchi.MyoujiBackTransliteration()
+        for romaji in ['Yamada', 'Sato', 'Yamada']:
+            assert nbt.back_transliterate(romaji) == whole.back_transliterate(romaji)
+        stats = nbt.shard_stats()
+        assert stats.loaded == 3
+        assert stats.evictions == stats.loads - 3 > 0
+
+    def test_all(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(engine='array', lexicon_shards='all', max_shards=1)
+        stats = nbt.shard_stats()
+        assert stats.loaded == stats.loads == stats.shards
+        nbt.back_transliterate('Tanaka')
+        assert nbt.shard_stats().loads == stats.shards
+
+    def test_from_text(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(precompiled=False, lexicon_shards='lazy')
+        assert nbt.back_transliterate('SATO') == myouji_kenchi.MyoujiBackTransliteration().back_transliterate('SATO')
+
+    def test_overlay_and_spans(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(lexicon_shards='lazy', extra_lexicon={'キャベツ': 50.0})
+        assert nbt.back_transliterate('Kyabetsu') == [('キャベツ', 50.0)]
+        assert nbt.span_scores(['Kyabetsu', 'Yamada'], [(0, 1), (1, 2)])[(0, 1)] == 50.0
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            myouji_kenchi.MyoujiBackTransliteration(lexicon_shards='some')
+        with pytest.raises(ValueError):
+            myouji_kenchi.MyoujiBackTransliteration(lexicon_shards='lazy', index_size=10)
+        with pytest.raises(ValueError):
+            myouji_kenchi.MyoujiBackTransliteration(lexicon_shards='lazy', max_shards=0)
+
+    def test_composing_blocks_only_its_piece(self):
+        composing = threading.Event()
+        release = threading.Event()
+
+        def compose(acceptor):
+            if acceptor == 'slow':
+                composing.set()
+                release.wait(10)
+            return acceptor.upper()
+
+        sharded = ShardedLexicon({'ア': lambda: 'slow', 'イ': lambda: 'fast'}, {}, compose)
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            slow = [executor.submit(sharded.piece, 'ア') for _ in range(2)]
+            assert composing.wait(10)
+            # Composed while ア is still being composed
+            assert sharded.piece('イ') == 'FAST'
+            release.set()
+            assert [f.result() for f in slow] == ['SLOW', 'SLOW']
+        stats = sharded.stats()
+        assert (stats.loads, stats.hits) == (2, 1)
+
+    def test_routes(self):
+        routes = initial_routes(transducer._build_transliterator())
+        assert routes['a'] == {'ア'}
+        assert {'カ', 'キ', 'ク', 'ケ', 'コ'} <= routes['k']
+        assert routes['na'] == {'ナ'}
+
+    def test_stale_shards_rejected(self, tmp_path):
+        shards = transducer.build_shards(['ヤマダ'], [1.0])
+        write_shards(shards, str(tmp_path), {'format_version': 0, 'lexicon_sha256': '0' * 64})
+        with pytest.warns(UserWarning):
+            sources = transducer._load_lexicon_shard_sources(directory=str(tmp_path))
+        assert len(sources) > 60
+
+    def test_missing_shards(self, tmp_path):
+        sources = transducer._load_lexicon_shard_sources(directory=str(tmp_path / 'missing'))
+        assert len(sources) > 60
+
+    def test_written_shards(self, tmp_path):
+        transducer.write_lexicon_shards(str(tmp_path))
+        sources = transducer._load_lexicon_shard_sources(directory=str(tmp_path))
+        assert sorted(sources) == sorted(transducer._load_lexicon_shard_sources())
+        assert dict(romaji_index._array_lexicon_entries(sources['ヤ']()))['ヤマダ'] == 201046.0
+
+
+class TestRomajiIndex():
+    def test_equivalent_to_lookup(self):
+        indexed = myouji_kenchi.MyoujiBackTransliteration(engine='array', index_size=1000)
+        unindexed = myouji_kenchi.MyoujiBackTransliteration(engine='array')
+        for romaji in synthetic_corpus(seed=7, size=2000) + sample_accepted_inputs(unindexed._arrays, 2000, seed=7):
+            for k, min_score in [(None, None), (1, None), (3, None), (None, 1000), (2, 1000)]:
+                assert (indexed.back_transliterate(romaji, k=k, min_score=min_score) ==
+                        unindexed.back_transliterate(romaji, k=k, min_score=min_score))
+
+    def test_covers_frequent_surnames(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(index_size=100)
+        for romaji in ['Sato', 'Satou', 'Satoh', 'Satō', 'SATOO']:
+            assert nbt.back_transliterate(romaji)
+        nbt.back_transliterate('Inudzuka')
+        stats = nbt.index_stats()
+        assert (stats.readings, stats.hits, stats.misses) == (100, 5, 1)
+        assert stats.size >= 100
+
+    def test_disabled(self):
+        assert myouji_kenchi.MyoujiBackTransliteration().index_stats() is None
+
+
+class TestSpanScores():
+    @pytest.mark.parametrize('engine', transducer.ENGINES)
+    def test_equivalent_to_best_score(self, engine):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(engine=engine)
+        for name in ['yamadataro', 'Ōnoyōko', 'smithjohn', 'Satō@taro']:
+            spans = [(i, j) for i in range(len(name)) for j in range(i + 1, len(name) + 1)]
+            scores = nbt.span_scores(list(name), spans)
+            assert scores == {(i, j): nbt.best_score(name[i:j]) for i, j in spans}
+
+    def test_parts(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration()
+        scores = nbt.span_scores(['Taro', 'Ken', 'Yamada'], [(0, 1), (2, 3), (1, 3)])
+        assert scores == {(0, 1): nbt.best_score('Taro'), (2, 3): nbt.best_score('Yamada'), (1, 3): 0}
+
+    def test_overlay(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(extra_lexicon={'ヒメカワ': 150.0, 'ヤマダ': 2.0})
+        assert nbt.span_scores(['Himekawa', 'Yamada'], [(0, 1), (1, 2)]) == {(0, 1): 150.0, (1, 2): 2.0}
+
+
+class TestCache():
+    def test_cached_results(self):
+        uncached = myouji_kenchi.MyoujiBackTransliteration()
+        cached = myouji_kenchi.MyoujiBackTransliteration(cache_size=2)
+        assert cached.cache_stats().size == 0
+        for romaji in ['Sato', 'SATO', 'Kojima', 'Inuzuka', 'Sato', 'Yamada']:
+            assert cached.back_transliterate(romaji) == uncached.back_transliterate(romaji)
+        stats = cached.cache_stats()
+        assert (stats.hits, stats.misses, stats.evictions, stats.size) == (1, 5, 3, 2)
+
+    def test_iteration_cached_once_finished(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(cache_size=10)
+        iterator = nbt.iter_back_transliterate('Sato')
+        next(iterator)
+        assert nbt.cache_stats().size == 0
+        assert sorted(iterator) != []
+        assert nbt.cache_stats().size == 1
+        assert sorted(nbt.iter_back_transliterate('Sato')) == sorted(nbt.back_transliterate('Sato'))
+        assert nbt.back_transliterate('Sato') == myouji_kenchi.MyoujiBackTransliteration().back_transliterate('Sato')
+        stats = nbt.cache_stats()
+        assert (stats.hits, stats.misses) == (3, 1)
+
+    def test_disabled(self):
+        assert myouji_kenchi.MyoujiBackTransliteration().cache_stats() is None
+
+
+class TestPersistentCache():
+    def test_shared_across_instances(self, tmp_path):
+        path = str(tmp_path / 'cache.sqlite')
+        uncached = myouji_kenchi.MyoujiBackTransliteration()
+        first = myouji_kenchi.MyoujiBackTransliteration(cache_path=path)
+        for romaji in ['Sato', 'Kojima', 'Sato']:
+            assert first.back_transliterate(romaji) == uncached.back_transliterate(romaji)
+        second = myouji_kenchi.MyoujiBackTransliteration(cache_path=path)
+        assert second.back_transliterate('Kojima') == uncached.back_transliterate('Kojima')
+        stats = second.cache_stats()
+        assert (stats.hits, stats.misses, stats.size, stats.maxsize) == (1, 0, 2, transducer.PERSISTENT_CACHE_SIZE)
+
+    def test_batch(self, tmp_path):
+        path = str(tmp_path / 'cache.sqlite')
+        names = ['Sato', 'Kojima', 'Inuzuka', 'SATO']
+        expected = myouji_kenchi.MyoujiBackTransliteration().back_transliterate_many(names)
+        cached = myouji_kenchi.MyoujiBackTransliteration(cache_path=path)
+        cached.back_transliterate('Kojima')
+        assert cached.back_transliterate_many(names) == expected
+        assert cached.back_transliterate_many(names) == expected
+        stats = cached.cache_stats()
+        assert (stats.hits, stats.misses, stats.size) == (4, 3, 3)
+
+    def test_batch_prefetches_misses(self, tmp_path):
+        cache = PersistentCache(str(tmp_path / 'cache.sqlite'), maxsize=10)
+        cache.put('held', 1)
+        queries = []
+        cache._connection().set_trace_callback(queries.append)
+        with cache.batch(['held', 'missing']):
+            assert cache.get('held') == 1
+            assert cache.get('missing') is None
+            cache.put('missing', 2)
+        assert len([q for q in queries if q.startswith('SELECT')]) == 1
+        stats = cache.stats()
+        assert (stats.hits, stats.misses) == (1, 1)
+
+    def test_eviction(self, tmp_path):
+        cache = PersistentCache(str(tmp_path / 'cache.sqlite'), maxsize=2)
+        for i in range(4):
+            cache.put(('key', i), (('value', float(i)),))
+        assert cache.get(('key', 0)) is None
+        assert cache.get(('key', 3)) == (('value', 3.0),)
+        stats = cache.stats()
+        assert (stats.evictions, stats.size) == (2, 2)
+
+    def test_namespace_tied_to_rules(self, monkeypatch):
+        namespace = transducer._cache_namespace({})
+        monkeypatch.setattr(transducer, '_transliterator_digest', lambda: '0' * 64)
+        assert transducer._cache_namespace({}) != namespace
+
+    def test_namespaces(self, tmp_path):
+        path = str(tmp_path / 'cache.sqlite')
+        PersistentCache(path, maxsize=10, namespace='a').put('key', 1)
+        assert PersistentCache(path, maxsize=10, namespace='b').get('key') is None
+        assert PersistentCache(path, maxsize=10, namespace='a').get('key') == 1
+
+    def test_overlay_namespace(self, tmp_path):
+        path = str(tmp_path / 'cache.sqlite')
+        base = myouji_kenchi.MyoujiBackTransliteration(cache_path=path)
+        base.back_transliterate('Yamada')
+        overlaid = myouji_kenchi.MyoujiBackTransliteration(cache_path=path, extra_lexicon={'ヤマダ': 3.0})
+        assert overlaid.back_transliterate('Yamada') == [('ヤマダ', 3.0)]
+        base.add_surnames({'ヤマダ': 3.0})
+        assert base.back_transliterate('Yamada') == [('ヤマダ', 3.0)]
+        assert base.cache_stats().hits == 1
+
+    def test_processes(self, tmp_path):
+        path = str(tmp_path / 'cache.sqlite')
+        names = ['Sato', 'Kojima', 'Inuzuka', 'Yamada', 'Tanaka', 'Ito']
+        expected = myouji_kenchi.MyoujiBackTransliteration().back_transliterate_many(names)
+        context = multiprocessing.get_context('spawn')
+        with futures.ProcessPoolExecutor(max_workers=2, mp_context=context) as pool:
+            results = list(pool.map(back_transliterate_cached, [path] * 4, [names] * 4))
+        assert results == [expected] * 4
+        assert PersistentCache(path, maxsize=10).stats().size == len(names)
+
+
+def back_transliterate_cached(path, names):
+    return myouji_kenchi.MyoujiBackTransliteration(cache_path=path).back_transliterate_many(names)
+
+
+class TestCompiledTransducer():
+    def test_matches_text_lexicon(self):
+        compiled = myouji_kenchi.MyoujiBackTransliteration()
+        from_text = myouji_kenchi.MyoujiBackTransliteration(precompiled=False)
+        for romaji in ['Yamada', 'SATO', 'Kojima', 'Shin\'yagaito', 'Duckscallion']:
+            assert compiled.back_transliterate(romaji) == from_text.back_transliterate(romaji)
+
+    def test_stale_artifact_rejected(self, tmp_path):
+        manifest_path = tmp_path / 'composed_transducer.json'
+        manifest = transducer._compiled_transducer_manifest(transducer.LEXICAL_FREQUENCY_FST_FILE)
+        manifest['lexicon_sha256'] = '0' * 64
+        manifest_path.write_text(json.dumps(manifest))
+        with pytest.warns(UserWarning):
+            loaded = transducer._load_compiled_transducer(manifest_path=str(manifest_path))
+        assert loaded is None
+
+    def test_manifest_hashes_lexicon_once(self, tmp_path):
+        acceptor_path = tmp_path / 'lexicon.txt'
+        acceptor_path.write_text('0 1 ア ア\n1\n')
+        first = transducer._compiled_transducer_manifest(str(acceptor_path), check_transliterator=False)
+        hits = transducer._file_digest.cache_info().hits
+        assert transducer._compiled_transducer_manifest(str(acceptor_path), check_transliterator=False) == first
+        assert transducer._file_digest.cache_info().hits == hits + 1
+        # A changed lexicon is hashed again
+        acceptor_path.write_text('0 1 イ イ\n1\n2\n')
+        changed = transducer._compiled_transducer_manifest(str(acceptor_path), check_transliterator=False)
+        assert changed['lexicon_sha256'] != first['lexicon_sha256']
+
+    def test_missing_artifact(self, tmp_path):
+        loaded = transducer._load_compiled_transducer(path=str(tmp_path / 'missing.fst'),
+                                                      manifest_path=str(tmp_path / 'missing.json'))
+        assert loaded is None
+
+
+class TestArrayTransducerFile():
+    @pytest.mark.parametrize('mmap', [True, False])
+    def test_round_trip(self, tmp_path, mmap):
+        arrays = transducer.ArrayTransducer.load(transducer.COMPILED_ARRAY_TRANSDUCER_FILE, mmap=False)
+        path = str(tmp_path / 'arrays.bin')
+        arrays.save(path)
+        loaded = transducer.ArrayTransducer.load(path, mmap=mmap)
+        assert loaded.start == arrays.start
+        for name in ['offsets', 'ilabels', 'olabels', 'nextstates', 'finals', 'bounds']:
+            assert getattr(loaded, name).dtype == getattr(arrays, name).dtype
+            assert getattr(loaded, name).tolist() == getattr(arrays, name).tolist()
+        assert isinstance(loaded.offsets.base, np.memmap) == mmap
+        for romaji in ['Yamada', 'SATO', 'Kojima']:
+            assert list(loaded.iter_valid_strings(romaji)) == list(arrays.iter_valid_strings(romaji))
+
+    def test_shipped_artifact_is_mapped(self):
+        nbt = myouji_kenchi.MyoujiBackTransliteration(engine='array')
+        assert isinstance(nbt._arrays.offsets.base, np.memmap)
+        assert not nbt._arrays.offsets.flags.writeable
+
+    def test_not_an_array_file(self, tmp_path):
+        path = tmp_path / 'arrays.bin'
+        path.write_bytes(b'not an array transducer')
+        with pytest.raises(ValueError):
+            transducer.ArrayTransducer.load(str(path))
+        assert transducer._load_compiled_array_transducer(path=str(path)) is None
+
+
+class TestOptimizedTransducer():
+    def test_equivalent_to_unoptimized(self):
+        corpus = synthetic_corpus(seed=0, size=5000)
+        optimized = myouji_kenchi.MyoujiBackTransliteration()
+        unoptimized = myouji_kenchi.MyoujiBackTransliteration()
+        unoptimized._transducer = transducer.build_transducer(optimize=False)
+        for romaji in corpus:
+            assert optimized.back_transliterate(romaji) == unoptimized.back_transliterate(romaji)